@@ -2,9 +2,12 @@ from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.urls import reverse
+from django.db import transaction
 from collections import defaultdict
 from .models import Portfolio, Stock
 from .services.calculation import PortfolioCalculator
+from .services.ledger import PositionLedger
+from .services.summary_cache import SummaryCache
 
 
 @login_required
@@ -20,9 +23,11 @@ def delete_history_ticker(request, portfolio_id, ticker):
     total_sold = sum(sum(sale.quantity for sale in stock.sales.all()) for stock in stocks)
     
     if total_qty == total_sold:
-        for stock in stocks:
-            stock.sales.all().delete()
-            stock.delete()
+        with transaction.atomic():
+            for stock in stocks:
+                stock.sales.all().delete()
+                stock.delete()
+            PositionLedger.forget(portfolio, ticker)
         messages.success(request, f"History for {ticker} deleted.")
     else:
         messages.error(request, f"Cannot delete {ticker}: not all shares are sold.")
@@ -46,9 +51,11 @@ def clear_history(request, portfolio_id):
             total_sold = sum(sum(sale.quantity for sale in stock.sales.all()) for stock in stocks)
             
             if total_qty == total_sold:
-                for stock in stocks:
-                    stock.sales.all().delete()
-                    stock.delete()
+                with transaction.atomic():
+                    for stock in stocks:
+                        stock.sales.all().delete()
+                        stock.delete()
+                    PositionLedger.forget(portfolio, ticker)
                 deleted += 1
         
         if deleted:
@@ -68,7 +75,9 @@ def ticker_detail(request, portfolio_id, ticker):
     portfolio = get_object_or_404(Portfolio, id=portfolio_id, user=request.user)
     
     # Use service to calculate ticker detail summary
-    summary = PortfolioCalculator.calculate_ticker_detail_summary(portfolio, ticker)
+    summary = SummaryCache.get_or_compute(
+        portfolio.id, f'ticker_{ticker}', lambda: PortfolioCalculator.calculate_ticker_detail_summary(portfolio, ticker)
+    )
     
     if not summary:
         messages.error(request, f'No stocks found for ticker {ticker}')
@@ -0,0 +1,108 @@
+import random
+import time
+from collections import defaultdict
+from decimal import Decimal
+from django.core.management.base import BaseCommand, CommandError
+from apps.portfolios.services.calculation import PortfolioCalculator
+from apps.portfolios.services.vectorized import LotArrays, VectorizedCalculator
+
+
+class SyntheticLot:
+    """In-memory stand-in for a Stock with prefetched sales"""
+
+    def __init__(self, quantity, purchase_price, current_price):
+        self.quantity = quantity
+        self.purchase_price = purchase_price
+        self.current_price = current_price
+        self._sales = []
+        self.sales = self
+
+    def all(self):
+        return self._sales
+
+
+class SyntheticSale:
+    def __init__(self, quantity, sale_price):
+        self.quantity = quantity
+        self.sale_price = sale_price
+
+
+class Command(BaseCommand):
+    help = 'Compare Decimal and NumPy portfolio calculation on synthetic portfolios (no database access)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--lots',
+            type=int,
+            nargs='+',
+            default=[1000, 100000, 1000000],
+            help='Portfolio sizes in lots to benchmark',
+        )
+        parser.add_argument(
+            '--tickers',
+            type=int,
+            default=500,
+            help='Number of distinct tickers',
+        )
+        parser.add_argument(
+            '--seed',
+            type=int,
+            default=42,
+            help='Random seed for the synthetic portfolios',
+        )
+
+    def handle(self, *args, **options):
+        for size in options['lots']:
+            lot_rows, sale_rows = self.generate(size, options['tickers'], options['seed'])
+
+            # Decimal path on lot objects, as PortfolioCalculator sees prefetched lots
+            lots = {}
+            grouped = defaultdict(list)
+            for lot_id, ticker, quantity, purchase_price, current_price in lot_rows:
+                lots[lot_id] = SyntheticLot(quantity, purchase_price, current_price)
+                grouped[ticker].append(lots[lot_id])
+            for lot_id, quantity, sale_price in sale_rows:
+                lots[lot_id]._sales.append(SyntheticSale(quantity, sale_price))
+
+            started = time.perf_counter()
+            expected = {ticker: PortfolioCalculator.summarize_lots(purchases) for ticker, purchases in grouped.items()}
+            totals = PortfolioCalculator.calculate_portfolio_totals(None, lot_summaries=list(expected.values()))
+            decimal_elapsed = time.perf_counter() - started
+
+            started = time.perf_counter()
+            arrays = LotArrays.from_rows(lot_rows, sale_rows)
+            build_elapsed = time.perf_counter() - started
+            started = time.perf_counter()
+            result = VectorizedCalculator.summarize(arrays)
+            numpy_elapsed = time.perf_counter() - started
+
+            keys = ('total_qty', 'total_sold', 'invested', 'current', 'received', 'realized_profit')
+            if result['totals'] != totals or any(
+                result['tickers'][ticker][key] != lots_summary[key]
+                for ticker, lots_summary in expected.items() for key in keys
+            ):
+                raise CommandError(f'{size} lots: NumPy results differ from Decimal results')
+
+            self.stdout.write(
+                self.style.SUCCESS(
+                    f'{size:>9} lots, {len(sale_rows):>8} sales: Decimal {decimal_elapsed * 1000:9.1f} ms, '
+                    f'NumPy {numpy_elapsed * 1000:8.1f} ms (+{build_elapsed * 1000:.1f} ms to build arrays), '
+                    f'{decimal_elapsed / numpy_elapsed if numpy_elapsed else float("inf"):.1f}x'
+                )
+            )
+
+    def generate(self, size, tickers, seed):
+        """Random lots with two decimal place prices; about half of them partly or fully sold"""
+        rng = random.Random(seed + size)
+        symbols = [f'T{i:04d}' for i in range(tickers)]
+        lot_rows = []
+        sale_rows = []
+        for lot_id in range(size):
+            quantity = rng.randint(1, 500)
+            purchase_price = Decimal(rng.randint(100, 100000)).scaleb(-2)
+            current_price = Decimal(rng.randint(100, 100000)).scaleb(-2) if rng.random() < 0.9 else None
+            lot_rows.append((lot_id, rng.choice(symbols), quantity, purchase_price, current_price))
+            if rng.random() < 0.5:
+                sold = rng.randint(1, quantity)
+                sale_rows.append((lot_id, sold, Decimal(rng.randint(100, 100000)).scaleb(-2)))
+        return lot_rows, sale_rows
@@ -0,0 +1,73 @@
+from decimal import Decimal
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.contrib.auth import get_user_model
+from apps.portfolios.models import Portfolio, Stock
+from apps.portfolios.services.ledger import PositionLedger
+from apps.stocks.providers import SimulatorProvider
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = 'Create a large portfolio of simulated tickers for load testing (use with MARKET_DATA_BACKEND=simulator)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--user-email',
+            type=str,
+            required=True,
+            help='Email of the user to create portfolio for',
+        )
+        parser.add_argument(
+            '--portfolio-name',
+            type=str,
+            default='Simulated Portfolio',
+            help='Name for the new portfolio',
+        )
+        parser.add_argument(
+            '--tickers',
+            type=int,
+            default=500,
+            help='Number of simulated tickers to buy',
+        )
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(email=options['user_email'])
+        except User.DoesNotExist:
+            self.stdout.write(
+                self.style.ERROR(f'User with email {options["user_email"]} does not exist')
+            )
+            return
+        
+        portfolio, _ = Portfolio.objects.get_or_create(user=user, name=options['portfolio_name'])
+        
+        # Same seed as the simulator backend, so purchase prices are close to simulated prices
+        simulator_options = {option.lower(): value for option, value in settings.MARKET_DATA_SIMULATOR.items()}
+        simulator_options.update(tickers=options['tickers'], latency=0)
+        simulator = SimulatorProvider(**simulator_options)
+        symbols = simulator.symbols()
+        bars = simulator.get_daily_bars(symbols)
+        
+        existing = set(portfolio.stocks.values_list('ticker', flat=True))
+        stocks = [
+            Stock(
+                portfolio=portfolio,
+                ticker=symbol,
+                company_name=f'{symbol} Simulated Inc.',
+                quantity=10,
+                purchase_price=Decimal(str(round(bars[symbol][0]['close'], 2))),
+            )
+            for symbol in symbols
+            if symbol not in existing
+        ]
+        Stock.objects.bulk_create(stocks)
+        PositionLedger.rebuild(portfolio)
+        
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'Portfolio {portfolio.name}: added {len(stocks)} simulated tickers, '
+                f'{len(existing)} already present'
+            )
+        )
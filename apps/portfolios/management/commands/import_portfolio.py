@@ -3,7 +3,9 @@ from django.contrib.auth import get_user_model
 from decimal import Decimal
 from datetime import datetime
 from apps.portfolios.models import Portfolio, Stock
+from apps.portfolios.services.ledger import PositionLedger
 from apps.stocks.services import StockPriceService
+from apps.stocks.refresh import PriceRefresher
 
 User = get_user_model()
 
@@ -75,8 +77,7 @@ class Command(BaseCommand):
         updated_count = 0
         
         for ticker, quantity, purchase_price in portfolio_data:
-            # Get current price and company info
-            current_price = StockPriceService.get_stock_price(ticker)
+            # Get company info
             company_info = StockPriceService.get_company_overview(ticker)
             
             company_name = company_info.get('name', ticker) if company_info else ticker
@@ -89,7 +90,6 @@ class Command(BaseCommand):
                 defaults={
                     'company_name': company_name,
                     'quantity': quantity,
-                    'current_price': current_price,
                     'purchase_date': datetime.now(),
                 }
             )
@@ -105,7 +105,6 @@ class Command(BaseCommand):
                 # Update existing stock
                 stock.quantity = quantity
                 stock.purchase_price = purchase_price
-                stock.current_price = current_price
                 stock.company_name = company_name
                 stock.save()
                 
@@ -116,6 +115,9 @@ class Command(BaseCommand):
                 )
                 updated_count += 1
         
+        PositionLedger.rebuild(portfolio)
+        PriceRefresher.write(StockPriceService.get_stock_quotes(ticker for ticker, _, _ in portfolio_data))
+        
         # Calculate portfolio summary
         total_value = portfolio.current_value()
         total_purchase = portfolio.purchase_value()
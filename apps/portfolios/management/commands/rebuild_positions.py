@@ -0,0 +1,47 @@
+from django.core.management.base import BaseCommand, CommandError
+from apps.portfolios.models import Portfolio
+from apps.portfolios.services.ledger import PositionLedger
+
+
+class Command(BaseCommand):
+    help = 'Reconcile the position ledger against raw stock lots and sales'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--portfolio',
+            type=int,
+            help='Only reconcile the portfolio with this id',
+        )
+        parser.add_argument(
+            '--check',
+            action='store_true',
+            help='Only report mismatched positions and fail if there are any, without fixing them',
+        )
+
+    def handle(self, *args, **options):
+        portfolios = Portfolio.objects.order_by('id')
+        if options['portfolio']:
+            portfolios = portfolios.filter(id=options['portfolio'])
+
+        mismatched_total = 0
+        for portfolio in portfolios:
+            if options['check']:
+                mismatched = PositionLedger.verify(portfolio)
+            else:
+                mismatched = PositionLedger.rebuild(portfolio)
+            if mismatched:
+                mismatched_total += len(mismatched)
+                action = 'Mismatched' if options['check'] else 'Rebuilt'
+                self.stdout.write(
+                    self.style.WARNING(f'{portfolio.name} (#{portfolio.id}): {action} {", ".join(mismatched)}')
+                )
+
+        if options['check'] and mismatched_total:
+            raise CommandError(f'{mismatched_total} positions do not match their lots')
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'Position ledger reconciled: {mismatched_total} positions '
+                f'{"mismatched" if options["check"] else "rebuilt"}'
+            )
+        )
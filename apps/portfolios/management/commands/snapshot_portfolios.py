@@ -0,0 +1,61 @@
+import time
+from datetime import date
+from django.core.management.base import BaseCommand
+from apps.portfolios.models import Portfolio, Stock
+from apps.portfolios.services.snapshots import SnapshotBuilder
+from apps.stocks.history import HistoryBackfill
+
+
+class Command(BaseCommand):
+    help = 'Write daily value snapshots of portfolios up to the last completed session (run nightly)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--portfolio',
+            type=int,
+            help='Only snapshot the portfolio with this id',
+        )
+        parser.add_argument(
+            '--end',
+            type=date.fromisoformat,
+            help='Last date, YYYY-MM-DD (default: last completed session)',
+        )
+        parser.add_argument(
+            '--rebuild',
+            action='store_true',
+            help='Drop existing snapshots and write them again from the first trade',
+        )
+        parser.add_argument(
+            '--backfill',
+            action='store_true',
+            help='Store missing daily bars of held tickers first (calls the market data provider)',
+        )
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        builder = SnapshotBuilder(end=options['end'])
+        portfolios = Portfolio.objects.order_by('id')
+        if options['portfolio']:
+            portfolios = portfolios.filter(id=options['portfolio'])
+
+        if options['backfill']:
+            lots = Stock.objects.filter(portfolio__in=portfolios)
+            first = lots.order_by('purchase_date').values_list('purchase_date', flat=True).first()
+            if first:
+                tickers = list(lots.values_list('ticker', flat=True).distinct())
+                result = HistoryBackfill().backfill(tickers, SnapshotBuilder.session_day(first), builder.end)
+                self.stdout.write(f'Backfilled {result.bars} bars of {result.tickers} tickers')
+
+        written = 0
+        for portfolio in portfolios.iterator():
+            result = builder.build(portfolio, rebuild=options['rebuild'])
+            written += result.written
+            if result.written:
+                self.stdout.write(f'  {portfolio.name} (#{portfolio.id}): {result.start} .. {result.end}')
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'Portfolio snapshots completed: {written} rows up to {builder.end} '
+                f'({time.monotonic() - started:.1f}s)'
+            )
+        )
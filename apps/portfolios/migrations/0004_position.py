@@ -0,0 +1,52 @@
+# Generated by Django 5.2.3 on 2026-10-17 17:27
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def build_positions(apps, schema_editor):
+    """Fill positions from existing lots and sales"""
+    Stock = apps.get_model('portfolios', 'Stock')
+    Position = apps.get_model('portfolios', 'Position')
+    positions = {}
+    for stock in Stock.objects.prefetch_related('sales').order_by('id'):
+        position = positions.setdefault(
+            (stock.portfolio_id, stock.ticker),
+            Position(portfolio_id=stock.portfolio_id, ticker=stock.ticker, company_name=stock.company_name),
+        )
+        sold = 0
+        for sale in stock.sales.all():
+            sold += sale.quantity
+            position.realized_proceeds += sale.sale_price * sale.quantity
+            position.realized_profit += (sale.sale_price - stock.purchase_price) * sale.quantity
+        position.quantity += stock.quantity - sold
+        position.cost_basis += stock.purchase_price * (stock.quantity - sold)
+    Position.objects.bulk_create(positions.values(), batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('portfolios', '0003_stocksale'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Position',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('ticker', models.CharField(max_length=10)),
+                ('company_name', models.CharField(max_length=200)),
+                ('quantity', models.IntegerField(default=0)),
+                ('cost_basis', models.DecimalField(decimal_places=2, default=0, max_digits=20)),
+                ('realized_proceeds', models.DecimalField(decimal_places=2, default=0, max_digits=20)),
+                ('realized_profit', models.DecimalField(decimal_places=2, default=0, max_digits=20)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('portfolio', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='positions', to='portfolios.portfolio')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('portfolio', 'ticker'), name='unique_position_per_ticker')],
+            },
+        ),
+        migrations.RunPython(build_positions, migrations.RunPython.noop),
+    ]
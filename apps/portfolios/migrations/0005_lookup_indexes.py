@@ -0,0 +1,36 @@
+# Generated by Django 5.2.3 on 2026-10-17 17:37
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('portfolios', '0004_position'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='stock',
+            index=models.Index(fields=['portfolio', 'ticker', 'purchase_date'], name='stock_portfolio_ticker_date'),
+        ),
+        migrations.AddIndex(
+            model_name='stock',
+            index=models.Index(fields=['ticker'], name='stock_ticker'),
+        ),
+        migrations.AddIndex(
+            model_name='stocksale',
+            index=models.Index(fields=['stock', 'sale_date'], name='sale_stock_date'),
+        ),
+        migrations.AlterField(
+            model_name='stock',
+            name='portfolio',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='stocks', to='portfolios.portfolio'),
+        ),
+        migrations.AlterField(
+            model_name='stocksale',
+            name='stock',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='sales', to='portfolios.stock'),
+        ),
+    ]
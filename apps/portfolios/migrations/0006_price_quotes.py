@@ -0,0 +1,43 @@
+# Generated by Django 5.2.3 on 2026-10-17 17:44
+
+from django.db import migrations
+from django.utils import timezone
+
+
+def copy_prices(apps, schema_editor):
+    """Keep the latest stored lot price of every ticker as its quote"""
+    Stock = apps.get_model('portfolios', 'Stock')
+    PriceQuote = apps.get_model('stocks', 'PriceQuote')
+    prices = {}
+    lots = Stock.objects.filter(current_price__isnull=False).order_by('id').values_list('ticker', 'current_price')
+    for ticker, price in lots.iterator():
+        prices[ticker.upper()] = price
+    now = timezone.now()
+    PriceQuote.objects.bulk_create(
+        [PriceQuote(ticker=ticker, price=price, as_of=now) for ticker, price in prices.items()],
+        batch_size=1000,
+    )
+
+
+def restore_prices(apps, schema_editor):
+    """Copy quotes back onto the lots of their tickers"""
+    Stock = apps.get_model('portfolios', 'Stock')
+    PriceQuote = apps.get_model('stocks', 'PriceQuote')
+    for ticker, price in PriceQuote.objects.values_list('ticker', 'price').iterator():
+        Stock.objects.filter(ticker=ticker).update(current_price=price)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('portfolios', '0005_lookup_indexes'),
+        ('stocks', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunPython(copy_prices, restore_prices),
+        migrations.RemoveField(
+            model_name='stock',
+            name='current_price',
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.3 on 2026-10-17 17:54
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('portfolios', '0006_price_quotes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PortfolioSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('market_value', models.DecimalField(decimal_places=2, max_digits=20)),
+                ('cost_basis', models.DecimalField(decimal_places=2, max_digits=20)),
+                ('realized_profit', models.DecimalField(decimal_places=2, max_digits=20)),
+                ('portfolio', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='snapshots', to='portfolios.portfolio')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('portfolio', 'date'), name='unique_portfolio_snapshot')],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.3 on 2026-10-17 18:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('portfolios', '0007_portfolio_snapshots'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='portfoliosnapshot',
+            name='missing_closes',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
@@ -1,5 +1,53 @@
+from decimal import Decimal
+
 from django.db import models
+from django.db.models import F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
 from django.conf import settings
+from apps.stocks.models import PriceQuote
+
+MONEY = models.DecimalField(max_digits=20, decimal_places=2)
+
+
+class PortfolioQuerySet(models.QuerySet):
+    def with_values(self):
+        """
+        Annotate current value, realized profit/loss and total value of each portfolio
+        with correlated subqueries, so a list of portfolios is valued in one query.
+        Portfolio.current_value/total_value use these annotations when present.
+        """
+        sold = (
+            StockSale.objects.filter(stock=OuterRef('pk'))
+            .values('stock')
+            .annotate(total=Sum('quantity'))
+            .values('total')
+        )
+        current = (
+            Stock.objects.filter(portfolio=OuterRef('pk'))
+            .annotate(sold=Coalesce(Subquery(sold), 0))
+            .values('portfolio')
+            .annotate(total=Sum(
+                (F('quantity') - F('sold')) * Coalesce('current_price', 'purchase_price'),
+                output_field=MONEY,
+            ))
+            .values('total')
+        )
+        realized = (
+            StockSale.objects.filter(stock__portfolio=OuterRef('pk'))
+            .values('stock__portfolio')
+            .annotate(total=Sum(
+                (F('sale_price') - F('stock__purchase_price')) * F('quantity'),
+                output_field=MONEY,
+            ))
+            .values('total')
+        )
+        zero = Value(Decimal('0'), output_field=MONEY)
+        return self.annotate(
+            annotated_current_value=Coalesce(Subquery(current, output_field=MONEY), zero),
+            annotated_realized_profit=Coalesce(Subquery(realized, output_field=MONEY), zero),
+        ).annotate(
+            annotated_total_value=F('annotated_current_value') + F('annotated_realized_profit'),
+        )
 
 
 class Portfolio(models.Model):
@@ -7,14 +55,18 @@ class Portfolio(models.Model):
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
     name = models.CharField(max_length=100)
     created_at = models.DateTimeField(auto_now_add=True)
+
+    objects = PortfolioQuerySet.as_manager()
     
     def __str__(self):
         return f"{self.user.email} - {self.name}"
     
     def total_value(self):
         """Calculate total portfolio value: value of all current shares + available money (realized profit/loss)"""
+        if hasattr(self, 'annotated_total_value'):
+            return self.annotated_total_value
         # Value of all currently held (unsold) shares
-        stocks = self.stocks.all()
+        stocks = self.stocks.prefetch_related('sales')
         current_value = sum(stock.available_quantity() * (stock.current_price or stock.purchase_price) for stock in stocks)
         # Calculate available money (realized profit/loss)
         total_invested = 0
@@ -28,22 +80,74 @@ class Portfolio(models.Model):
 
     def current_value(self):
         """Sum of all unsold shares at current (market) price"""
-        return sum(stock.available_quantity() * (stock.current_price or stock.purchase_price) for stock in self.stocks.all())
+        if hasattr(self, 'annotated_current_value'):
+            return self.annotated_current_value
+        return sum(stock.available_quantity() * (stock.current_price or stock.purchase_price) for stock in self.stocks.prefetch_related('sales'))
 
     def purchase_value(self):
         """Sum of all unsold shares at their purchase price"""
-        return sum(stock.available_quantity() * stock.purchase_price for stock in self.stocks.all())
+        return sum(stock.available_quantity() * stock.purchase_price for stock in self.stocks.prefetch_related('sales'))
+
+
+def stored_price() -> Subquery:
+    """
+    Stored PriceQuote price of the ticker of the outer row (None if there is none).
+    The subquery is a lookup on the unique ticker of PriceQuote, so rows of a
+    ticker share one stored price and refreshing prices never writes to them.
+    """
+    price = PriceQuote.objects.filter(ticker=OuterRef('ticker')).values('price')[:1]
+    return Subquery(price, output_field=models.DecimalField(max_digits=10, decimal_places=2))
+
+
+class TradeTracking:
+    """
+    Keeps the TRADE_FIELDS values of a lot or sale as last loaded or saved
+    (loaded_trade), so signals can tell which saves changed a trade
+    """
+    TRADE_FIELDS = ()
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance.loaded_trade = instance.trade()
+        return instance
 
+    def refresh_from_db(self, *args, **kwargs):
+        super().refresh_from_db(*args, **kwargs)
+        self.loaded_trade = self.trade()
 
-class Stock(models.Model):
+    def trade(self) -> tuple:
+        """Current values of TRADE_FIELDS, None for deferred ones"""
+        return tuple(self.__dict__.get(name) for name in self.TRADE_FIELDS)
+
+
+class StockManager(models.Manager):
+    def get_queryset(self):
+        """Annotate current_price from the PriceQuote of the ticker, see stored_price"""
+        return super().get_queryset().annotate(current_price=stored_price())
+
+
+class Stock(TradeTracking, models.Model):
     """Individual stock in a portfolio"""
-    portfolio = models.ForeignKey(Portfolio, on_delete=models.CASCADE, related_name='stocks')
+    TRADE_FIELDS = ('quantity', 'purchase_price', 'purchase_date')
+
+    # Indexed by stock_portfolio_ticker_date, which leads with the portfolio
+    portfolio = models.ForeignKey(Portfolio, on_delete=models.CASCADE, related_name='stocks', db_index=False)
     ticker = models.CharField(max_length=10)  # e.g., AAPL, GOOGL
     company_name = models.CharField(max_length=200)
     quantity = models.IntegerField()
     purchase_price = models.DecimalField(max_digits=10, decimal_places=2)
-    current_price = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
     purchase_date = models.DateTimeField(auto_now_add=True)
+
+    objects = StockManager()
+
+    class Meta:
+        indexes = [
+            # Lots of a ticker in purchase order (lot matching, ticker detail)
+            models.Index(fields=['portfolio', 'ticker', 'purchase_date'], name='stock_portfolio_ticker_date'),
+            # Distinct held tickers and price updates across portfolios
+            models.Index(fields=['ticker'], name='stock_ticker'),
+        ]
     
     def __str__(self):
         return f"{self.ticker} - {self.quantity} shares"
@@ -57,6 +161,17 @@ class Stock(models.Model):
         """Total purchase value for this stock lot"""
         return self.quantity * self.purchase_price
 
+    @property
+    def current_price(self):
+        """Stored price of the ticker; annotated by Stock.objects, looked up for other instances"""
+        if '_current_price' not in self.__dict__:
+            self._current_price = PriceQuote.objects.filter(ticker=self.ticker).values_list('price', flat=True).first()
+        return self._current_price
+
+    @current_price.setter
+    def current_price(self, value):
+        self._current_price = value
+
     @property
     def current_value(self):
         """Current value of this stock lot"""
@@ -70,11 +185,20 @@ class Stock(models.Model):
         return (current_price - self.purchase_price) * self.quantity
 
 
-class StockSale(models.Model):
-    stock = models.ForeignKey(Stock, on_delete=models.CASCADE, related_name='sales')
+class StockSale(TradeTracking, models.Model):
+    TRADE_FIELDS = ('quantity', 'sale_price', 'sale_date')
+
+    # Indexed by sale_stock_date, which leads with the stock
+    stock = models.ForeignKey(Stock, on_delete=models.CASCADE, related_name='sales', db_index=False)
     quantity = models.PositiveIntegerField()
     sale_price = models.DecimalField(max_digits=10, decimal_places=2)
     sale_date = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            # Sales of a lot in date order
+            models.Index(fields=['stock', 'sale_date'], name='sale_stock_date'),
+        ]
     
     def __str__(self):
         return f"Sell {self.quantity} of {self.stock.ticker} at {self.sale_price}"
@@ -88,3 +212,59 @@ class StockSale(models.Model):
     def profit(self):
         """Profit from this sale"""
         return (self.sale_price - self.stock.purchase_price) * self.quantity
+
+
+class Position(models.Model):
+    """
+    Running totals of one ticker in a portfolio, kept up to date by
+    services.ledger.PositionLedger on every buy, sale and deletion
+    """
+    portfolio = models.ForeignKey(Portfolio, on_delete=models.CASCADE, related_name='positions')
+    ticker = models.CharField(max_length=10)
+    company_name = models.CharField(max_length=200)
+    quantity = models.IntegerField(default=0)  # unsold shares
+    cost_basis = models.DecimalField(max_digits=20, decimal_places=2, default=0)  # unsold shares at purchase price
+    realized_proceeds = models.DecimalField(max_digits=20, decimal_places=2, default=0)
+    realized_profit = models.DecimalField(max_digits=20, decimal_places=2, default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['portfolio', 'ticker'], name='unique_position_per_ticker'),
+        ]
+
+    def __str__(self):
+        return f"{self.portfolio.name} - {self.ticker}: {self.quantity} shares"
+
+    @property
+    def average_price(self):
+        """Average purchase price of unsold shares"""
+        return self.cost_basis / self.quantity if self.quantity else Decimal('0')
+
+
+class PortfolioSnapshot(models.Model):
+    """
+    Value of a portfolio at the close of one trading day, written by
+    services.snapshots.SnapshotBuilder for performance charts
+    """
+    portfolio = models.ForeignKey(Portfolio, on_delete=models.CASCADE, related_name='snapshots', db_index=False)
+    date = models.DateField()
+    market_value = models.DecimalField(max_digits=20, decimal_places=2)  # unsold shares at the day's close
+    cost_basis = models.DecimalField(max_digits=20, decimal_places=2)  # unsold shares at purchase price
+    realized_profit = models.DecimalField(max_digits=20, decimal_places=2)  # of sales up to the day
+    # Held tickers without a close of the day, valued at an earlier close or purchase price
+    missing_closes = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            # Also the index for snapshots of a portfolio in a date range
+            models.UniqueConstraint(fields=['portfolio', 'date'], name='unique_portfolio_snapshot'),
+        ]
+
+    def __str__(self):
+        return f"{self.portfolio.name} {self.date}: ${self.market_value}"
+
+    @property
+    def total_value(self):
+        """Market value plus realized profit/loss, as Portfolio.total_value"""
+        return self.market_value + self.realized_profit
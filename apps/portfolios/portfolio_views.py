@@ -2,16 +2,22 @@ from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.urls import reverse
+from django.conf import settings
+from django.http import JsonResponse
+from django.utils import timezone
+from datetime import date, timedelta
 from .models import Portfolio
 from .services.calculation import PortfolioCalculator
-from apps.stocks.services import StockPriceService
-from django.core.cache import cache
+from .services.snapshots import SnapshotBuilder
+from .services.summary_cache import SummaryCache
+from apps.stocks.history import HistoryBackfill
+from apps.stocks.refresh import PriceRefresher
 
 
 @login_required
 def portfolio_list(request):
     """Show user's portfolios"""
-    portfolios = Portfolio.objects.filter(user=request.user)
+    portfolios = Portfolio.objects.filter(user=request.user).with_values()
     return render(request, 'portfolios/portfolio_list.html', {'portfolios': portfolios})
 
 
@@ -44,22 +50,15 @@ def portfolio_detail(request, portfolio_id):
     # Force refresh prices if requested
     force_refresh = request.GET.get('refresh') == 'true'
     
-    # Update current prices for all stocks
-    for stock in portfolio.stocks.all():
-        if force_refresh:
-            # Clear cache for this ticker
-            cache_key = f"stock_price_{stock.ticker.upper()}"
-            cache.delete(cache_key)
-            cache_key_quote = f"stock_quote_{stock.ticker.upper()}"
-            cache.delete(cache_key_quote)
-        
-        current_price = StockPriceService.get_stock_price(stock.ticker)
-        if current_price:
-            stock.current_price = current_price
-            stock.save()
+    if force_refresh:
+        # Refetch these tickers and store changed prices, so values and quotes below agree
+        PriceRefresher().refresh(list(portfolio.stocks.values_list('ticker', flat=True).distinct()), force=True)
     
-    # Calculate portfolio summary using service
-    summary = PortfolioCalculator.calculate_portfolio_summary(portfolio)
+    # Values come from stored PriceQuote prices as on every page; only a refresh writes them
+    # Calculate portfolio summary from the position ledger, reused while nothing changed
+    summary = SummaryCache.get_or_compute(
+        portfolio.id, 'positions', lambda: PortfolioCalculator.calculate_position_summary(portfolio)
+    )
     
     # Calculate unrealized profit/loss
     current_value = summary['totals']['current_value']
@@ -87,7 +86,9 @@ def portfolio_history(request, portfolio_id):
     portfolio = get_object_or_404(Portfolio, id=portfolio_id, user=request.user)
     
     # Calculate portfolio summary and get only history
-    summary = PortfolioCalculator.calculate_portfolio_summary(portfolio)
+    summary = SummaryCache.get_or_compute(
+        portfolio.id, 'lots', lambda: PortfolioCalculator.calculate_portfolio_summary(portfolio)
+    )
     
     return render(request, 'portfolios/portfolio_history.html', {
         'portfolio': portfolio,
@@ -95,6 +96,66 @@ def portfolio_history(request, portfolio_id):
     })
 
 
+@login_required
+def portfolio_performance(request, portfolio_id):
+    """API endpoint with daily value snapshots of a portfolio for charts, never recomputes them"""
+    portfolio = get_object_or_404(Portfolio, id=portfolio_id, user=request.user)
+    try:
+        days = int(request.GET.get('days', settings.STOCK_HISTORY_BACKFILL['DEFAULT_DAYS']))
+    except ValueError:
+        return JsonResponse({'portfolio': portfolio.id, 'success': False, 'error': 'days must be a number'}, status=400)
+
+    end = HistoryBackfill.last_session()
+    snapshots = SnapshotBuilder.series(portfolio, end - timedelta(days=days), end)
+    return JsonResponse({
+        'portfolio': portfolio.id,
+        'success': True,
+        'snapshots': [
+            {
+                'date': snapshot.date.isoformat(),
+                'market_value': float(snapshot.market_value),
+                'cost_basis': float(snapshot.cost_basis),
+                'realized_profit': float(snapshot.realized_profit),
+                'total_value': float(snapshot.total_value),
+            }
+            for snapshot in snapshots
+        ],
+    })
+
+
+@login_required
+def holdings_as_of(request, portfolio_id):
+    """API endpoint with what a portfolio held at the end of ?date=YYYY-MM-DD (default today)"""
+    portfolio = get_object_or_404(Portfolio, id=portfolio_id, user=request.user)
+    try:
+        day = date.fromisoformat(request.GET['date']) if 'date' in request.GET else timezone.localdate()
+    except ValueError:
+        return JsonResponse({'portfolio': portfolio.id, 'success': False, 'error': 'date must be YYYY-MM-DD'}, status=400)
+
+    result = PortfolioCalculator.holdings_as_of(portfolio, day)
+    return JsonResponse({
+        'portfolio': portfolio.id,
+        'success': True,
+        'date': day.isoformat(),
+        'holdings': [
+            {
+                'ticker': item['ticker'],
+                'company_name': item['company_name'],
+                'quantity': item['quantity'],
+                'cost_basis': float(item['cost_basis']),
+                'avg_price': float(item['avg_price']),
+                'realized_profit': float(item['realized_profit']),
+            }
+            for item in result['holdings']
+        ],
+        'totals': {
+            'quantity': result['totals']['quantity'],
+            'cost_basis': float(result['totals']['cost_basis']),
+            'realized_profit': float(result['totals']['realized_profit']),
+        },
+    })
+
+
 @login_required
 def delete_portfolio(request, portfolio_id):
     """Delete a portfolio"""
@@ -1,7 +1,8 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-from .models import Portfolio, Stock, StockSale
+from .models import Portfolio, Stock
+from .services.lot_matching import FIFO, METHODS, SPECIFIC, LotMatcher, LotMatchingError
 
 
 @login_required
@@ -10,7 +11,7 @@ def sell_stock(request, portfolio_id, stock_id):
     portfolio = get_object_or_404(Portfolio, id=portfolio_id, user=request.user)
     stock = get_object_or_404(Stock, id=stock_id, portfolio=portfolio)
     available = stock.available_quantity()
-    
+
     if available <= 0:
         messages.error(request, 'No shares available to sell.')
         return redirect('portfolios:portfolio_detail', portfolio_id=portfolio.id)
@@ -24,27 +25,31 @@ def sell_stock(request, portfolio_id, stock_id):
         else:
             if quantity <= 0:
                 messages.error(request, 'Quantity must be greater than 0.')
-            elif quantity > available:
-                messages.error(request, f'You can only sell up to {available} shares.')
             elif sale_price <= 0:
                 messages.error(request, 'Sale price must be greater than 0.')
             elif sale_price > 100000:
                 messages.error(request, 'Sale price cannot exceed $100,000 per share.')
             else:
-                StockSale.objects.create(stock=stock, quantity=quantity, sale_price=sale_price)
-                messages.success(request, f'Sold {quantity} shares of {stock.ticker} at ${sale_price}')
-                return redirect('portfolios:portfolio_detail', portfolio_id=portfolio.id)
-    
+                try:
+                    LotMatcher.sell(portfolio, stock.ticker, quantity, sale_price,
+                                    method=SPECIFIC, lot_ids=[stock.id])
+                except LotMatchingError as e:
+                    messages.error(request, str(e))
+                else:
+                    messages.success(request, f'Sold {quantity} shares of {stock.ticker} at ${sale_price}')
+                    return redirect('portfolios:portfolio_detail', portfolio_id=portfolio.id)
+
     return render(request, 'portfolios/sell_stock.html', {'stock': stock, 'portfolio': portfolio, 'available': available})
 
 
 @login_required
 def sell_ticker(request, portfolio_id, ticker):
-    """Sell shares of a specific ticker using FIFO"""
+    """Sell shares of a specific ticker, matching lots by the chosen method (FIFO by default)"""
     portfolio = get_object_or_404(Portfolio, id=portfolio_id, user=request.user)
-    stocks = list(Stock.objects.filter(portfolio=portfolio, ticker=ticker).order_by('purchase_date'))  # FIFO
-    available = sum(stock.available_quantity() for stock in stocks)
-    
+    lots = LotMatcher.open_lots(portfolio, ticker)
+    available = sum(lot.available for lot in lots)
+    context = {'ticker': ticker, 'portfolio': portfolio, 'available': available, 'lots': lots, 'methods': METHODS}
+
     if available <= 0:
         messages.error(request, f'No shares of {ticker} available to sell.')
         return redirect('portfolios:portfolio_detail', portfolio_id=portfolio.id)
@@ -55,29 +60,24 @@ def sell_ticker(request, portfolio_id, ticker):
             sale_price = float(request.POST.get('sale_price'))
         except (TypeError, ValueError):
             messages.error(request, 'Quantity and price must be valid numbers.')
-            return render(request, 'portfolios/sell_ticker.html', {'ticker': ticker, 'portfolio': portfolio, 'available': available})
-        
+            return render(request, 'portfolios/sell_ticker.html', context)
+
         if quantity <= 0 or sale_price <= 0:
             messages.error(request, 'Quantity and price must be positive.')
-            return render(request, 'portfolios/sell_ticker.html', {'ticker': ticker, 'portfolio': portfolio, 'available': available})
-        
-        if quantity > available:
-            messages.error(request, f'You can sell up to {available} shares.')
-            return render(request, 'portfolios/sell_ticker.html', {'ticker': ticker, 'portfolio': portfolio, 'available': available})
-        
-        # FIFO selling logic
-        qty_left = quantity
-        for stock in stocks:
-            stock_avail = stock.available_quantity()
-            if stock_avail <= 0:
-                continue
-            sell_qty = min(qty_left, stock_avail)
-            StockSale.objects.create(stock=stock, quantity=sell_qty, sale_price=sale_price)
-            qty_left -= sell_qty
-            if qty_left == 0:
-                break
-        
+            return render(request, 'portfolios/sell_ticker.html', context)
+
+        # Lots are locked and rechecked inside the sale, so concurrent sells cannot oversell
+        try:
+            LotMatcher.sell(
+                portfolio, ticker, quantity, sale_price,
+                method=request.POST.get('method', FIFO),
+                lot_ids=request.POST.getlist('lot_ids'),
+            )
+        except LotMatchingError as e:
+            messages.error(request, str(e))
+            return render(request, 'portfolios/sell_ticker.html', context)
+
         messages.success(request, f'Sold {quantity} shares of {ticker} at ${sale_price}')
         return redirect('portfolios:portfolio_detail', portfolio_id=portfolio.id)
-    
-    return render(request, 'portfolios/sell_ticker.html', {'ticker': ticker, 'portfolio': portfolio, 'available': available}) 
\ No newline at end of file
+
+    return render(request, 'portfolios/sell_ticker.html', context)
@@ -1,38 +1,58 @@
 from collections import defaultdict
+from datetime import date, datetime, time
 from decimal import Decimal
-from typing import Dict, List, Tuple, Any
-from ..models import Portfolio, Stock, StockSale
+from typing import Dict, List, Tuple, Any, Optional, Union
+from django.utils import timezone
+from ..models import Portfolio, Stock, StockSale, stored_price
+from .transaction_index import TransactionIndex
 from apps.stocks.services import StockPriceService
 
 
 class PortfolioCalculator:
     """Service for portfolio calculations and summaries"""
     
+    @staticmethod
+    def load_lots(portfolio: Portfolio) -> List[Stock]:
+        """Load all lots of a portfolio with their sales in two queries"""
+        return list(portfolio.stocks.prefetch_related('sales'))
+
     @staticmethod
     def calculate_portfolio_summary(portfolio: Portfolio) -> Dict[str, Any]:
         """
         Calculate complete portfolio summary including active stocks and history
+        Lots and sales are loaded once; every metric is computed in one pass over them
         Returns dict with 'active', 'history', 'totals'
         """
         # Group stocks by ticker
         grouped = defaultdict(list)
-        for stock in portfolio.stocks.all():
+        for stock in PortfolioCalculator.load_lots(portfolio):
             grouped[stock.ticker].append(stock)
 
+        # Fetch quotes and company info for all tickers in one batch
+        quotes = StockPriceService.get_stock_quotes(grouped.keys())
+        overviews = StockPriceService.get_company_overviews(grouped.keys())
+
         # Split into active and history
         active = []
         history = []
+        lot_summaries = []
         
         for ticker, purchases in grouped.items():
-            ticker_summary = PortfolioCalculator.calculate_ticker_summary(ticker, purchases)
+            lots = PortfolioCalculator.summarize_lots(purchases)
+            lot_summaries.append(lots)
+            ticker_summary = PortfolioCalculator.calculate_ticker_summary(
+                ticker, purchases, quote_info=quotes.get(ticker.upper()), lots=lots,
+                # Empty when unavailable, so it is not requested again per ticker
+                company_info=overviews.get(ticker.upper()) or {},
+            )
             
             if ticker_summary['remaining_qty'] > 0:
                 active.append(ticker_summary)
             else:
                 history.append(ticker_summary)
 
-        # Calculate portfolio totals
-        totals = PortfolioCalculator.calculate_portfolio_totals(portfolio)
+        # Calculate portfolio totals from per-ticker sums
+        totals = PortfolioCalculator.calculate_portfolio_totals(portfolio, lot_summaries=lot_summaries)
         
         return {
             'active': active,
@@ -41,30 +61,118 @@ class PortfolioCalculator:
         }
     
     @staticmethod
-    def calculate_ticker_summary(ticker: str, purchases: List[Stock]) -> Dict[str, Any]:
+    def calculate_position_summary(portfolio: Portfolio) -> Dict[str, Any]:
+        """
+        Calculate portfolio page summary from the position ledger, one row per ticker
+        Positions are priced from PriceQuote in the same query, as every other page
+        Returns dict with 'active' (same shape as calculate_ticker_summary without
+        'purchases'), 'history' positions and 'totals'
+        """
+        positions = list(portfolio.positions.annotate(current_price=stored_price()).order_by('id'))
+        held = [position.ticker for position in positions if position.quantity > 0]
+        quotes = StockPriceService.get_stock_quotes(held)
+        overviews = StockPriceService.get_company_overviews(held)
+
+        active = []
+        history = []
+        for position in positions:
+            if position.quantity <= 0:
+                history.append(position)
+                continue
+            current_price = position.current_price or position.average_price
+            current_value = current_price * position.quantity
+            profit = current_value - position.cost_basis
+            active.append({
+                'ticker': position.ticker,
+                'company_name': position.company_name,
+                'remaining_qty': position.quantity,
+                'avg_price': position.average_price,
+                'profit': profit,
+                'percent_profit': (profit / position.cost_basis * 100) if position.cost_basis else 0,
+                'current_value': current_value,
+                'company_info': overviews.get(position.ticker.upper()),
+                'quote_info': quotes.get(position.ticker.upper()),
+            })
+
+        total_profit = sum((position.realized_profit for position in positions), Decimal('0'))
+        total_invested = sum((position.realized_proceeds for position in positions), Decimal('0')) - total_profit
+        return {
+            'active': active,
+            'history': history,
+            'totals': {
+                'available_money': total_profit,
+                'total_profit': total_profit,
+                'percent_profit': (total_profit / total_invested * 100) if total_invested else 0,
+                'current_value': sum((item['current_value'] for item in active), Decimal('0')),
+                'purchase_value': sum((position.cost_basis for position in positions), Decimal('0')),
+            },
+        }
+
+    @staticmethod
+    def summarize_lots(purchases: List[Stock]) -> Dict[str, Any]:
+        """
+        Sum up quantities, unrealized and realized results of lots in one pass
+        Uses prefetched sales if lots were loaded with load_lots
+        Returns dict with quantities, 'invested'/'current'/'profit' for unsold shares,
+        'sold_invested'/'received'/'realized_profit' for sold shares and 'sales'
+        """
+        lots = {
+            'total_qty': 0,
+            'total_sold': 0,
+            'invested': Decimal('0'),
+            'current': Decimal('0'),
+            'profit': Decimal('0'),
+            'sold_invested': Decimal('0'),
+            'received': Decimal('0'),
+            'realized_profit': Decimal('0'),
+            'sales': [],
+        }
+        for stock in purchases:
+            sold = 0
+            for sale in stock.sales.all():
+                sold += sale.quantity
+                lots['sold_invested'] += stock.purchase_price * sale.quantity
+                lots['received'] += sale.sale_price * sale.quantity
+                lots['realized_profit'] += (sale.sale_price - stock.purchase_price) * sale.quantity
+                lots['sales'].append(sale)
+            lots['total_qty'] += stock.quantity
+            lots['total_sold'] += sold
+            
+            unsold = stock.quantity - sold
+            if unsold > 0:
+                current_price = stock.current_price or stock.purchase_price
+                lots['invested'] += stock.purchase_price * unsold
+                lots['current'] += current_price * unsold
+                lots['profit'] += (current_price - stock.purchase_price) * unsold
+        lots['remaining_qty'] = lots['total_qty'] - lots['total_sold']
+        return lots
+
+    @staticmethod
+    def calculate_ticker_summary(ticker: str, purchases: List[Stock], quote_info: Optional[dict] = None,
+                                 lots: Optional[Dict[str, Any]] = None,
+                                 company_info: Optional[dict] = None) -> Dict[str, Any]:
         """
         Calculate summary for a specific ticker
         Returns dict with ticker data including company info and quotes
         """
-        # Get company overview and quote data
-        company_info = StockPriceService.get_company_overview(ticker)
-        quote_info = StockPriceService.get_stock_quote(ticker)
+        # Get company overview and quote data (both may be prefetched in batch)
+        if company_info is None:
+            company_info = StockPriceService.get_company_overview(ticker)
+        if quote_info is None:
+            quote_info = StockPriceService.get_stock_quote(ticker)
         
-        # Calculate basic metrics
-        total_qty = sum(s.quantity for s in purchases)
-        total_sold = sum(sum(sale.quantity for sale in stock.sales.all()) for stock in purchases)
-        remaining_qty = total_qty - total_sold
-        
-        # Calculate profit/loss for remaining shares
-        profit_data = PortfolioCalculator.calculate_profit_loss(purchases, remaining_qty)
+        if lots is None:
+            lots = PortfolioCalculator.summarize_lots(purchases)
+        profit_data = PortfolioCalculator._profit_loss(lots)
         
         # Prepare ticker data
         ticker_data = {
             'ticker': ticker,
+            'company_name': purchases[0].company_name,
             'purchases': purchases,
-            'total_qty': total_qty,
-            'remaining_qty': remaining_qty,
-            'total_sold': total_sold,
+            'total_qty': lots['total_qty'],
+            'remaining_qty': lots['remaining_qty'],
+            'total_sold': lots['total_sold'],
             'avg_price': profit_data['avg_price'],
             'profit': profit_data['profit'],
             'percent_profit': profit_data['percent_profit'],
@@ -74,9 +182,8 @@ class PortfolioCalculator:
         }
         
         # Add sales data for history
-        if remaining_qty == 0:
-            sales_data = PortfolioCalculator.calculate_sales_summary(purchases)
-            ticker_data.update(sales_data)
+        if lots['remaining_qty'] == 0:
+            ticker_data.update(PortfolioCalculator._sales_summary(lots))
         
         return ticker_data
     
@@ -86,33 +193,23 @@ class PortfolioCalculator:
         Calculate profit/loss for remaining shares
         Returns dict with profit, percent_profit, avg_price, current_value
         """
-        remaining_lots = []
-        profit = Decimal('0')
-        invested = Decimal('0')
-        current = Decimal('0')
-        
-        for stock in purchases:
-            sold = sum(sale.quantity for sale in stock.sales.all())
-            unsold = stock.quantity - sold
-            if unsold > 0:
-                remaining_lots.append((unsold, stock.purchase_price))
-                invested += stock.purchase_price * unsold
-                current_price = stock.current_price or stock.purchase_price
-                current += current_price * unsold
-                profit += (current_price - stock.purchase_price) * unsold
-        
-        if remaining_lots:
-            avg_price = sum(q * price for q, price in remaining_lots) / sum(q for q, _ in remaining_lots)
-            percent_profit = (profit / invested * 100) if invested else 0
+        return PortfolioCalculator._profit_loss(PortfolioCalculator.summarize_lots(purchases))
+    
+    @staticmethod
+    def _profit_loss(lots: Dict[str, Any]) -> Dict[str, Any]:
+        """Profit/loss for remaining shares from summarize_lots result"""
+        if lots['remaining_qty'] > 0:
+            avg_price = lots['invested'] / lots['remaining_qty']
+            percent_profit = (lots['profit'] / lots['invested'] * 100) if lots['invested'] else 0
         else:
             avg_price = Decimal('0')
             percent_profit = 0
         
         return {
-            'profit': profit,
+            'profit': lots['profit'],
             'percent_profit': percent_profit,
             'avg_price': avg_price,
-            'current_value': current
+            'current_value': lots['current']
         }
     
     @staticmethod
@@ -121,43 +218,35 @@ class PortfolioCalculator:
         Calculate summary for sold shares
         Returns dict with sales, profit, total_received
         """
-        all_sales = []
-        profit = Decimal('0')
-        invested = Decimal('0')
-        received = Decimal('0')
-        
-        for stock in purchases:
-            for sale in stock.sales.all():
-                all_sales.append(sale)
-                invested += stock.purchase_price * sale.quantity
-                received += sale.sale_price * sale.quantity
-                profit += (sale.sale_price - stock.purchase_price) * sale.quantity
-        
+        return PortfolioCalculator._sales_summary(PortfolioCalculator.summarize_lots(purchases))
+    
+    @staticmethod
+    def _sales_summary(lots: Dict[str, Any]) -> Dict[str, Any]:
+        """Summary for sold shares from summarize_lots result"""
+        invested = lots['sold_invested']
+        received = lots['received']
         percent_profit = ((received - invested) / invested * 100) if invested else 0
         
         return {
-            'sales': all_sales,
-            'profit': profit,
+            'sales': lots['sales'],
+            'profit': lots['realized_profit'],
             'percent_profit': percent_profit,
             'total_received': received
         }
     
     @staticmethod
-    def calculate_portfolio_totals(portfolio: Portfolio) -> Dict[str, Any]:
+    def calculate_portfolio_totals(portfolio: Portfolio,
+                                   lot_summaries: Optional[List[Dict[str, Any]]] = None) -> Dict[str, Any]:
         """
-        Calculate portfolio totals
+        Calculate portfolio totals, from per-ticker summarize_lots results if given
         Returns dict with available_money, total_profit, percent_profit, etc.
         """
-        all_stocks = portfolio.stocks.all()
-        total_invested = Decimal('0')
-        total_received = Decimal('0')
-        total_profit = Decimal('0')
+        if lot_summaries is None:
+            lot_summaries = [PortfolioCalculator.summarize_lots(PortfolioCalculator.load_lots(portfolio))]
         
-        for stock in all_stocks:
-            for sale in stock.sales.all():
-                total_invested += stock.purchase_price * sale.quantity
-                total_received += sale.sale_price * sale.quantity
-                total_profit += (sale.sale_price - stock.purchase_price) * sale.quantity
+        total_invested = sum((lots['sold_invested'] for lots in lot_summaries), Decimal('0'))
+        total_received = sum((lots['received'] for lots in lot_summaries), Decimal('0'))
+        total_profit = sum((lots['realized_profit'] for lots in lot_summaries), Decimal('0'))
         
         available_money = total_received - total_invested
         percent_profit = ((total_received - total_invested) / total_invested * 100) if total_invested else 0
@@ -166,17 +255,42 @@ class PortfolioCalculator:
             'available_money': available_money,
             'total_profit': total_profit,
             'percent_profit': percent_profit,
-            'current_value': portfolio.current_value(),
-            'purchase_value': portfolio.purchase_value(),
+            'current_value': sum((lots['current'] for lots in lot_summaries), Decimal('0')),
+            'purchase_value': sum((lots['invested'] for lots in lot_summaries), Decimal('0')),
         }
     
+    @staticmethod
+    def holdings_as_of(portfolio: Portfolio, as_of: Union[date, datetime]) -> Dict[str, Any]:
+        """
+        Holdings of a portfolio at a moment, or at the end of a day in the current time zone
+        Looked up in the cached TransactionIndex, one binary search per ticker
+        Returns dict with 'as_of', 'holdings' (see TransactionIndex.holdings) and 'totals'
+        """
+        if not isinstance(as_of, datetime):
+            as_of = timezone.make_aware(datetime.combine(as_of, time.max))
+        index = TransactionIndex.for_portfolio(portfolio)
+        holdings = index.holdings(as_of)
+        return {
+            'as_of': as_of,
+            'holdings': holdings,
+            'totals': {
+                'quantity': sum(item['quantity'] for item in holdings),
+                'cost_basis': sum((item['cost_basis'] for item in holdings), Decimal('0')),
+                'realized_profit': index.realized_profit(as_of),
+            },
+        }
+
     @staticmethod
     def calculate_ticker_detail_summary(portfolio: Portfolio, ticker: str) -> Dict[str, Any]:
         """
         Calculate detailed summary for ticker detail page
         Returns dict with all ticker information
         """
-        stocks = list(Stock.objects.filter(portfolio=portfolio, ticker=ticker).order_by('purchase_date'))
+        stocks = list(
+            Stock.objects.filter(portfolio=portfolio, ticker=ticker)
+            .prefetch_related('sales')
+            .order_by('purchase_date')
+        )
         
         if not stocks:
             return None
@@ -185,13 +299,9 @@ class PortfolioCalculator:
         company_info = StockPriceService.get_company_overview(ticker)
         quote_info = StockPriceService.get_stock_quote(ticker)
         
-        # Calculate totals
-        total_qty = sum(s.quantity for s in stocks)
-        total_sold = sum(sum(sale.quantity for sale in stock.sales.all()) for stock in stocks)
-        remaining_qty = total_qty - total_sold
-        
-        # Calculate profit/loss
-        profit_data = PortfolioCalculator.calculate_profit_loss(stocks, remaining_qty)
+        # Calculate totals and profit/loss
+        lots = PortfolioCalculator.summarize_lots(stocks)
+        profit_data = PortfolioCalculator._profit_loss(lots)
         
         # Collect all sales
         all_sales = []
@@ -212,9 +322,9 @@ class PortfolioCalculator:
             'stocks': stocks,
             'company_info': company_info,
             'quote_info': quote_info,
-            'total_qty': total_qty,
-            'remaining_qty': remaining_qty,
-            'total_sold': total_sold,
+            'total_qty': lots['total_qty'],
+            'remaining_qty': lots['remaining_qty'],
+            'total_sold': lots['total_sold'],
             'avg_price': profit_data['avg_price'],
             'profit': profit_data['profit'],
             'percent_profit': profit_data['percent_profit'],
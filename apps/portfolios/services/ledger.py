@@ -0,0 +1,152 @@
+from collections import defaultdict
+from decimal import Decimal
+from typing import Dict, List
+from django.db import transaction
+from django.db.models import F
+from ..models import Portfolio, Position, Stock, StockSale
+from .calculation import PortfolioCalculator
+from .summary_cache import SummaryCache
+
+CENT = Decimal('0.01')
+
+
+class PositionLedger:
+    """
+    Service keeping Position rows in step with raw Stock and StockSale rows.
+    Every change is applied as a delta with F() expressions, so concurrent
+    buys and sales of the same ticker do not overwrite each other.
+    """
+
+    @staticmethod
+    def record_purchase(stock: Stock) -> None:
+        """Add a newly bought lot to its position"""
+        price = PositionLedger._money(stock.purchase_price)
+        PositionLedger._apply(
+            stock.portfolio_id, stock.ticker, stock.company_name,
+            quantity=stock.quantity,
+            cost_basis=price * stock.quantity,
+        )
+
+    @staticmethod
+    def record_sale(sale: StockSale) -> None:
+        """Move sold shares of a lot from unrealized to realized totals"""
+        PositionLedger.record_sales([sale])
+
+    @staticmethod
+    def record_sales(sales: List[StockSale]) -> None:
+        """Record many sales with one position update per ticker"""
+        deltas = {}
+        for sale in sales:
+            stock = sale.stock
+            purchase_price = PositionLedger._money(stock.purchase_price)
+            sale_price = PositionLedger._money(sale.sale_price)
+            key = (stock.portfolio_id, stock.ticker)
+            if key not in deltas:
+                deltas[key] = (stock.company_name, {
+                    'quantity': 0,
+                    'cost_basis': Decimal('0'),
+                    'realized_proceeds': Decimal('0'),
+                    'realized_profit': Decimal('0'),
+                })
+            totals = deltas[key][1]
+            totals['quantity'] -= sale.quantity
+            totals['cost_basis'] -= purchase_price * sale.quantity
+            totals['realized_proceeds'] += sale_price * sale.quantity
+            totals['realized_profit'] += (sale_price - purchase_price) * sale.quantity
+        for (portfolio_id, ticker), (company_name, totals) in deltas.items():
+            PositionLedger._apply(portfolio_id, ticker, company_name, **totals)
+
+    @staticmethod
+    def remove_lot(stock: Stock) -> None:
+        """
+        Take a lot and its sales out of its position, before the lot is deleted.
+        The position is dropped once the ticker has no lots left.
+        """
+        lots = PortfolioCalculator.summarize_lots([stock])
+        with transaction.atomic():
+            PositionLedger._apply(
+                stock.portfolio_id, stock.ticker, stock.company_name,
+                quantity=-lots['remaining_qty'],
+                cost_basis=-lots['invested'],
+                realized_proceeds=-lots['received'],
+                realized_profit=-lots['realized_profit'],
+            )
+            if not Stock.objects.filter(portfolio_id=stock.portfolio_id, ticker=stock.ticker).exclude(pk=stock.pk).exists():
+                Position.objects.filter(portfolio_id=stock.portfolio_id, ticker=stock.ticker).delete()
+
+    @staticmethod
+    def forget(portfolio: Portfolio, ticker: str) -> None:
+        """Drop position of a ticker whose lots are all deleted"""
+        Position.objects.filter(portfolio=portfolio, ticker=ticker).delete()
+        SummaryCache.bump(portfolio.id)
+
+    @staticmethod
+    def expected_positions(portfolio: Portfolio) -> Dict[str, Dict]:
+        """Recompute position values of every ticker from raw lots and sales"""
+        grouped = defaultdict(list)
+        for stock in PortfolioCalculator.load_lots(portfolio):
+            grouped[stock.ticker].append(stock)
+
+        expected = {}
+        for ticker, purchases in grouped.items():
+            lots = PortfolioCalculator.summarize_lots(purchases)
+            expected[ticker] = {
+                'company_name': purchases[0].company_name,
+                'quantity': lots['remaining_qty'],
+                'cost_basis': lots['invested'].quantize(CENT),
+                'realized_proceeds': lots['received'].quantize(CENT),
+                'realized_profit': lots['realized_profit'].quantize(CENT),
+            }
+        return expected
+
+    @staticmethod
+    def verify(portfolio: Portfolio) -> List[str]:
+        """Return tickers whose stored position differs from raw lots, or is missing or orphaned"""
+        return PositionLedger._mismatched(portfolio, PositionLedger.expected_positions(portfolio))
+
+    @staticmethod
+    def rebuild(portfolio: Portfolio) -> List[str]:
+        """Rewrite positions of a portfolio from raw lots. Returns tickers that were corrected"""
+        with transaction.atomic():
+            expected = PositionLedger.expected_positions(portfolio)
+            mismatched = PositionLedger._mismatched(portfolio, expected)
+            if mismatched:
+                portfolio.positions.filter(ticker__in=mismatched).delete()
+                Position.objects.bulk_create([
+                    Position(portfolio=portfolio, ticker=ticker, **expected[ticker])
+                    for ticker in mismatched if ticker in expected
+                ])
+                SummaryCache.bump(portfolio.id)
+        return mismatched
+
+    @staticmethod
+    def _mismatched(portfolio: Portfolio, expected: Dict[str, Dict]) -> List[str]:
+        """Compare stored positions with expected values"""
+        stored = {position.ticker: position for position in portfolio.positions.all()}
+        mismatched = []
+        for ticker in sorted(set(expected) | set(stored)):
+            values = expected.get(ticker)
+            position = stored.get(ticker)
+            if values is None or position is None or any(
+                getattr(position, field) != value
+                for field, value in values.items() if field != 'company_name'
+            ):
+                mismatched.append(ticker)
+        return mismatched
+
+    @staticmethod
+    def _apply(portfolio_id: int, ticker: str, company_name: str, **deltas) -> None:
+        """Add deltas to the position of a ticker, creating it if needed"""
+        with transaction.atomic():
+            position, _ = Position.objects.get_or_create(
+                portfolio_id=portfolio_id, ticker=ticker, defaults={'company_name': company_name}
+            )
+            Position.objects.filter(pk=position.pk).update(
+                **{field: F(field) + delta for field, delta in deltas.items()}
+            )
+            SummaryCache.bump(portfolio_id)
+
+    @staticmethod
+    def _money(value) -> Decimal:
+        """Price as stored by a two decimal places DecimalField (views pass floats)"""
+        return Decimal(str(value)).quantize(CENT)
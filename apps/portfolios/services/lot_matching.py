@@ -0,0 +1,114 @@
+from decimal import Decimal
+from typing import Iterable, List, Optional, Tuple
+from django.db import transaction
+from django.db.models import Sum
+from ..models import Portfolio, Stock, StockSale
+from .ledger import PositionLedger
+
+FIFO = 'fifo'
+LIFO = 'lifo'
+HIFO = 'hifo'
+SPECIFIC = 'specific'
+
+METHODS = {
+    FIFO: 'First in, first out',
+    LIFO: 'Last in, first out',
+    HIFO: 'Highest cost first',
+    SPECIFIC: 'Specific lots',
+}
+
+
+class LotMatchingError(ValueError):
+    """Sale cannot be matched against the open lots"""
+
+
+class LotMatcher:
+    """
+    Service matching a sale of a ticker against its open lots.
+    Lots are locked and loaded once, the allocation is computed in memory and
+    all sales are written with one bulk_create in the same transaction.
+    """
+
+    @staticmethod
+    def open_lots(portfolio: Portfolio, ticker: str, lock: bool = False) -> List[Stock]:
+        """
+        Load lots of a ticker with unsold shares, oldest first, in two queries.
+        Each lot gets an 'available' attribute. With lock=True the lots stay
+        locked until the surrounding transaction ends.
+        """
+        lots = Stock.objects.filter(portfolio=portfolio, ticker=ticker).order_by('purchase_date', 'id')
+        if lock:
+            lots = lots.select_for_update()
+        lots = list(lots)
+        sold = dict(
+            StockSale.objects.filter(stock__in=lots)
+            .values('stock')
+            .annotate(total=Sum('quantity'))
+            .values_list('stock', 'total')
+        )
+        for lot in lots:
+            lot.available = lot.quantity - sold.get(lot.id, 0)
+        return [lot for lot in lots if lot.available > 0]
+
+    @staticmethod
+    def allocate(lots: List[Stock], quantity: int, method: str = FIFO,
+                 lot_ids: Optional[Iterable[int]] = None) -> List[Tuple[Stock, int]]:
+        """
+        Split quantity over open lots (oldest first, with 'available' set) by method.
+        For SPECIFIC, lots are used in the order of lot_ids.
+        Returns (lot, quantity) pairs; raises LotMatchingError if shares are short.
+        """
+        if method == FIFO:
+            ordered = lots
+        elif method == LIFO:
+            ordered = lots[::-1]
+        elif method == HIFO:
+            ordered = sorted(lots, key=lambda lot: lot.purchase_price, reverse=True)
+        elif method == SPECIFIC:
+            by_id = {lot.id: lot for lot in lots}
+            try:
+                lot_ids = [int(lot_id) for lot_id in lot_ids or ()]
+            except (TypeError, ValueError):
+                raise LotMatchingError('Lot ids must be numbers.')
+            if not lot_ids:
+                raise LotMatchingError('Choose the lots to sell from.')
+            missing = [lot_id for lot_id in lot_ids if lot_id not in by_id]
+            if missing:
+                raise LotMatchingError(f'Lots {", ".join(map(str, missing))} have no shares available to sell.')
+            ordered = [by_id[lot_id] for lot_id in dict.fromkeys(lot_ids)]
+        else:
+            raise LotMatchingError(f'Unknown lot matching method "{method}".')
+
+        available = sum(lot.available for lot in ordered)
+        if quantity > available:
+            raise LotMatchingError(f'You can sell up to {available} shares.')
+
+        allocation = []
+        qty_left = quantity
+        for lot in ordered:
+            if qty_left == 0:
+                break
+            sell_qty = min(qty_left, lot.available)
+            allocation.append((lot, sell_qty))
+            qty_left -= sell_qty
+        return allocation
+
+    @staticmethod
+    def sell(portfolio: Portfolio, ticker: str, quantity: int, sale_price, method: str = FIFO,
+             lot_ids: Optional[Iterable[int]] = None) -> List[StockSale]:
+        """
+        Sell quantity shares of a ticker at sale_price, matching lots by method.
+        Concurrent sells of the same ticker wait for each other, so lots cannot be oversold.
+        """
+        if quantity <= 0:
+            raise LotMatchingError('Quantity must be greater than 0.')
+        sale_price = Decimal(str(sale_price))
+        with transaction.atomic():
+            lots = LotMatcher.open_lots(portfolio, ticker, lock=True)
+            allocation = LotMatcher.allocate(lots, quantity, method, lot_ids)
+            sales = StockSale.objects.bulk_create([
+                StockSale(stock=lot, quantity=sell_qty, sale_price=sale_price)
+                for lot, sell_qty in allocation
+            ])
+            PositionLedger.record_sales(sales)
+        return sales
@@ -0,0 +1,164 @@
+from array import array
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Tuple
+from ..models import Position
+from .summary_cache import SummaryCache
+from apps.stocks.services import StockPriceService
+
+
+class PositionBook:
+    """
+    Open positions of one portfolio in parallel float arrays with running totals.
+    A price tick changes totals by quantity * price change of one slot, so it
+    costs O(1) no matter how many positions the portfolio holds.
+    """
+
+    def __init__(self, portfolio_id: int, rows: Iterable[Tuple[str, int, float, float]],
+                 realized_profit: float = 0.0, version: Optional[int] = None):
+        """rows are (ticker, quantity, cost_basis, price) of open positions"""
+        self.portfolio_id = portfolio_id
+        self.version = version
+        self.tickers: List[str] = []
+        self.slots: Dict[str, int] = {}
+        self.quantities = array('d')
+        self.cost_basis = array('d')
+        self.prices = array('d')
+        for ticker, quantity, cost_basis, price in rows:
+            self.slots[ticker] = len(self.tickers)
+            self.tickers.append(ticker)
+            self.quantities.append(quantity)
+            self.cost_basis.append(cost_basis)
+            self.prices.append(price)
+        self.realized_profit = realized_profit
+        self.recompute()
+
+    def recompute(self) -> None:
+        """Recalculate running totals from the arrays, dropping accumulated rounding error"""
+        self.current_value = sum(q * p for q, p in zip(self.quantities, self.prices))
+        self.purchase_value = sum(self.cost_basis)
+
+    def apply_tick(self, ticker: str, price: float) -> float:
+        """Set price of a ticker. Returns change of current value, 0 if the ticker is not held"""
+        slot = self.slots.get(ticker)
+        if slot is None:
+            return 0.0
+        delta = self.quantities[slot] * (price - self.prices[slot])
+        self.prices[slot] = price
+        self.current_value += delta
+        return delta
+
+    @property
+    def unrealized_profit(self) -> float:
+        """Current value minus cost of open positions"""
+        return self.current_value - self.purchase_value
+
+    def totals(self) -> Dict[str, float]:
+        """Portfolio totals in the shape of PortfolioCalculator summary totals"""
+        return {
+            'current_value': self.current_value,
+            'purchase_value': self.purchase_value,
+            'unrealized_profit': self.unrealized_profit,
+            'unrealized_percent': (self.unrealized_profit / self.purchase_value * 100) if self.purchase_value else 0,
+            'total_profit': self.realized_profit,
+        }
+
+    def position(self, ticker: str) -> Optional[Dict[str, float]]:
+        """Current value and unrealized P&L of one position"""
+        slot = self.slots.get(ticker)
+        if slot is None:
+            return None
+        current_value = self.quantities[slot] * self.prices[slot]
+        return {
+            'ticker': ticker,
+            'quantity': self.quantities[slot],
+            'price': self.prices[slot],
+            'current_value': current_value,
+            'profit': current_value - self.cost_basis[slot],
+        }
+
+
+class PnLEngine:
+    """
+    Position books of many portfolios, updated by price ticks.
+    Books are built from the position ledger (itself kept from Stock and StockSale
+    rows) in one query. A tick only touches books holding its ticker, so live
+    P&L of thousands of portfolios needs no PortfolioCalculator run per tick.
+    """
+
+    def __init__(self):
+        self.books: Dict[int, PositionBook] = {}
+        self._holders: Dict[str, List[PositionBook]] = defaultdict(list)
+
+    def load(self, portfolio_ids: Iterable[int], prices: Optional[Dict[str, float]] = None) -> None:
+        """
+        (Re)build books of portfolios from their positions.
+        Tickers missing from prices are looked up in cached quotes; positions
+        without any price are valued at cost.
+        """
+        portfolio_ids = list(portfolio_ids)
+        positions = defaultdict(list)
+        for position in Position.objects.filter(portfolio_id__in=portfolio_ids).order_by('id'):
+            positions[position.portfolio_id].append(position)
+
+        prices = dict(prices or {})
+        held = {p.ticker.upper() for group in positions.values() for p in group if p.quantity > 0}
+        missing = held - set(prices)
+        if missing:
+            prices.update(StockPriceService.get_stock_prices(missing))
+
+        for portfolio_id in portfolio_ids:
+            self._drop(portfolio_id)
+            group = positions.get(portfolio_id, [])
+            rows = []
+            for position in group:
+                if position.quantity <= 0:
+                    continue
+                price = prices.get(position.ticker.upper()) or position.average_price
+                rows.append((position.ticker.upper(), position.quantity, float(position.cost_basis), float(price)))
+            book = PositionBook(
+                portfolio_id, rows,
+                realized_profit=float(sum(p.realized_profit for p in group)),
+                version=SummaryCache.version(portfolio_id),
+            )
+            self.books[portfolio_id] = book
+            for ticker in book.tickers:
+                self._holders[ticker].append(book)
+
+    def apply_ticks(self, prices: Dict[str, float]) -> Dict[int, float]:
+        """Apply new prices. Returns change of current value per affected portfolio"""
+        changes = defaultdict(float)
+        for ticker, price in prices.items():
+            for book in self._holders.get(ticker.upper(), ()):
+                changes[book.portfolio_id] += book.apply_tick(ticker.upper(), float(price))
+        return dict(changes)
+
+    def refresh_changed(self) -> List[int]:
+        """Rebuild books of portfolios written to since they were loaded. Returns their ids"""
+        changed = [
+            portfolio_id for portfolio_id, book in self.books.items()
+            if book.version != SummaryCache.version(portfolio_id)
+        ]
+        if changed:
+            # Keep prices of the engine instead of going back to cached quotes
+            prices = {
+                ticker: book.prices[slot]
+                for book in self.books.values()
+                for ticker, slot in book.slots.items()
+            }
+            self.load(changed, prices=prices)
+        return changed
+
+    def totals(self, portfolio_id: int) -> Optional[Dict[str, float]]:
+        """Totals of a loaded portfolio, None if it is not loaded"""
+        book = self.books.get(portfolio_id)
+        return book.totals() if book else None
+
+    def _drop(self, portfolio_id: int) -> None:
+        """Forget book of a portfolio"""
+        book = self.books.pop(portfolio_id, None)
+        if book is None:
+            return
+        for ticker in book.tickers:
+            self._holders[ticker].remove(book)
+            if not self._holders[ticker]:
+                del self._holders[ticker]
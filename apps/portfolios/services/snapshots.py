@@ -0,0 +1,221 @@
+"""
+Daily portfolio value snapshots (PortfolioSnapshot) for performance charts.
+SnapshotBuilder replays the lots and sales of a portfolio over the trading days
+after its last snapshot, values unsold shares at stored DailyBar closes and
+writes one row per day. A trade counts from the first session closing after it,
+so snapshots of completed sessions only change when lots or sales are edited
+or deleted, and those writes drop the snapshots they affect (see signals).
+Days written while a held ticker had no close are written again once the
+missing bars are stored.
+"""
+import threading
+from collections import defaultdict
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from typing import Dict, List, Optional, Tuple
+
+from django.db import transaction
+from django.db.models import F, Window
+from django.db.models.functions import RowNumber
+
+from apps.stocks.history import HistoryBackfill
+from apps.stocks.market_calendar import MarketCalendar, get_market_calendar
+from apps.stocks.models import DailyBar
+from ..models import Portfolio, PortfolioSnapshot
+from .calculation import PortfolioCalculator
+
+CENT = Decimal('0.01')
+
+# Snapshot rows per insert statement
+WRITE_BATCH_SIZE = 1000
+
+# Snapshot invalidations of the current thread waiting for commit
+_invalidated = threading.local()
+
+# (day, ticker, quantity delta, cost basis delta, realized profit delta)
+Event = Tuple[date, str, int, Decimal, Decimal]
+
+
+@dataclass
+class SnapshotResult:
+    """Outcome of SnapshotBuilder.build for one portfolio"""
+    start: Optional[date] = None
+    end: Optional[date] = None
+    written: int = 0
+
+
+class SnapshotBuilder:
+    """Materialize PortfolioSnapshot rows up to a trading day"""
+
+    def __init__(self, end: Optional[date] = None):
+        self.end = end or HistoryBackfill.last_session()
+        self.calendar = get_market_calendar()
+
+    def build(self, portfolio: Portfolio, rebuild: bool = False) -> SnapshotResult:
+        """
+        Write snapshots of a portfolio for the trading days after its last snapshot
+        (all days since its first trade with rebuild) up to the builder's end day,
+        and again from the first day written without a close that is stored now
+        """
+        if rebuild:
+            portfolio.snapshots.all().delete()
+        last = portfolio.snapshots.order_by('-date').values_list('date', flat=True).first()
+        events = self.events(portfolio)
+        if not events:
+            return SnapshotResult()
+        start = last + timedelta(days=1) if last else events[0][0]
+        filled = SnapshotBuilder.first_filled(portfolio, events)
+        if filled and filled < start:
+            start = filled
+        days = self.calendar.trading_days(start, self.end)
+        if not days:
+            return SnapshotResult()
+
+        tickers = sorted({event[1] for event in events})
+        closes = SnapshotBuilder.closes(tickers, days[0], days[-1])
+        quantity = defaultdict(int)
+        cost_basis = defaultdict(Decimal)
+        realized = Decimal('0')
+        # Last stored close of every ticker, carried over days without a bar
+        price = {ticker: closes[ticker].get(None) for ticker in tickers}
+        rows = []
+        position = 0
+        for day in days:
+            for ticker in tickers:
+                price[ticker] = closes[ticker].get(day, price[ticker])
+            while position < len(events) and events[position][0] <= day:
+                _, ticker, shares, cost, profit = events[position]
+                quantity[ticker] += shares
+                cost_basis[ticker] += cost
+                realized += profit
+                position += 1
+            market_value = Decimal('0')
+            missing_closes = 0
+            for ticker, shares in quantity.items():
+                if not shares:
+                    continue
+                if day not in closes[ticker]:
+                    missing_closes += 1
+                # Shares without any stored close are valued at purchase price, as Portfolio.current_value
+                market_value += shares * price[ticker] if price[ticker] is not None else cost_basis[ticker]
+            rows.append(PortfolioSnapshot(
+                portfolio=portfolio,
+                date=day,
+                market_value=market_value.quantize(CENT),
+                cost_basis=sum(cost_basis.values(), Decimal('0')).quantize(CENT),
+                realized_profit=realized.quantize(CENT),
+                missing_closes=missing_closes,
+            ))
+
+        with transaction.atomic():
+            PortfolioSnapshot.objects.bulk_create(
+                rows,
+                batch_size=WRITE_BATCH_SIZE,
+                update_conflicts=True,
+                unique_fields=['portfolio', 'date'],
+                update_fields=['market_value', 'cost_basis', 'realized_profit', 'missing_closes'],
+            )
+        return SnapshotResult(start=days[0], end=days[-1], written=len(rows))
+
+    def events(self, portfolio: Portfolio) -> List[Event]:
+        """Purchases and sales of a portfolio as position changes, ordered by session day"""
+        events = []
+        for lot in PortfolioCalculator.load_lots(portfolio):
+            ticker = lot.ticker.upper()
+            events.append((
+                SnapshotBuilder.session_day(lot.purchase_date, self.calendar), ticker, lot.quantity,
+                lot.purchase_price * lot.quantity, Decimal('0'),
+            ))
+            for sale in lot.sales.all():
+                events.append((
+                    SnapshotBuilder.session_day(sale.sale_date, self.calendar), ticker, -sale.quantity,
+                    -lot.purchase_price * sale.quantity, (sale.sale_price - lot.purchase_price) * sale.quantity,
+                ))
+        events.sort(key=lambda event: event[0])
+        return events
+
+    @staticmethod
+    def first_filled(portfolio: Portfolio, events: List[Event]) -> Optional[date]:
+        """
+        First day written with missing closes that has fewer of them now, None if
+        there is none. Held tickers of those days are replayed from events in memory
+        """
+        incomplete = dict(portfolio.snapshots.filter(missing_closes__gt=0).values_list('date', 'missing_closes'))
+        if not incomplete:
+            return None
+        days = sorted(incomplete)
+        tickers = sorted({event[1] for event in events})
+        stored = set(DailyBar.objects.filter(ticker__in=tickers, date__in=days).values_list('ticker', 'date'))
+        quantity = defaultdict(int)
+        position = 0
+        for day in days:
+            while position < len(events) and events[position][0] <= day:
+                quantity[events[position][1]] += events[position][2]
+                position += 1
+            missing = sum(1 for ticker, shares in quantity.items() if shares and (ticker, day) not in stored)
+            if missing < incomplete[day]:
+                return day
+        return None
+
+    @staticmethod
+    def session_day(moment: datetime, calendar: Optional[MarketCalendar] = None) -> date:
+        """Day of the first session closing at or after moment"""
+        calendar = calendar or get_market_calendar()
+        local = moment.astimezone(calendar.tz)
+        day = local.date()
+        if calendar.is_trading_day(day) and local <= calendar.session(day)[1]:
+            return day
+        day += timedelta(days=1)
+        while not calendar.is_trading_day(day):
+            day += timedelta(days=1)
+        return day
+
+    @staticmethod
+    def closes(tickers: List[str], start: date, end: date) -> Dict[str, Dict[Optional[date], Decimal]]:
+        """
+        Stored closes of tickers from start to end keyed by date, with the last
+        close before start under the None key, in two queries
+        """
+        closes = {ticker: {} for ticker in tickers}
+        bars = DailyBar.objects.filter(ticker__in=tickers, date__range=(start, end)).values_list('ticker', 'date', 'close')
+        for ticker, day, close in bars:
+            closes[ticker][day] = close
+        before = DailyBar.objects.filter(ticker__in=tickers, date__lt=start).annotate(
+            rank=Window(RowNumber(), partition_by=F('ticker'), order_by=F('date').desc()),
+        ).filter(rank=1).values_list('ticker', 'close')
+        for ticker, close in before:
+            closes[ticker][None] = close
+        return closes
+
+    @staticmethod
+    def invalidate(portfolio_id: int, moment: datetime) -> None:
+        """
+        Drop snapshots from the session of moment on, once the transaction commits.
+        Invalidations of a transaction are merged into one delete per portfolio.
+        """
+        day = SnapshotBuilder.session_day(moment)
+        pending = SnapshotBuilder._pending()
+        pending[portfolio_id] = min(day, pending.get(portfolio_id, day))
+        # Registered every time, as callbacks of a rolled back savepoint are discarded
+        transaction.on_commit(SnapshotBuilder._flush)
+
+    @staticmethod
+    def _pending() -> Dict[int, date]:
+        """Earliest invalidated day by portfolio id, waiting for commit"""
+        if not hasattr(_invalidated, 'days'):
+            _invalidated.days = {}
+        return _invalidated.days
+
+    @staticmethod
+    def _flush() -> None:
+        """Delete snapshots of pending invalidations"""
+        pending = SnapshotBuilder._pending()
+        while pending:
+            portfolio_id, day = pending.popitem()
+            PortfolioSnapshot.objects.filter(portfolio_id=portfolio_id, date__gte=day).delete()
+
+    @staticmethod
+    def series(portfolio: Portfolio, start: date, end: date) -> List[PortfolioSnapshot]:
+        """Snapshots of a portfolio from start to end, oldest first"""
+        return list(portfolio.snapshots.filter(date__range=(start, end)).order_by('date'))
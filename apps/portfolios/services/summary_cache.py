@@ -0,0 +1,59 @@
+import time
+from typing import Any, Callable
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from apps.stocks import metrics
+
+
+class SummaryCache:
+    """
+    Cache of computed portfolio summaries.
+    Each portfolio has a version counter bumped on every write to its lots, sales
+    or positions, and when stored prices of its tickers change (PriceRefresher.write).
+    Summaries are cached under that version, so they are reused until then.
+    """
+
+    @staticmethod
+    def version(portfolio_id: int) -> int:
+        """Current data version of a portfolio"""
+        key = f"portfolio_version_{portfolio_id}"
+        version = cache.get(key)
+        if version is None:
+            # Seeded from the clock, so a counter lost from the cache never repeats an old value
+            cache.add(key, time.time_ns() // 1000, None)
+            version = cache.get(key)
+        return version
+
+    @staticmethod
+    def bump(portfolio_id: int) -> None:
+        """
+        Invalidate cached summaries of a portfolio.
+        Bumped again on commit, so a summary computed from data read before the
+        commit is not kept under the new version.
+        """
+        SummaryCache._bump(portfolio_id)
+        transaction.on_commit(lambda: SummaryCache._bump(portfolio_id))
+
+    @staticmethod
+    def get_or_compute(portfolio_id: int, name: str, compute: Callable[[], Any]) -> Any:
+        """Return cached summary called name for the current version, computing it on a miss"""
+        key = f"portfolio_summary_{portfolio_id}_{name}_{SummaryCache.version(portfolio_id)}"
+        summary = cache.get(key)
+        if summary is not None:
+            metrics.incr('portfolio_summary.hit')
+            return summary
+        metrics.incr('portfolio_summary.miss')
+        summary = compute()
+        if summary is not None:
+            cache.set(key, summary, settings.PORTFOLIO_SUMMARY_CACHE_TIMEOUT)
+        return summary
+
+    @staticmethod
+    def _bump(portfolio_id: int) -> None:
+        """Move version of a portfolio forward"""
+        key = f"portfolio_version_{portfolio_id}"
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.add(key, time.time_ns() // 1000, None)
@@ -0,0 +1,114 @@
+"""
+Date-sorted index of the purchases and sales of a portfolio for as-of queries.
+For every ticker the index keeps trade times in order with running totals of
+unsold shares, their cost basis and realized profit after each trade, so the
+holdings at any moment are one binary search per ticker instead of a scan of
+all lots and sales. The index is cached under the portfolio data version and
+rebuilt after any write to the portfolio.
+"""
+from bisect import bisect_right
+from dataclasses import dataclass, field
+from datetime import datetime
+from decimal import Decimal
+from typing import Dict, List
+
+from django.conf import settings
+from django.core.cache import cache
+
+from apps.stocks import metrics
+from ..models import Portfolio
+from .summary_cache import SummaryCache
+
+
+@dataclass
+class TickerTrades:
+    """Trades of one ticker sorted by time, with running totals after each of them"""
+    company_name: str
+    times: List[datetime] = field(default_factory=list)
+    quantity: List[int] = field(default_factory=list)
+    cost_basis: List[Decimal] = field(default_factory=list)
+    realized_profit: List[Decimal] = field(default_factory=list)
+
+
+class TransactionIndex:
+    """Holdings of a portfolio at any moment from cumulative per-ticker arrays"""
+
+    def __init__(self, tickers: Dict[str, TickerTrades]):
+        self.tickers = tickers
+
+    @classmethod
+    def build(cls, portfolio: Portfolio) -> 'TransactionIndex':
+        """Index lots and sales of a portfolio, loaded in two queries"""
+        trades = {}
+        names = {}
+        for lot in portfolio.stocks.prefetch_related('sales'):
+            ticker = lot.ticker.upper()
+            names.setdefault(ticker, lot.company_name)
+            ticker_trades = trades.setdefault(ticker, [])
+            ticker_trades.append((lot.purchase_date, lot.quantity, lot.purchase_price * lot.quantity, Decimal('0')))
+            for sale in lot.sales.all():
+                ticker_trades.append((
+                    sale.sale_date, -sale.quantity, -lot.purchase_price * sale.quantity,
+                    (sale.sale_price - lot.purchase_price) * sale.quantity,
+                ))
+
+        tickers = {}
+        for ticker, ticker_trades in trades.items():
+            index = tickers[ticker] = TickerTrades(company_name=names[ticker])
+            quantity, cost_basis, realized_profit = 0, Decimal('0'), Decimal('0')
+            # A purchase sorts before a sale at the same moment
+            for moment, shares, cost, profit in sorted(ticker_trades, key=lambda trade: (trade[0], trade[1] < 0)):
+                quantity += shares
+                cost_basis += cost
+                realized_profit += profit
+                index.times.append(moment)
+                index.quantity.append(quantity)
+                index.cost_basis.append(cost_basis)
+                index.realized_profit.append(realized_profit)
+        return cls(tickers)
+
+    @classmethod
+    def for_portfolio(cls, portfolio: Portfolio) -> 'TransactionIndex':
+        """Cached index of a portfolio for its current data version, built on a miss"""
+        key = f"portfolio_transactions_{portfolio.id}_{SummaryCache.version(portfolio.id)}"
+        index = cache.get(key)
+        if index is not None:
+            metrics.incr('transaction_index.hit')
+            return index
+        metrics.incr('transaction_index.miss')
+        index = cls.build(portfolio)
+        cache.set(key, index, settings.PORTFOLIO_SUMMARY_CACHE_TIMEOUT)
+        return index
+
+    def holdings(self, moment: datetime) -> List[dict]:
+        """
+        Tickers with unsold shares at moment (trades at moment included), by ticker.
+        Each dict has 'ticker', 'company_name', 'quantity', 'cost_basis',
+        'avg_price' and 'realized_profit' of the ticker up to moment
+        """
+        holdings = []
+        for ticker in sorted(self.tickers):
+            trades = self.tickers[ticker]
+            position = bisect_right(trades.times, moment) - 1
+            if position < 0 or trades.quantity[position] <= 0:
+                continue
+            quantity = trades.quantity[position]
+            cost_basis = trades.cost_basis[position]
+            holdings.append({
+                'ticker': ticker,
+                'company_name': trades.company_name,
+                'quantity': quantity,
+                'cost_basis': cost_basis,
+                'avg_price': cost_basis / quantity,
+                'realized_profit': trades.realized_profit[position],
+            })
+        return holdings
+
+    def realized_profit(self, moment: datetime) -> Decimal:
+        """Realized profit/loss of all sales up to moment, closed tickers included"""
+        total = Decimal('0')
+        for trades in self.tickers.values():
+            position = bisect_right(trades.times, moment) - 1
+            if position >= 0:
+                total += trades.realized_profit[position]
+        return total
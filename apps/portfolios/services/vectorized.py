@@ -0,0 +1,154 @@
+from dataclasses import dataclass
+from decimal import Decimal
+from typing import Any, Dict, Iterable, List
+import numpy as np
+from ..models import Portfolio, StockSale
+
+
+@dataclass
+class LotArrays:
+    """Lots and sales of a portfolio as parallel arrays; money in integer cents"""
+    tickers: List[str]            # ticker of each code
+    ticker_codes: np.ndarray      # per lot, index into tickers
+    quantities: np.ndarray        # per lot
+    purchase_cents: np.ndarray    # per lot
+    current_cents: np.ndarray     # per lot, purchase price where there is no current price
+    sale_lots: np.ndarray         # per sale, index of its lot
+    sale_quantities: np.ndarray   # per sale
+    sale_cents: np.ndarray        # per sale
+
+    @classmethod
+    def from_rows(cls, lots: Iterable[tuple], sales: Iterable[tuple]) -> 'LotArrays':
+        """
+        Build arrays from (id, ticker, quantity, purchase_price, current_price) lot rows
+        and (lot id, quantity, sale_price) sale rows with two decimal place prices
+        """
+        lots = list(lots)
+        sales = list(sales)
+        tickers = list(dict.fromkeys(row[1] for row in lots))
+        codes = {ticker: code for code, ticker in enumerate(tickers)}
+        index = {row[0]: position for position, row in enumerate(lots)}
+        sales = [row for row in sales if row[0] in index]
+        purchase_cents = _cents([row[3] for row in lots])
+        return cls(
+            tickers=tickers,
+            ticker_codes=np.array([codes[row[1]] for row in lots], dtype=np.int64),
+            quantities=np.array([row[2] for row in lots], dtype=np.int64),
+            purchase_cents=purchase_cents,
+            current_cents=np.where(
+                np.array([row[4] is None for row in lots], dtype=bool),
+                purchase_cents,
+                _cents([row[4] or 0 for row in lots]),
+            ),
+            sale_lots=np.array([index[row[0]] for row in sales], dtype=np.int64),
+            sale_quantities=np.array([row[1] for row in sales], dtype=np.int64),
+            sale_cents=_cents([row[2] for row in sales]),
+        )
+
+
+def _cents(values) -> np.ndarray:
+    """
+    Two decimal places amounts as integer cents. Going through float is exact
+    after rounding for amounts below about 10**13.
+    """
+    return np.rint(np.fromiter(map(float, values), dtype=np.float64, count=len(values)) * 100).astype(np.int64)
+
+
+def _money(cents) -> Decimal:
+    """Integer cents as a two decimal places Decimal"""
+    return Decimal(int(cents)).scaleb(-2)
+
+
+class VectorizedCalculator:
+    """
+    NumPy counterpart of PortfolioCalculator for large portfolios.
+    Lots and sales are grouped by ticker with integer cent arithmetic, and only
+    the per-ticker sums are turned into Decimals, so results are identical to
+    the Decimal path of PortfolioCalculator.
+    """
+
+    @staticmethod
+    def load(portfolio: Portfolio) -> LotArrays:
+        """Load lots and sales of a portfolio as arrays in two queries, without model instances"""
+        lots = portfolio.stocks.order_by('id').values_list(
+            'id', 'ticker', 'quantity', 'purchase_price', 'current_price'
+        )
+        sales = StockSale.objects.filter(stock__portfolio=portfolio).values_list(
+            'stock_id', 'quantity', 'sale_price'
+        )
+        return LotArrays.from_rows(lots, sales)
+
+    @staticmethod
+    def aggregate(arrays: LotArrays) -> Dict[str, np.ndarray]:
+        """Per-ticker integer sums; quantities in shares, money in cents"""
+        groups = len(arrays.tickers)
+        lot_count = len(arrays.quantities)
+
+        sold = np.zeros(lot_count, dtype=np.int64)
+        np.add.at(sold, arrays.sale_lots, arrays.sale_quantities)
+        unsold = arrays.quantities - sold
+        # Like PortfolioCalculator, only lots with shares left count as unrealized
+        unsold = np.where(unsold > 0, unsold, 0)
+        sale_codes = arrays.ticker_codes[arrays.sale_lots]
+
+        def by_ticker(codes, values):
+            totals = np.zeros(groups, dtype=np.int64)
+            np.add.at(totals, codes, values)
+            return totals
+
+        return {
+            'total_qty': by_ticker(arrays.ticker_codes, arrays.quantities),
+            'total_sold': by_ticker(arrays.ticker_codes, sold),
+            'invested': by_ticker(arrays.ticker_codes, arrays.purchase_cents * unsold),
+            'current': by_ticker(arrays.ticker_codes, arrays.current_cents * unsold),
+            'sold_invested': by_ticker(sale_codes, arrays.purchase_cents[arrays.sale_lots] * arrays.sale_quantities),
+            'received': by_ticker(sale_codes, arrays.sale_cents * arrays.sale_quantities),
+        }
+
+    @staticmethod
+    def summarize(arrays: LotArrays) -> Dict[str, Any]:
+        """
+        Per-ticker results in the shape of PortfolioCalculator.summarize_lots (without
+        'sales') and portfolio totals in the shape of calculate_portfolio_totals
+        Returns dict with 'tickers' and 'totals'
+        """
+        sums = VectorizedCalculator.aggregate(arrays)
+        tickers = {}
+        for code, ticker in enumerate(arrays.tickers):
+            invested = _money(sums['invested'][code])
+            current = _money(sums['current'][code])
+            sold_invested = _money(sums['sold_invested'][code])
+            received = _money(sums['received'][code])
+            total_qty = int(sums['total_qty'][code])
+            total_sold = int(sums['total_sold'][code])
+            tickers[ticker] = {
+                'total_qty': total_qty,
+                'total_sold': total_sold,
+                'remaining_qty': total_qty - total_sold,
+                'invested': invested,
+                'current': current,
+                'profit': current - invested,
+                'sold_invested': sold_invested,
+                'received': received,
+                'realized_profit': received - sold_invested,
+            }
+
+        total_invested = _money(sums['sold_invested'].sum())
+        total_received = _money(sums['received'].sum())
+        return {
+            'tickers': tickers,
+            'totals': {
+                'available_money': total_received - total_invested,
+                'total_profit': total_received - total_invested,
+                'percent_profit': (
+                    (total_received - total_invested) / total_invested * 100
+                ) if total_invested else 0,
+                'current_value': _money(sums['current'].sum()),
+                'purchase_value': _money(sums['invested'].sum()),
+            },
+        }
+
+    @staticmethod
+    def calculate(portfolio: Portfolio) -> Dict[str, Any]:
+        """Load a portfolio and summarize it"""
+        return VectorizedCalculator.summarize(VectorizedCalculator.load(portfolio))
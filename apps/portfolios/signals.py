@@ -0,0 +1,88 @@
+import threading
+from datetime import datetime
+from typing import Optional
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+from .models import Stock, StockSale
+from .services.snapshots import SnapshotBuilder
+from .services.summary_cache import SummaryCache
+
+# Portfolio ids of lots being deleted, so their cascaded sales need no query
+_deleting = threading.local()
+
+
+def _deleting_lots() -> dict:
+    if not hasattr(_deleting, 'lots'):
+        _deleting.lots = {}
+    return _deleting.lots
+
+
+def _portfolio_of(sale: StockSale) -> int:
+    """Portfolio id of a sale, without a query when its lot is loaded or being deleted"""
+    lots = _deleting_lots()
+    if sale.stock_id in lots:
+        return lots[sale.stock_id]
+    return sale.stock.portfolio_id
+
+
+def _edited_since(instance) -> Optional[datetime]:
+    """
+    Earlier of the old and new time of a lot or sale whose save changed its
+    quantity, price or time, None if the save changed none of them
+    """
+    loaded = getattr(instance, 'loaded_trade', None)
+    trade = instance.trade()
+    instance.loaded_trade = trade
+    if loaded == trade:
+        return None
+    return min(moment for moment in (trade[-1], loaded and loaded[-1]) if moment)
+
+
+@receiver([post_save, post_delete], sender=Stock)
+def stock_changed(sender, instance, **kwargs):
+    """Invalidate cached summaries of the portfolio a lot belongs to"""
+    SummaryCache.bump(instance.portfolio_id)
+
+
+@receiver([post_save, post_delete], sender=StockSale)
+def sale_changed(sender, instance, **kwargs):
+    """Invalidate cached summaries of the portfolio a sale belongs to"""
+    SummaryCache.bump(_portfolio_of(instance))
+
+
+@receiver(post_save, sender=Stock)
+def stock_saved(sender, instance, created, **kwargs):
+    """Drop portfolio snapshots an edited lot was part of; new lots count from the next session"""
+    since = _edited_since(instance)
+    if since and not created:
+        SnapshotBuilder.invalidate(instance.portfolio_id, since)
+
+
+@receiver(post_save, sender=StockSale)
+def sale_saved(sender, instance, created, **kwargs):
+    """Drop portfolio snapshots an edited sale was part of; new sales count from the next session"""
+    since = _edited_since(instance)
+    if since and not created:
+        SnapshotBuilder.invalidate(_portfolio_of(instance), since)
+
+
+@receiver(pre_delete, sender=Stock)
+def stock_deleting(sender, instance, **kwargs):
+    """Remember the portfolio of a lot before its sales are deleted with it"""
+    _deleting_lots()[instance.pk] = instance.portfolio_id
+
+
+@receiver(post_delete, sender=Stock)
+def stock_deleted(sender, instance, **kwargs):
+    """Drop portfolio snapshots from the day the deleted lot was bought"""
+    _deleting_lots().pop(instance.pk, None)
+    SnapshotBuilder.invalidate(instance.portfolio_id, instance.purchase_date)
+
+
+@receiver(post_delete, sender=StockSale)
+def sale_deleted(sender, instance, **kwargs):
+    """Drop portfolio snapshots from the day the deleted sale was made"""
+    if instance.stock_id in _deleting_lots():
+        # The lot goes too and drops snapshots from its earlier purchase day
+        return
+    SnapshotBuilder.invalidate(_portfolio_of(instance), instance.sale_date)
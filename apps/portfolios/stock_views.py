@@ -1,7 +1,10 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
+from django.db import transaction
 from .models import Portfolio, Stock
+from .services.ledger import PositionLedger
+from apps.stocks.refresh import PriceRefresher
 
 
 @login_required
@@ -51,13 +54,17 @@ def add_stock(request, portfolio_id):
                     if total_value > 10000000:  # $10M limit
                         messages.error(request, 'Total position value cannot exceed $10,000,000.')
                     else:
-                        stock = Stock.objects.create(
-                            portfolio=portfolio,
-                            ticker=ticker,
-                            company_name=company_name,
-                            quantity=quantity,
-                            purchase_price=purchase_price
-                        )
+                        with transaction.atomic():
+                            stock = Stock.objects.create(
+                                portfolio=portfolio,
+                                ticker=ticker,
+                                company_name=company_name,
+                                quantity=quantity,
+                                purchase_price=purchase_price
+                            )
+                            PositionLedger.record_purchase(stock)
+                        # A new ticker gets its stored price now, not at the next refresh
+                        PriceRefresher.store_missing([ticker])
                         messages.success(request, f'Added {quantity} shares of {ticker}')
                         return redirect('portfolios:portfolio_detail', portfolio_id=portfolio.id)
     
@@ -70,6 +77,8 @@ def delete_stock(request, portfolio_id, stock_id):
     portfolio = get_object_or_404(Portfolio, id=portfolio_id, user=request.user)
     stock = get_object_or_404(Stock, id=stock_id, portfolio=portfolio)
     
-    stock.delete()
+    with transaction.atomic():
+        PositionLedger.remove_lot(stock)
+        stock.delete()
     messages.success(request, f'Removed {stock.ticker} from portfolio')
     return redirect('portfolios:portfolio_detail', portfolio_id=portfolio.id) 
\ No newline at end of file
@@ -1,3 +1,832 @@
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from io import StringIO
+from unittest import mock
+from zoneinfo import ZoneInfo
+
+from django.contrib.auth import get_user_model
+from django.core.management import CommandError, call_command
+from django.core.cache import cache
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from apps.stocks.models import DailyBar, PriceQuote
+from apps.stocks.refresh import PriceRefresher
+from apps.stocks.services import StockPriceService
+
+from .models import Portfolio, PortfolioSnapshot, Position, Stock, StockSale
+from .services.calculation import PortfolioCalculator
+from .services import lot_matching
+from .services.ledger import PositionLedger
+from .services.lot_matching import LotMatcher, LotMatchingError
+from .services.pnl_engine import PnLEngine
+from .services.snapshots import SnapshotBuilder
+from .services.vectorized import VectorizedCalculator
+
+
+def set_price(ticker, price):
+    """Сохранить текущую цену тикера"""
+    PriceQuote.objects.update_or_create(ticker=ticker, defaults={'price': Decimal(price), 'as_of': timezone.now()})
+
+
+def new_york(*args):
+    """Момент времени по нью-йоркскому времени"""
+    return datetime(*args, tzinfo=ZoneInfo('America/New_York'))
+
+
+@mock.patch('apps.portfolios.services.calculation.StockPriceService.get_stock_quote', return_value=None)
+@mock.patch('apps.portfolios.services.calculation.StockPriceService.get_company_overview', return_value={})
+@mock.patch('apps.portfolios.services.calculation.StockPriceService.get_company_overviews', return_value={})
+@mock.patch('apps.portfolios.services.calculation.StockPriceService.get_stock_quotes', return_value={})
+class PortfolioCalculatorTest(TestCase):
+    def setUp(self):
+        user = get_user_model().objects.create_user(email='calc@example.com', password='testpass123')
+        self.portfolio = Portfolio.objects.create(user=user, name='Main')
+
+    def add_lots(self, count, ticker='AAPL'):
+        """Создать count лотов по 10 акций, каждый с одной продажей 4 акций"""
+        set_price(ticker, '110.00')
+        for i in range(count):
+            stock = Stock.objects.create(
+                portfolio=self.portfolio, ticker=ticker, company_name=ticker, quantity=10,
+                purchase_price=Decimal('100.00'),
+            )
+            StockSale.objects.create(stock=stock, quantity=4, sale_price=Decimal('120.00'))
+
+    def test_summary_values(self, *mocks):
+        """Сводка считает нереализованную и реализованную прибыль за один проход"""
+        self.add_lots(2)
+        Stock.objects.create(
+            portfolio=self.portfolio, ticker='MSFT', company_name='MSFT', quantity=5,
+            purchase_price=Decimal('50.00'),
+        )
+        closed = Stock.objects.create(
+            portfolio=self.portfolio, ticker='TSLA', company_name='TSLA', quantity=3,
+            purchase_price=Decimal('200.00'),
+        )
+        StockSale.objects.create(stock=closed, quantity=3, sale_price=Decimal('150.00'))
+
+        summary = PortfolioCalculator.calculate_portfolio_summary(self.portfolio)
+
+        active = {item['ticker']: item for item in summary['active']}
+        self.assertEqual(set(active), {'AAPL', 'MSFT'})
+        self.assertEqual(active['AAPL']['remaining_qty'], 12)
+        self.assertEqual(active['AAPL']['total_sold'], 8)
+        self.assertEqual(active['AAPL']['avg_price'], Decimal('100'))
+        self.assertEqual(active['AAPL']['profit'], Decimal('120'))
+        self.assertEqual(active['AAPL']['current_value'], Decimal('1320'))
+        self.assertEqual(active['MSFT']['profit'], Decimal('0'))
+
+        [history] = summary['history']
+        self.assertEqual(history['ticker'], 'TSLA')
+        self.assertEqual(history['profit'], Decimal('-150'))
+        self.assertEqual(history['total_received'], Decimal('450'))
+
+        totals = summary['totals']
+        self.assertEqual(totals['total_profit'], Decimal('10'))
+        self.assertEqual(totals['available_money'], Decimal('10'))
+        self.assertEqual(totals['current_value'], self.portfolio.current_value())
+        self.assertEqual(totals['purchase_value'], self.portfolio.purchase_value())
+
+    def test_summary_query_count_is_constant(self, *mocks):
+        """Число запросов сводки не зависит от числа лотов и продаж"""
+        self.add_lots(3)
+        with self.assertNumQueries(2):
+            PortfolioCalculator.calculate_portfolio_summary(self.portfolio)
+
+        self.add_lots(50)
+        self.add_lots(50, ticker='MSFT')
+        with self.assertNumQueries(2):
+            PortfolioCalculator.calculate_portfolio_summary(self.portfolio)
+
+    def test_ticker_detail_query_count_is_constant(self, *mocks):
+        """Страница тикера загружает лоты и продажи двумя запросами"""
+        self.add_lots(40)
+        with self.assertNumQueries(2):
+            detail = PortfolioCalculator.calculate_ticker_detail_summary(self.portfolio, 'AAPL')
+        self.assertEqual(detail['remaining_qty'], 240)
+        self.assertEqual(len(detail['all_sales']), 40)
+
+    def test_portfolio_values_query_count_is_constant(self, *mocks):
+        """Стоимость портфеля считается без запроса на каждый лот"""
+        self.add_lots(30)
+        with self.assertNumQueries(2):
+            self.assertEqual(self.portfolio.current_value(), Decimal('19800'))
+        with self.assertNumQueries(2):
+            self.assertEqual(self.portfolio.total_value(), Decimal('22200'))
+
+
+class PortfolioListTest(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(email='list@example.com', password='testpass123')
+        self.client.force_login(self.user)
+
+    def add_portfolio(self, name):
+        """Создать портфель с открытым, частично проданным и закрытым лотами"""
+        portfolio = Portfolio.objects.create(user=self.user, name=name)
+        set_price('AAPL', '110.00')
+        set_price('TSLA', '250.00')
+        Stock.objects.create(
+            portfolio=portfolio, ticker='AAPL', company_name='Apple', quantity=10,
+            purchase_price=Decimal('100.00'),
+        )
+        partly_sold = Stock.objects.create(
+            portfolio=portfolio, ticker='MSFT', company_name='Microsoft', quantity=5,
+            purchase_price=Decimal('50.00'),
+        )
+        StockSale.objects.create(stock=partly_sold, quantity=2, sale_price=Decimal('60.00'))
+        closed = Stock.objects.create(
+            portfolio=portfolio, ticker='TSLA', company_name='Tesla', quantity=3,
+            purchase_price=Decimal('200.00'),
+        )
+        StockSale.objects.create(stock=closed, quantity=3, sale_price=Decimal('150.00'))
+        return portfolio
+
+    def test_annotations_match_instance_methods(self):
+        """Аннотации совпадают с расчетом методами модели"""
+        portfolio = self.add_portfolio('Main')
+        Portfolio.objects.create(user=self.user, name='Empty')
+
+        for annotated in Portfolio.objects.with_values():
+            plain = Portfolio.objects.get(pk=annotated.pk)
+            self.assertEqual(annotated.current_value(), plain.current_value())
+            self.assertEqual(annotated.total_value(), plain.total_value())
+        annotated = Portfolio.objects.with_values().get(pk=portfolio.pk)
+        self.assertEqual(annotated.annotated_realized_profit, Decimal('-130'))
+        self.assertEqual(annotated.total_value(), Decimal('1100') + Decimal('150') - Decimal('130'))
+
+    def test_list_query_count_is_constant(self):
+        """Число запросов страницы списка не зависит от числа портфелей"""
+        self.add_portfolio('First')
+        with CaptureQueriesContext(connection) as one:
+            response = self.client.get(reverse('portfolios:portfolio_list'))
+        self.assertContains(response, 'Total Value: $1120.00')
+
+        for i in range(10):
+            self.add_portfolio(f'Portfolio {i}')
+        with CaptureQueriesContext(connection) as many:
+            self.client.get(reverse('portfolios:portfolio_list'))
+        self.assertEqual(len(many), len(one))
+
+
+@mock.patch('apps.portfolios.services.calculation.StockPriceService.get_company_overviews', return_value={})
+@mock.patch('apps.portfolios.services.calculation.StockPriceService.get_stock_quotes', return_value={})
+class PositionLedgerTest(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(email='ledger@example.com', password='testpass123')
+        self.client.force_login(self.user)
+        self.portfolio = Portfolio.objects.create(user=self.user, name='Main')
+
+    def buy(self, ticker, quantity, price):
+        self.client.post(reverse('portfolios:add_stock', args=[self.portfolio.id]), {
+            'ticker': ticker, 'company_name': f'{ticker} Inc', 'quantity': quantity, 'purchase_price': price,
+        })
+        return Stock.objects.filter(portfolio=self.portfolio, ticker=ticker).latest('id')
+
+    def sell(self, ticker, quantity, price):
+        self.client.post(reverse('portfolios:sell_ticker', args=[self.portfolio.id, ticker]), {
+            'quantity': quantity, 'sale_price': price,
+        })
+
+    def test_buy_and_sell_update_position(self, *mocks):
+        """Покупки и продажи обновляют позицию так же, как пересчет по лотам"""
+        self.buy('AAPL', 10, '100.50')
+        self.buy('AAPL', 5, '120')
+        self.sell('AAPL', 12, '130.25')
+
+        position = Position.objects.get(portfolio=self.portfolio, ticker='AAPL')
+        self.assertEqual(position.quantity, 3)
+        self.assertEqual(position.cost_basis, Decimal('360.00'))
+        self.assertEqual(position.realized_proceeds, Decimal('1563.00'))
+        self.assertEqual(position.realized_profit, Decimal('1563.00') - Decimal('1005.00') - Decimal('240.00'))
+        self.assertEqual(PositionLedger.verify(self.portfolio), [])
+
+    def test_deletions_update_position(self, *mocks):
+        """Удаление лота и истории убирает его из позиции"""
+        first = self.buy('AAPL', 10, '100')
+        self.buy('AAPL', 5, '120')
+        StockSale.objects.create(stock=first, quantity=4, sale_price=Decimal('110'))
+        PositionLedger.rebuild(self.portfolio)
+
+        self.client.post(reverse('portfolios:delete_stock', args=[self.portfolio.id, first.id]))
+        position = Position.objects.get(portfolio=self.portfolio, ticker='AAPL')
+        self.assertEqual((position.quantity, position.cost_basis), (5, Decimal('600.00')))
+        self.assertEqual(position.realized_profit, Decimal('0'))
+        self.assertEqual(PositionLedger.verify(self.portfolio), [])
+
+        self.buy('MSFT', 2, '50')
+        self.sell('MSFT', 2, '60')
+        self.client.get(reverse('portfolios:delete_history_ticker', args=[self.portfolio.id, 'MSFT']))
+        self.assertFalse(Position.objects.filter(ticker='MSFT').exists())
+
+        last = Stock.objects.get(portfolio=self.portfolio, ticker='AAPL')
+        self.client.post(reverse('portfolios:delete_stock', args=[self.portfolio.id, last.id]))
+        self.assertFalse(self.portfolio.positions.exists())
+
+    def test_rebuild_command_reconciles_drift(self, *mocks):
+        """Команда сверки находит и исправляет расхождения с лотами"""
+        self.buy('AAPL', 10, '100')
+        Stock.objects.create(
+            portfolio=self.portfolio, ticker='MSFT', company_name='Microsoft', quantity=3,
+            purchase_price=Decimal('50'),
+        )
+        Position.objects.filter(ticker='AAPL').update(quantity=7)
+
+        with self.assertRaises(CommandError):
+            call_command('rebuild_positions', check=True, stdout=StringIO())
+        call_command('rebuild_positions', stdout=StringIO())
+        self.assertEqual(PositionLedger.verify(self.portfolio), [])
+        self.assertEqual(Position.objects.get(ticker='AAPL').quantity, 10)
+        self.assertEqual(Position.objects.get(ticker='MSFT').cost_basis, Decimal('150.00'))
+
+    def test_position_summary_uses_stored_price(self, quotes, overview):
+        """Сводка по позициям берет цену из PriceQuote, а котировки и описания компаний для показа одним пакетом"""
+        self.buy('AAPL', 10, '100')
+        set_price('AAPL', '150')
+        quotes.reset_mock()
+        overview.reset_mock()
+        quotes.return_value = {'AAPL': {'price': Decimal('999')}}
+        with mock.patch.object(StockPriceService, 'get_stock_prices') as prices:
+            summary = PortfolioCalculator.calculate_position_summary(self.portfolio)
+        prices.assert_not_called()
+        quotes.assert_called_once_with(['AAPL'])
+        overview.assert_called_once_with(['AAPL'])
+        self.assertEqual(summary['totals']['current_value'], Decimal('1500'))
+        listed = Portfolio.objects.with_values().get(pk=self.portfolio.pk)
+        self.assertEqual(listed.current_value(), summary['totals']['current_value'])
+
+    def test_new_ticker_gets_stored_price(self, quotes, overview):
+        """Покупка нового тикера сразу сохраняет его цену, известный тикер не перезапрашивается"""
+        quotes.return_value = {'NVDA': {'price': Decimal('120.5'), 'previous_close': None}}
+        self.buy('NVDA', 2, '100')
+        self.assertEqual(PriceQuote.objects.get(ticker='NVDA').price, Decimal('120.50'))
+        quotes.assert_called_once_with(['NVDA'])
+
+        self.buy('NVDA', 1, '110')
+        quotes.assert_called_once()
+
+    def test_position_summary_matches_lot_summary(self, *mocks):
+        """Сводка по позициям совпадает со сводкой по лотам и читает одну таблицу"""
+        self.buy('AAPL', 10, '100')
+        self.buy('AAPL', 5, '120')
+        self.buy('MSFT', 3, '50')
+        self.buy('TSLA', 2, '200')
+        self.sell('AAPL', 12, '130')
+        self.sell('TSLA', 2, '150')
+
+        with mock.patch('apps.portfolios.services.calculation.StockPriceService.get_stock_quote', return_value=None):
+            from_lots = PortfolioCalculator.calculate_portfolio_summary(self.portfolio)
+        with self.assertNumQueries(1):
+            from_positions = PortfolioCalculator.calculate_position_summary(self.portfolio)
+
+        self.assertEqual(from_positions['totals'], from_lots['totals'])
+        self.assertEqual([position.ticker for position in from_positions['history']], ['TSLA'])
+        for lots_item, position_item in zip(from_lots['active'], from_positions['active']):
+            for key in ('ticker', 'company_name', 'remaining_qty', 'avg_price', 'profit', 'current_value'):
+                self.assertEqual(position_item[key], lots_item[key])
+
+
+class LotMatcherTest(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(email='lots@example.com', password='testpass123')
+        self.client.force_login(self.user)
+        self.portfolio = Portfolio.objects.create(user=self.user, name='Main')
+        self.lots = [
+            self.add_lot(10, '100'),
+            self.add_lot(10, '150'),
+            self.add_lot(10, '120'),
+        ]
+        PositionLedger.rebuild(self.portfolio)
+
+    def add_lot(self, quantity, price):
+        return Stock.objects.create(
+            portfolio=self.portfolio, ticker='AAPL', company_name='Apple', quantity=quantity,
+            purchase_price=Decimal(price),
+        )
+
+    def remaining(self):
+        """Непроданные количества по лотам в порядке покупки"""
+        return [lot.available_quantity() for lot in self.lots]
+
+    def test_methods(self):
+        """FIFO, LIFO, HIFO и конкретные лоты распределяют продажу по-разному"""
+        cases = [
+            (lot_matching.FIFO, None, [0, 5, 10]),
+            (lot_matching.LIFO, None, [10, 5, 0]),
+            (lot_matching.HIFO, None, [10, 0, 5]),
+            (lot_matching.SPECIFIC, [self.lots[2].id, self.lots[0].id], [5, 10, 0]),
+        ]
+        for method, lot_ids, remaining in cases:
+            with self.subTest(method=method):
+                StockSale.objects.all().delete()
+                PositionLedger.rebuild(self.portfolio)
+                LotMatcher.sell(self.portfolio, 'AAPL', 15, 130, method=method, lot_ids=lot_ids)
+                self.assertEqual(self.remaining(), remaining)
+                self.assertEqual(PositionLedger.verify(self.portfolio), [])
+
+    def test_oversell_writes_nothing(self):
+        """Продажа больше доступного отклоняется без записи продаж"""
+        LotMatcher.sell(self.portfolio, 'AAPL', 25, 130)
+        with self.assertRaises(LotMatchingError):
+            LotMatcher.sell(self.portfolio, 'AAPL', 6, 130)
+        with self.assertRaises(LotMatchingError):
+            LotMatcher.sell(self.portfolio, 'AAPL', 3, 130, method=lot_matching.SPECIFIC, lot_ids=[self.lots[0].id])
+        self.assertEqual(StockSale.objects.count(), 3)
+        self.assertEqual(Position.objects.get(ticker='AAPL').quantity, 5)
+
+    def test_sell_query_count_is_constant(self):
+        """Число запросов продажи не зависит от числа лотов"""
+        with CaptureQueriesContext(connection) as few:
+            LotMatcher.sell(self.portfolio, 'AAPL', 25, 130)
+
+        for i in range(30):
+            self.lots.append(self.add_lot(10, '110'))
+        PositionLedger.rebuild(self.portfolio)
+        with CaptureQueriesContext(connection) as many:
+            LotMatcher.sell(self.portfolio, 'AAPL', 250, 130)
+        self.assertEqual(len(many), len(few))
+        self.assertEqual(sum(self.remaining()), 55)
+
+    def test_sell_ticker_view_uses_chosen_method(self):
+        """Страница продажи тикера продает по выбранному методу"""
+        url = reverse('portfolios:sell_ticker', args=[self.portfolio.id, 'AAPL'])
+        response = self.client.post(url, {'quantity': 12, 'sale_price': '130', 'method': lot_matching.HIFO})
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(self.remaining(), [10, 0, 8])
+
+        response = self.client.post(url, {'quantity': 50, 'sale_price': '130'})
+        self.assertContains(response, 'You can sell up to 18 shares.')
+
+
+@mock.patch.object(StockPriceService, 'get_company_overview', return_value={})
+@mock.patch.object(StockPriceService, 'get_company_overviews', return_value={})
+@mock.patch.object(StockPriceService, 'get_stock_quotes', return_value={})
+@mock.patch.object(StockPriceService, 'get_stock_quote', return_value=None)
+class SummaryCacheTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = get_user_model().objects.create_user(email='summary@example.com', password='testpass123')
+        self.client.force_login(self.user)
+        self.portfolio = Portfolio.objects.create(user=self.user, name='Main')
+        self.stock = Stock.objects.create(
+            portfolio=self.portfolio, ticker='AAPL', company_name='Apple', quantity=10,
+            purchase_price=Decimal('100'),
+        )
+        PositionLedger.rebuild(self.portfolio)
+
+    def view(self, name, *args):
+        return self.client.get(reverse(f'portfolios:{name}', args=[self.portfolio.id, *args]))
+
+    def test_unchanged_portfolio_is_not_recomputed(self, *mocks):
+        """Повторный просмотр неизменного портфеля берет сводки из кэша"""
+        calculate = mock.patch.object(
+            PortfolioCalculator, 'calculate_position_summary',
+            wraps=PortfolioCalculator.calculate_position_summary,
+        )
+        detail = mock.patch.object(
+            PortfolioCalculator, 'calculate_ticker_detail_summary',
+            wraps=PortfolioCalculator.calculate_ticker_detail_summary,
+        )
+        with calculate as position_summary, detail as ticker_summary:
+            for _ in range(3):
+                self.assertEqual(self.view('portfolio_detail').status_code, 200)
+                self.assertEqual(self.view('ticker_detail', 'AAPL').status_code, 200)
+        self.assertEqual(position_summary.call_count, 1)
+        self.assertEqual(ticker_summary.call_count, 1)
+
+    def test_writes_and_quotes_invalidate_summary(self, *mocks):
+        """Изменение лотов, продаж или сохраненных цен тикеров портфеля сбрасывает кэш сводки"""
+        self.view('portfolio_detail')
+
+        self.client.post(reverse('portfolios:add_stock', args=[self.portfolio.id]), {
+            'ticker': 'MSFT', 'company_name': 'Microsoft', 'quantity': 5, 'purchase_price': '50',
+        })
+        response = self.view('portfolio_detail')
+        self.assertEqual([item['ticker'] for item in response.context['summary']], ['AAPL', 'MSFT'])
+
+        LotMatcher.sell(self.portfolio, 'MSFT', 5, 60)
+        response = self.view('portfolio_detail')
+        self.assertEqual(len(response.context['history']), 1)
+        self.assertEqual(response.context['total_profit'], Decimal('50'))
+
+        StockSale.objects.filter(stock__ticker='MSFT').update(sale_price=Decimal('70'))
+        PositionLedger.rebuild(self.portfolio)
+        self.assertEqual(self.view('portfolio_detail').context['total_profit'], Decimal('100'))
+
+        with mock.patch.object(PortfolioCalculator, 'calculate_position_summary',
+                               wraps=PortfolioCalculator.calculate_position_summary) as position_summary:
+            self.view('portfolio_detail')
+            # Quotes of tickers the portfolio does not hold leave its summary alone
+            StockPriceService.invalidate(['TSLA'])
+            PriceRefresher.write({'TSLA': {'price': Decimal('200')}})
+            self.view('portfolio_detail')
+            self.assertEqual(position_summary.call_count, 0)
+            PriceRefresher.write({'AAPL': {'price': Decimal('130')}})
+            self.view('portfolio_detail')
+        self.assertEqual(position_summary.call_count, 1)
+
+    def test_page_views_do_not_write(self, *mocks):
+        """Просмотр страниц портфеля не записывает цены в базу"""
+        set_price('AAPL', '120.00')
+        with CaptureQueriesContext(connection) as queries:
+            self.view('portfolio_detail')
+            self.view('portfolio_history')
+            response = self.view('ticker_detail', 'AAPL')
+        self.assertContains(response, '$120.00')
+        writes = [q['sql'] for q in queries if q['sql'].split()[0].upper() in ('INSERT', 'UPDATE', 'DELETE')]
+        self.assertEqual(writes, [])
+
+
+class PnLEngineTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        user = get_user_model().objects.create_user(email='pnl@example.com', password='testpass123')
+        self.first = Portfolio.objects.create(user=user, name='First')
+        self.second = Portfolio.objects.create(user=user, name='Second')
+        for portfolio, ticker, quantity, price in [
+            (self.first, 'AAPL', 10, '100'),
+            (self.first, 'MSFT', 4, '50'),
+            (self.second, 'MSFT', 6, '60'),
+            (self.second, 'TSLA', 2, '200'),
+        ]:
+            Stock.objects.create(
+                portfolio=portfolio, ticker=ticker, company_name=ticker, quantity=quantity,
+                purchase_price=Decimal(price),
+            )
+        LotMatcher.sell(self.second, 'TSLA', 2, 250)
+        for portfolio in (self.first, self.second):
+            PositionLedger.rebuild(portfolio)
+        self.engine = PnLEngine()
+        self.engine.load([self.first.id, self.second.id], prices={'AAPL': 110.0, 'MSFT': 55.0})
+
+    def test_ticks_update_only_holders(self):
+        """Тик меняет итоги только портфелей, которые держат тикер"""
+        self.assertEqual(self.engine.apply_ticks({'aapl': 120.0}), {self.first.id: 100.0})
+        self.assertEqual(self.engine.apply_ticks({'MSFT': 50.0, 'NVDA': 1.0}), {
+            self.first.id: -20.0, self.second.id: -30.0,
+        })
+
+        first = self.engine.totals(self.first.id)
+        self.assertEqual(first['current_value'], 1400.0)
+        self.assertEqual(first['unrealized_profit'], 200.0)
+        second = self.engine.totals(self.second.id)
+        self.assertEqual(second['current_value'], 300.0)
+        self.assertEqual(second['unrealized_profit'], -60.0)
+        self.assertEqual(second['total_profit'], 100.0)
+
+    def test_totals_match_calculator(self):
+        """Итоги после тиков совпадают с полным пересчетом калькулятором"""
+        self.engine.apply_ticks({'AAPL': 123.45, 'MSFT': 61.1})
+        set_price('AAPL', '123.45')
+        set_price('MSFT', '61.1')
+        with mock.patch.object(StockPriceService, 'get_stock_quotes', return_value={}), \
+                mock.patch.object(StockPriceService, 'get_company_overviews', return_value={}):
+            for portfolio in (self.first, self.second):
+                expected = PortfolioCalculator.calculate_position_summary(portfolio)['totals']
+                totals = self.engine.totals(portfolio.id)
+                self.assertAlmostEqual(totals['current_value'], float(expected['current_value']))
+                self.assertAlmostEqual(totals['purchase_value'], float(expected['purchase_value']))
+                self.assertAlmostEqual(totals['total_profit'], float(expected['total_profit']))
+
+    def test_refresh_changed_rebuilds_written_portfolios(self):
+        """После записи в портфель перестраивается только его книга с текущими ценами"""
+        self.engine.apply_ticks({'MSFT': 70.0})
+        LotMatcher.sell(self.first, 'AAPL', 10, 130)
+
+        with self.assertNumQueries(1):
+            self.assertEqual(self.engine.refresh_changed(), [self.first.id])
+        first = self.engine.totals(self.first.id)
+        self.assertEqual(first['current_value'], 280.0)
+        self.assertEqual(first['total_profit'], 300.0)
+        self.assertEqual(self.engine.apply_ticks({'AAPL': 1.0}), {})
+        self.assertEqual(self.engine.refresh_changed(), [])
+
+
+class VectorizedCalculatorTest(TestCase):
+    def setUp(self):
+        user = get_user_model().objects.create_user(email='numpy@example.com', password='testpass123')
+        self.portfolio = Portfolio.objects.create(user=user, name='Main')
+
+    def test_results_match_decimal_path(self):
+        """Результаты NumPy совпадают с расчетом в Decimal"""
+        rows = [
+            ('AAPL', 10, '100.07', [(4, '120.01'), (6, '99.99')]),
+            ('AAPL', 7, '101.50', [(2, '130.00')]),
+            ('MSFT', 3, '50.33', []),
+            ('NVDA', 4, '80.00', [(1, '90.00')]),
+            ('TSLA', 5, '200.00', [(5, '150.55')]),
+        ]
+        # NVDA has no stored price and is valued at purchase price
+        for ticker, current in [('AAPL', '110.13'), ('MSFT', '49.10'), ('TSLA', '250.00')]:
+            set_price(ticker, current)
+        for ticker, quantity, price, sales in rows:
+            stock = Stock.objects.create(
+                portfolio=self.portfolio, ticker=ticker, company_name=ticker, quantity=quantity,
+                purchase_price=Decimal(price),
+            )
+            for sold, sale_price in sales:
+                StockSale.objects.create(stock=stock, quantity=sold, sale_price=Decimal(sale_price))
+
+        with self.assertNumQueries(2):
+            result = VectorizedCalculator.calculate(self.portfolio)
+
+        lots = PortfolioCalculator.load_lots(self.portfolio)
+        expected = {
+            ticker: PortfolioCalculator.summarize_lots([lot for lot in lots if lot.ticker == ticker])
+            for ticker in ('AAPL', 'MSFT', 'NVDA', 'TSLA')
+        }
+        self.assertEqual(list(result['tickers']), ['AAPL', 'MSFT', 'NVDA', 'TSLA'])
+        for ticker, lots_summary in expected.items():
+            summary = result['tickers'][ticker]
+            for key in summary:
+                self.assertEqual(summary[key], lots_summary[key], f'{ticker} {key}')
+            self.assertEqual(PortfolioCalculator._profit_loss(summary), PortfolioCalculator._profit_loss(lots_summary))
+        self.assertEqual(
+            result['totals'],
+            PortfolioCalculator.calculate_portfolio_totals(self.portfolio, lot_summaries=list(expected.values())),
+        )
+
+    def test_empty_portfolio(self):
+        """Пустой портфель дает нулевые итоги"""
+        result = VectorizedCalculator.calculate(self.portfolio)
+        self.assertEqual(result['tickers'], {})
+        self.assertEqual(result['totals']['current_value'], Decimal('0'))
+        self.assertEqual(result['totals']['percent_profit'], 0)
+
+    def test_benchmark_command_checks_results(self):
+        """Команда бенчмарка сверяет оба расчета на синтетическом портфеле"""
+        out = StringIO()
+        call_command('benchmark_calculation', lots=[300], tickers=20, stdout=out)
+        self.assertIn('300 lots', out.getvalue())
+
+
+
+class HoldingsAsOfTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = get_user_model().objects.create_user(email='asof@example.com', password='testpass123')
+        self.portfolio = Portfolio.objects.create(user=self.user, name='Main')
+        first = self.add_lot('AAPL', 10, '100', new_york(2026, 10, 5, 10, 0))
+        second = self.add_lot('AAPL', 5, '110', new_york(2026, 10, 6, 11, 0))
+        self.add_lot('MSFT', 3, '50', new_york(2026, 10, 6, 12, 0))
+        self.add_sale(first, 10, '120', new_york(2026, 10, 7, 10, 0))
+        self.add_sale(second, 2, '130', new_york(2026, 10, 8, 10, 0))
+
+    def add_lot(self, ticker, quantity, price, bought):
+        """Создать лот, купленный в указанный момент"""
+        stock = Stock.objects.create(
+            portfolio=self.portfolio, ticker=ticker, company_name=ticker, quantity=quantity,
+            purchase_price=Decimal(price),
+        )
+        Stock.objects.filter(pk=stock.pk).update(purchase_date=bought)
+        return stock
+
+    def add_sale(self, stock, quantity, price, sold):
+        """Создать продажу, сделанную в указанный момент"""
+        sale = StockSale.objects.create(stock=stock, quantity=quantity, sale_price=Decimal(price))
+        StockSale.objects.filter(pk=sale.pk).update(sale_date=sold)
+
+    def held(self, as_of):
+        """Количество и стоимость покупки по тикерам на дату"""
+        result = PortfolioCalculator.holdings_as_of(self.portfolio, as_of)
+        return {item['ticker']: (item['quantity'], item['cost_basis']) for item in result['holdings']}
+
+    def test_holdings_on_dates(self):
+        """Состав портфеля на дату учитывает покупки и продажи до конца этого дня"""
+        self.assertEqual(self.held(date(2026, 10, 4)), {})
+        self.assertEqual(self.held(date(2026, 10, 5)), {'AAPL': (10, Decimal('1000'))})
+        self.assertEqual(self.held(date(2026, 10, 6)), {'AAPL': (15, Decimal('1550')), 'MSFT': (3, Decimal('150'))})
+        self.assertEqual(self.held(new_york(2026, 10, 6, 11, 30)), {'AAPL': (15, Decimal('1550'))})
+        self.assertEqual(self.held(date(2026, 10, 7)), {'AAPL': (5, Decimal('550')), 'MSFT': (3, Decimal('150'))})
+
+        result = PortfolioCalculator.holdings_as_of(self.portfolio, date(2026, 10, 8))
+        self.assertEqual(result['holdings'][0]['avg_price'], Decimal('110'))
+        self.assertEqual(result['totals'], {
+            'quantity': 6, 'cost_basis': Decimal('480'), 'realized_profit': Decimal('240'),
+        })
+
+    def test_index_is_cached_until_portfolio_changes(self):
+        """Индекс строится один раз и перестраивается после записи в портфель"""
+        self.held(date(2026, 10, 8))
+        with self.assertNumQueries(0):
+            self.assertEqual(self.held(date(2026, 10, 6))['AAPL'][0], 15)
+
+        Stock.objects.create(
+            portfolio=self.portfolio, ticker='TSLA', company_name='TSLA', quantity=1, purchase_price=Decimal('200'),
+        )
+        self.assertIn('TSLA', self.held(timezone.now()))
+
+    def test_view(self):
+        """Эндпоинт возвращает состав портфеля на дату и проверяет формат даты"""
+        self.client.force_login(self.user)
+        url = reverse('portfolios:holdings_as_of', args=[self.portfolio.id])
+        data = self.client.get(url, {'date': '2026-10-07'}).json()
+        self.assertEqual([(item['ticker'], item['quantity']) for item in data['holdings']], [('AAPL', 5), ('MSFT', 3)])
+        self.assertEqual(data['totals']['realized_profit'], 200.0)
+        self.assertEqual(self.client.get(url, {'date': '07.10.2026'}).status_code, 400)
+
+
+class QueryPlanTest(TestCase):
+    """
+    Plans of hot lookups on a seeded dataset must use indexes, not sequential scans.
+    Tables are analyzed after seeding and the planner keeps all its options, so a
+    plan fails when the planner prefers a scan, not only when no index exists.
+    """
+    LOTS = 20000
+    TICKERS = 200
+    SNAPSHOT_DAYS = 400
+
+    @classmethod
+    def setUpTestData(cls):
+        user = get_user_model().objects.create_user(email='plans@example.com', password='testpass123')
+        portfolios = Portfolio.objects.bulk_create([Portfolio(user=user, name=f'P{i}') for i in range(50)])
+        Stock.objects.bulk_create([
+            Stock(
+                portfolio=portfolios[i % len(portfolios)], ticker=f'T{i % cls.TICKERS}', company_name='Seeded',
+                quantity=10, purchase_price=Decimal('100'),
+            )
+            for i in range(cls.LOTS)
+        ], batch_size=2000)
+        StockSale.objects.bulk_create([
+            StockSale(stock=stock, quantity=5, sale_price=Decimal('110'))
+            for stock in Stock.objects.all()[::2]
+        ], batch_size=2000)
+        PortfolioSnapshot.objects.bulk_create([
+            PortfolioSnapshot(
+                portfolio=portfolio, date=date(2024, 1, 1) + timedelta(days=day),
+                market_value=Decimal('1000'), cost_basis=Decimal('900'), realized_profit=Decimal('0'),
+            )
+            for portfolio in portfolios
+            for day in range(cls.SNAPSHOT_DAYS)
+        ], batch_size=2000)
+        # Statistics of the seeded rows, so plans are chosen as for a large production table
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+        cls.portfolio = portfolios[0]
+        cls.stock = Stock.objects.filter(portfolio=cls.portfolio).first()
+
+    def assertIndexed(self, queryset, index=None):
+        """План запроса не содержит последовательного сканирования и использует индекс"""
+        plan = queryset.explain()
+        if connection.vendor == 'postgresql':
+            self.assertNotIn('Seq Scan', plan, plan)
+        elif connection.vendor == 'sqlite':
+            for line in plan.splitlines():
+                if ' SCAN ' in f' {line} ':
+                    self.assertIn('USING', line, plan)
+        if index:
+            self.assertIn(index, plan)
+
+    def test_lots_of_ticker_in_purchase_order(self):
+        """Лоты тикера в порядке покупки читаются по составному индексу"""
+        self.assertIndexed(
+            Stock.objects.filter(portfolio=self.portfolio, ticker='T0').order_by('purchase_date'),
+            'stock_portfolio_ticker_date',
+        )
+        self.assertIndexed(
+            Stock.objects.filter(portfolio=self.portfolio, ticker='T0').select_for_update().order_by('purchase_date', 'id'),
+        )
+
+    def test_sales_of_lots(self):
+        """Продажи лота и предзагрузка продаж не сканируют всю таблицу"""
+        self.assertIndexed(self.stock.sales.order_by('sale_date'), 'sale_stock_date')
+        lots = list(Stock.objects.filter(portfolio=self.portfolio, ticker='T0'))
+        self.assertIndexed(StockSale.objects.filter(stock__in=lots))
+
+    def test_distinct_tickers(self):
+        """Список тикеров и обновление цен по тикеру используют индекс тикера"""
+        self.assertIndexed(Stock.objects.filter(ticker='T1'), 'stock_ticker')
+        if connection.vendor == 'sqlite':
+            # Reads every lot; PostgreSQL may rightly prefer a sequential scan for that
+            self.assertIndexed(Stock.objects.values_list('ticker', flat=True).distinct(), 'stock_ticker')
+
+    def test_snapshot_range(self):
+        """Снимки портфеля за период читаются по индексу уникального ограничения"""
+        self.assertIndexed(
+            self.portfolio.snapshots.filter(date__range=(date(2024, 3, 1), date(2024, 5, 31))).order_by('date'),
+        )
+
+
+class SnapshotBuilderTest(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(email='snapshots@example.com', password='testpass123')
+        self.portfolio = Portfolio.objects.create(user=self.user, name='Main')
+        aapl = self.add_lot('AAPL', 10, '100', new_york(2026, 10, 5, 10, 0))
+        # Bought after the close, counts from the next session
+        self.msft = self.add_lot('MSFT', 5, '50', new_york(2026, 10, 6, 17, 0))
+        sale = StockSale.objects.create(stock=aapl, quantity=4, sale_price=Decimal('120'))
+        StockSale.objects.filter(pk=sale.pk).update(sale_date=new_york(2026, 10, 8, 12, 0))
+        # No bar on 2026-10-07, MSFT has no bars at all
+        DailyBar.objects.bulk_create([
+            DailyBar(ticker='AAPL', date=date(2026, 10, day), close=Decimal(close))
+            for day, close in [(2, '99'), (5, '101'), (6, '102'), (8, '110'), (9, '111')]
+        ])
+
+    def add_lot(self, ticker, quantity, price, bought):
+        """Создать лот, купленный в указанный момент"""
+        stock = Stock.objects.create(
+            portfolio=self.portfolio, ticker=ticker, company_name=ticker, quantity=quantity,
+            purchase_price=Decimal(price),
+        )
+        Stock.objects.filter(pk=stock.pk).update(purchase_date=bought)
+        stock.refresh_from_db()
+        return stock
+
+    def values(self):
+        """Сохраненные снимки портфеля по дням"""
+        return {
+            snapshot.date.day: (snapshot.market_value, snapshot.cost_basis, snapshot.realized_profit)
+            for snapshot in self.portfolio.snapshots.all()
+        }
+
+    def test_builds_incrementally(self):
+        """Снимки считаются по закрытиям дня и дописываются с последней даты"""
+        result = SnapshotBuilder(end=date(2026, 10, 8)).build(self.portfolio)
+        self.assertEqual((result.start, result.end, result.written), (date(2026, 10, 5), date(2026, 10, 8), 4))
+        self.assertEqual(self.values(), {
+            5: (Decimal('1010.00'), Decimal('1000.00'), Decimal('0.00')),
+            6: (Decimal('1020.00'), Decimal('1000.00'), Decimal('0.00')),
+            7: (Decimal('1270.00'), Decimal('1250.00'), Decimal('0.00')),
+            8: (Decimal('910.00'), Decimal('850.00'), Decimal('80.00')),
+        })
+
+        result = SnapshotBuilder(end=date(2026, 10, 9)).build(self.portfolio)
+        self.assertEqual((result.start, result.written), (date(2026, 10, 9), 1))
+        self.assertEqual(self.values()[9], (Decimal('916.00'), Decimal('850.00'), Decimal('80.00')))
+        self.assertEqual(SnapshotBuilder(end=date(2026, 10, 9)).build(self.portfolio).written, 0)
+
+    def test_deleted_lot_drops_affected_snapshots(self):
+        """Удаление лота удаляет снимки с даты покупки, и они пересчитываются"""
+        SnapshotBuilder(end=date(2026, 10, 9)).build(self.portfolio)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.msft.delete()
+        self.assertEqual(sorted(self.values()), [5, 6])
+
+        result = SnapshotBuilder(end=date(2026, 10, 9)).build(self.portfolio)
+        self.assertEqual((result.start, result.written), (date(2026, 10, 7), 3))
+        self.assertEqual(self.values()[9], (Decimal('666.00'), Decimal('600.00'), Decimal('80.00')))
+
+    def test_edited_trades_drop_affected_snapshots(self):
+        """Изменение количества или цены лота и продажи удаляет снимки с даты сделки"""
+        SnapshotBuilder(end=date(2026, 10, 9)).build(self.portfolio)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.msft.save()
+        self.assertEqual(len(self.values()), 5)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.msft.quantity = 6
+            self.msft.save()
+        self.assertEqual(sorted(self.values()), [5, 6])
+        SnapshotBuilder(end=date(2026, 10, 9)).build(self.portfolio)
+        self.assertEqual(self.values()[9][1], Decimal('900.00'))
+
+        sale = StockSale.objects.get(stock__ticker='AAPL')
+        with self.captureOnCommitCallbacks(execute=True):
+            sale.sale_price = Decimal('130')
+            sale.save()
+        self.assertEqual(sorted(self.values()), [5, 6, 7])
+        SnapshotBuilder(end=date(2026, 10, 9)).build(self.portfolio)
+        self.assertEqual(self.values()[9][2], Decimal('120.00'))
+
+    def test_days_without_close_are_written_again(self):
+        """Дни, записанные без закрытия, пересчитываются, когда закрытие появилось"""
+        SnapshotBuilder(end=date(2026, 10, 9)).build(self.portfolio)
+        self.assertEqual(self.portfolio.snapshots.get(date=date(2026, 10, 7)).missing_closes, 2)
+        self.assertEqual(SnapshotBuilder(end=date(2026, 10, 9)).build(self.portfolio).written, 0)
+
+        DailyBar.objects.create(ticker='AAPL', date=date(2026, 10, 7), close=Decimal('105'))
+        result = SnapshotBuilder(end=date(2026, 10, 9)).build(self.portfolio)
+        self.assertEqual((result.start, result.written), (date(2026, 10, 7), 3))
+        self.assertEqual(self.values()[7][0], Decimal('1300.00'))
+        self.assertEqual(self.portfolio.snapshots.get(date=date(2026, 10, 7)).missing_closes, 1)
+
+    def test_cascade_delete_query_count_is_constant(self):
+        """Удаление лота с продажами не делает запросов на каждую продажу"""
+        def delete_lot_with_sales(count):
+            stock = self.add_lot('NVDA', count, '10', new_york(2026, 10, 5, 10, 0))
+            StockSale.objects.bulk_create([StockSale(stock=stock, quantity=1, sale_price=Decimal('12')) for _ in range(count)])
+            SnapshotBuilder(end=date(2026, 10, 9)).build(self.portfolio)
+            with CaptureQueriesContext(connection) as queries, self.captureOnCommitCallbacks(execute=True):
+                stock.delete()
+            self.assertFalse(self.portfolio.snapshots.exists())
+            return len(queries)
+
+        self.assertEqual(delete_lot_with_sales(1), delete_lot_with_sales(10))
+
+    def test_command_and_performance_endpoint(self):
+        """Команда пишет снимки, а эндпоинт графика читает их за период"""
+        out = StringIO()
+        call_command('snapshot_portfolios', end=date(2026, 10, 9), stdout=out)
+        self.assertIn('5 rows up to 2026-10-09', out.getvalue())
 
-# Create your tests here.
+        self.client.force_login(self.user)
+        url = reverse('portfolios:portfolio_performance', args=[self.portfolio.id])
+        with mock.patch('apps.portfolios.portfolio_views.HistoryBackfill.last_session', return_value=date(2026, 10, 9)):
+            response = self.client.get(url, {'days': 3})
+        snapshots = response.json()['snapshots']
+        self.assertEqual([snapshot['date'] for snapshot in snapshots], ['2026-10-06', '2026-10-07', '2026-10-08', '2026-10-09'])
+        self.assertEqual(snapshots[-1]['total_value'], 996.0)
+        self.assertEqual(self.client.get(url, {'days': 'x'}).status_code, 400)
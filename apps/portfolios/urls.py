@@ -12,6 +12,8 @@ urlpatterns = [
     path('<int:portfolio_id>/delete-stock/<int:stock_id>/', views.delete_stock, name='delete_stock'),
     path('<int:portfolio_id>/sell-ticker/<str:ticker>/', views.sell_ticker, name='sell_ticker'),
     path('<int:portfolio_id>/history/', views.portfolio_history, name='portfolio_history'),
+    path('<int:portfolio_id>/performance/', views.portfolio_performance, name='portfolio_performance'),
+    path('<int:portfolio_id>/holdings/', views.holdings_as_of, name='holdings_as_of'),
     path('<int:portfolio_id>/history/delete/<str:ticker>/', views.delete_history_ticker, name='delete_history_ticker'),
     path('<int:portfolio_id>/history/clear/', views.clear_history, name='clear_history'),
     path('<int:portfolio_id>/delete/', views.delete_portfolio, name='delete_portfolio'),
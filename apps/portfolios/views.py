@@ -4,6 +4,8 @@ from .portfolio_views import (
     create_portfolio,
     portfolio_detail,
     portfolio_history,
+    portfolio_performance,
+    holdings_as_of,
     delete_portfolio,
     rename_portfolio,
 )
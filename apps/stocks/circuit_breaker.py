@@ -0,0 +1,83 @@
+"""
+In-process circuit breaker for market data provider calls.
+After failure_threshold consecutive failures the breaker opens and calls are
+refused for cooldown seconds. Then a single trial call is let through: success
+closes the breaker, failure opens it again. State changes are logged and counted
+in apps.stocks.metrics under the breaker name.
+"""
+import logging
+import threading
+import time
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitBreaker:
+    """Thread-safe consecutive-failure circuit breaker"""
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, name: str, failure_threshold: int, cooldown: float):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self._lock = threading.Lock()
+        self.reset()
+
+    @property
+    def state(self) -> str:
+        """Current state; an open breaker whose cooldown has passed reports half_open."""
+        with self._lock:
+            if self._state == self.OPEN and time.monotonic() >= self._opened_at + self.cooldown:
+                return self.HALF_OPEN
+            return self._state
+
+    def allow(self) -> bool:
+        """Check if a provider call may go ahead. Refused calls are counted as short circuits."""
+        with self._lock:
+            if self._state == self.CLOSED:
+                return True
+            if self._state == self.OPEN and time.monotonic() >= self._opened_at + self.cooldown:
+                self._state = self.HALF_OPEN
+                logger.info(f"Circuit breaker {self.name} half open, trying provider again")
+                return True
+        metrics.incr(f'{self.name}.short_circuit')
+        return False
+
+    def record_success(self) -> None:
+        """Register a successful call and close the breaker."""
+        with self._lock:
+            if self._state != self.CLOSED:
+                logger.info(f"Circuit breaker {self.name} closed")
+                metrics.incr(f'{self.name}.closed')
+            self._state = self.CLOSED
+            self._failures = 0
+
+    def cancel(self) -> None:
+        """Give back a call allowed by allow() but not made; a half open breaker lets the next call try."""
+        with self._lock:
+            if self._state == self.HALF_OPEN:
+                self._state = self.OPEN
+
+    def record_failure(self) -> None:
+        """Register a failed call; opens the breaker after too many failures in a row."""
+        with self._lock:
+            self._failures += 1
+            if self._state == self.CLOSED and self._failures < self.failure_threshold:
+                return
+            self._state = self.OPEN
+            self._opened_at = time.monotonic()
+            failures = self._failures
+        logger.warning(f"Circuit breaker {self.name} open for {self.cooldown}s after {failures} failures")
+        metrics.incr(f'{self.name}.opened')
+
+    def reset(self) -> None:
+        """Close the breaker and forget failures."""
+        with self._lock:
+            self._state = self.CLOSED
+            self._failures = 0
+            self._opened_at = 0.0
@@ -0,0 +1,328 @@
+"""
+Bulk loader for vendor end-of-day price files.
+Rows are streamed from CSV (optionally gzip compressed) files and validated in
+chunks. On PostgreSQL every chunk is COPYed into a temporary staging table and
+all of them are merged into DailyBar with one INSERT ... ON CONFLICT. Other
+databases get batched upserts. A chunk the database refuses is written again
+row by row, so only its bad rows are rejected. Afterwards the latest bar of
+every loaded ticker becomes its PriceQuote, unless the stored quote is newer.
+"""
+import csv
+import gzip
+import io
+import re
+import time
+from dataclasses import dataclass, field
+from datetime import date, datetime
+from decimal import Decimal, InvalidOperation
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+
+from django.db import DatabaseError, connection, transaction
+from django.db.models import F, Window
+from django.db.models.functions import RowNumber
+
+from .market_calendar import get_market_calendar
+from .models import DailyBar, PriceQuote
+from .refresh import PriceRefresher
+
+# Accepted header names of each column, compared lower-cased
+COLUMNS = {
+    'ticker': ('ticker', 'symbol'),
+    'date': ('date', 'day', 'trade_date'),
+    'open': ('open',),
+    'high': ('high',),
+    'low': ('low',),
+    'close': ('close', 'adj_close', 'price'),
+    'volume': ('volume',),
+}
+REQUIRED = ('ticker', 'date', 'close')
+TICKER = re.compile(r'^[A-Z0-9][A-Z0-9.\-^]{0,9}$')
+FOUR_PLACES = Decimal('0.0001')
+CENT = Decimal('0.01')
+MAX_ERRORS_KEPT = 20
+
+
+def _field_limit(model, name: str) -> Decimal:
+    """Exclusive upper bound of the values a DecimalField can store"""
+    field = model._meta.get_field(name)
+    return Decimal(10) ** (field.max_digits - field.decimal_places)
+
+
+# Prices must fit DailyBar and, as the close becomes the quote, PriceQuote
+MAX_PRICE = min(_field_limit(DailyBar, 'close'), _field_limit(PriceQuote, 'price'))
+
+Row = Tuple[int, str, date, Optional[Decimal], Optional[Decimal], Optional[Decimal], Decimal, Optional[int]]
+
+
+class EodFileError(ValueError):
+    """File cannot be loaded at all (unreadable or missing required columns)"""
+
+
+@dataclass
+class LoadResult:
+    """Outcome of an EodLoader run with per-phase timings in seconds"""
+    rows: int = 0
+    loaded: int = 0
+    invalid: int = 0
+    errors: List[str] = field(default_factory=list)
+    tickers: Set[str] = field(default_factory=set)
+    quotes: int = 0
+    timings: Dict[str, float] = field(default_factory=dict)
+
+    @property
+    def elapsed(self) -> float:
+        return sum(self.timings.values())
+
+    @property
+    def rows_per_second(self) -> float:
+        return self.rows / self.elapsed if self.elapsed else 0.0
+
+    def add_error(self, message: str) -> None:
+        self.invalid += 1
+        if len(self.errors) < MAX_ERRORS_KEPT:
+            self.errors.append(message)
+
+
+class EodLoader:
+    """Load end-of-day files into DailyBar and PriceQuote"""
+
+    def __init__(self, chunk_size: int = 10000, delimiter: str = ','):
+        self.chunk_size = chunk_size
+        self.delimiter = delimiter
+
+    def load(self, paths: List[Path], dry_run: bool = False) -> LoadResult:
+        """
+        Load files in one transaction. With dry_run rows are only validated.
+        Rows that fail validation or that the database refuses are counted in
+        LoadResult.invalid and leave the rest of the file loaded.
+        Raises EodFileError for a file without the required columns.
+        """
+        result = LoadResult()
+        result.timings = {'read': 0.0, 'load': 0.0, 'merge': 0.0, 'quotes': 0.0}
+        postgres = connection.vendor == 'postgresql'
+        with transaction.atomic():
+            if postgres and not dry_run:
+                self._create_staging()
+            for path in paths:
+                for chunk in self._chunks(path, result):
+                    if dry_run:
+                        continue
+                    started = time.monotonic()
+                    EodLoader._write(path, chunk, postgres, result)
+                    result.timings['load'] += time.monotonic() - started
+            if dry_run:
+                return result
+
+            started = time.monotonic()
+            if postgres:
+                self._merge()
+            result.timings['merge'] = time.monotonic() - started
+
+            started = time.monotonic()
+            result.quotes = len(EodLoader.update_quotes(sorted(result.tickers)))
+            result.timings['quotes'] = time.monotonic() - started
+        return result
+
+    def _chunks(self, path: Path, result: LoadResult) -> Iterator[List[Row]]:
+        """Stream valid rows of a file in chunks; invalid rows are counted in result"""
+        started = time.monotonic()
+        opener = gzip.open if path.suffix == '.gz' else open
+        try:
+            with opener(path, 'rt', newline='', encoding='utf-8') as csv_file:
+                reader = csv.reader(csv_file, delimiter=self.delimiter)
+                header = next(reader, None)
+                if header is None:
+                    return
+                columns = EodLoader._columns(path, header)
+                chunk = []
+                for line, values in enumerate(reader, 2):
+                    if not values:
+                        continue
+                    result.rows += 1
+                    try:
+                        row = EodLoader._parse(line, values, columns)
+                    except ValueError as e:
+                        result.add_error(f'{path.name}:{line}: {e}')
+                        continue
+                    chunk.append(row)
+                    result.tickers.add(row[1])
+                    if len(chunk) >= self.chunk_size:
+                        result.timings['read'] += time.monotonic() - started
+                        yield chunk
+                        started = time.monotonic()
+                        chunk = []
+                result.timings['read'] += time.monotonic() - started
+                if chunk:
+                    yield chunk
+        except (OSError, UnicodeDecodeError, csv.Error) as e:
+            raise EodFileError(f'{path}: {e}') from e
+
+    @staticmethod
+    def _columns(path: Path, header: List[str]) -> Dict[str, int]:
+        """Position of every known column in the header"""
+        names = [name.strip().lower() for name in header]
+        columns = {}
+        for column, aliases in COLUMNS.items():
+            for alias in aliases:
+                if alias in names:
+                    columns[column] = names.index(alias)
+                    break
+        missing = [column for column in REQUIRED if column not in columns]
+        if missing:
+            raise EodFileError(f"{path}: missing column(s) {', '.join(missing)}")
+        return columns
+
+    @staticmethod
+    def _parse(line: int, values: List[str], columns: Dict[str, int]) -> Row:
+        """Validate one row. Raises ValueError with the reason"""
+        def value(column):
+            position = columns.get(column)
+            if position is None or position >= len(values):
+                return ''
+            return values[position].strip()
+
+        ticker = value('ticker').upper()
+        if not TICKER.match(ticker):
+            raise ValueError(f'bad ticker {ticker!r}')
+        raw_date = value('date')
+        try:
+            day = date.fromisoformat(raw_date) if '-' in raw_date else datetime.strptime(raw_date, '%Y%m%d').date()
+        except ValueError:
+            raise ValueError(f'bad date {raw_date!r}')
+        prices = [EodLoader._price(column, value(column)) for column in ('open', 'high', 'low', 'close')]
+        if prices[3] is None:
+            raise ValueError('missing close')
+        raw_volume = value('volume')
+        try:
+            volume = int(Decimal(raw_volume)) if raw_volume else None
+        except InvalidOperation:
+            raise ValueError(f'bad volume {raw_volume!r}')
+        if volume is not None and volume < 0:
+            raise ValueError(f'negative volume {volume}')
+        return (line, ticker, day, *prices, volume)
+
+    @staticmethod
+    def _price(column: str, raw: str) -> Optional[Decimal]:
+        if not raw:
+            return None
+        try:
+            price = Decimal(raw).quantize(FOUR_PLACES)
+        except InvalidOperation:
+            raise ValueError(f'bad {column} {raw!r}')
+        # Rounded to cents as the close is stored in PriceQuote
+        if price <= 0 or price.quantize(CENT) >= MAX_PRICE:
+            raise ValueError(f'{column} {raw} out of range')
+        return price
+
+    @staticmethod
+    def _write(path: Path, chunk: List[Row], postgres: bool, result: LoadResult) -> None:
+        """
+        Write a chunk (COPY to staging on PostgreSQL, upsert otherwise) in a savepoint.
+        If the database refuses it, rows are written one savepoint each and the
+        refused ones are counted as invalid.
+        """
+        write = EodLoader._copy if postgres else EodLoader._upsert
+        try:
+            with transaction.atomic():
+                write(chunk)
+            result.loaded += len(chunk)
+            return
+        except DatabaseError:
+            pass
+        for row in chunk:
+            try:
+                with transaction.atomic():
+                    write([row])
+            except DatabaseError as e:
+                result.add_error(f'{path.name}:{row[0]}: {str(e).strip()}')
+            else:
+                result.loaded += 1
+
+    @staticmethod
+    def _upsert(chunk: List[Row]) -> None:
+        """Batched upsert of a chunk, the last row wins for a repeated ticker and date"""
+        rows = {
+            (ticker, day): DailyBar(ticker=ticker, date=day, open=open_, high=high, low=low, close=close, volume=volume)
+            for _, ticker, day, open_, high, low, close, volume in chunk
+        }
+        DailyBar.objects.bulk_create(
+            rows.values(),
+            batch_size=1000,
+            update_conflicts=True,
+            unique_fields=['ticker', 'date'],
+            update_fields=['open', 'high', 'low', 'close', 'volume'],
+        )
+
+    @staticmethod
+    def _create_staging() -> None:
+        """Temporary table the chunks are COPYed into, dropped at commit"""
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'CREATE TEMPORARY TABLE eod_staging ('
+                ' line bigint, ticker varchar(10), date date,'
+                ' open numeric(14, 4), high numeric(14, 4), low numeric(14, 4), close numeric(14, 4),'
+                ' volume bigint'
+                ') ON COMMIT DROP'
+            )
+
+    @staticmethod
+    def _copy(chunk: List[Row]) -> None:
+        """COPY a chunk into the staging table (psycopg2)"""
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        for row in chunk:
+            writer.writerow('' if value is None else value for value in row)
+        buffer.seek(0)
+        with connection.cursor() as cursor:
+            cursor.copy_expert(
+                'COPY eod_staging (line, ticker, date, open, high, low, close, volume) '
+                "FROM STDIN WITH (FORMAT csv, NULL '')",
+                buffer,
+            )
+
+    @staticmethod
+    def _merge() -> None:
+        """Merge staged rows into DailyBar in one statement and drop them; the last line wins for a ticker and date"""
+        table = connection.ops.quote_name(DailyBar._meta.db_table)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'INSERT INTO {table} (ticker, date, open, high, low, close, volume) '
+                'SELECT DISTINCT ON (ticker, date) ticker, date, open, high, low, close, volume '
+                'FROM eod_staging ORDER BY ticker, date, line DESC '
+                'ON CONFLICT (ticker, date) DO UPDATE SET '
+                'open = EXCLUDED.open, high = EXCLUDED.high, low = EXCLUDED.low, '
+                'close = EXCLUDED.close, volume = EXCLUDED.volume'
+            )
+            # ON COMMIT DROP does not fire while an outer transaction is open
+            cursor.execute('DROP TABLE eod_staging')
+
+    @staticmethod
+    def update_quotes(tickers: List[str]) -> List[str]:
+        """
+        Make the latest stored bar of every ticker its PriceQuote, with the bar before it
+        as previous close, unless the stored quote is newer. Returns tickers written
+        """
+        calendar = get_market_calendar()
+        quotes = {}
+        for start in range(0, len(tickers), 500):
+            chunk = tickers[start:start + 500]
+            latest = {}
+            bars = DailyBar.objects.filter(ticker__in=chunk).annotate(
+                rank=Window(RowNumber(), partition_by=F('ticker'), order_by=F('date').desc()),
+            ).filter(rank__lte=2).values_list('ticker', 'date', 'close', 'rank')
+            for ticker, day, close, rank in bars:
+                latest.setdefault(ticker, {})[rank] = (day, close)
+            stored = dict(PriceQuote.objects.filter(ticker__in=chunk).values_list('ticker', 'as_of'))
+            for ticker, ranked in latest.items():
+                day, close = ranked[1]
+                as_of = calendar.session(day)[1]
+                if ticker in stored and stored[ticker] >= as_of:
+                    continue
+                quotes[ticker] = {
+                    'price': close,
+                    'previous_close': ranked[2][1] if 2 in ranked else None,
+                    'fetched_at': as_of,
+                }
+        changed, _ = PriceRefresher.write(quotes)
+        return changed
@@ -0,0 +1,112 @@
+"""
+Concurrent batch fetcher for refreshing prices of many tickers.
+Tickers are split into batches that go through StockPriceService.get_stock_prices
+on a thread pool (one bulk provider request per batch) in the batch rate limit
+priority class. Tickers left without a price are retried with exponential
+backoff and jitter.
+"""
+import logging
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass, field
+from decimal import Decimal
+from typing import Callable, Dict, List, Optional
+
+from django.conf import settings
+
+from . import rate_limit
+from .services import StockPriceService
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class FetchResult:
+    """Prices fetched by BatchFetcher and run statistics"""
+    prices: Dict[str, Optional[Decimal]] = field(default_factory=dict)
+    batches: int = 0
+    retries: int = 0
+    elapsed: float = 0.0
+
+    @property
+    def fetched(self) -> int:
+        return sum(1 for price in self.prices.values() if price is not None)
+
+    @property
+    def failed(self) -> List[str]:
+        return [ticker for ticker, price in self.prices.items() if price is None]
+
+    @property
+    def throughput(self) -> float:
+        """Tickers per second."""
+        return len(self.prices) / self.elapsed if self.elapsed else 0.0
+
+
+class BatchFetcher:
+    """Fetch prices for many tickers in concurrent, rate limited, retried batches"""
+
+    def __init__(self, batch_size: Optional[int] = None, concurrency: Optional[int] = None,
+                 retries: Optional[int] = None, retry_backoff: Optional[float] = None):
+        config = settings.STOCK_PRICE_UPDATE
+        self.batch_size = batch_size or config['BATCH_SIZE']
+        self.concurrency = concurrency or config['CONCURRENCY']
+        self.retries = config['RETRIES'] if retries is None else retries
+        self.retry_backoff = config['RETRY_BACKOFF'] if retry_backoff is None else retry_backoff
+        self._lock = threading.Lock()
+
+    def fetch(self, tickers: List[str],
+              progress: Optional[Callable[[int, int], None]] = None) -> FetchResult:
+        """
+        Fetch prices for tickers. progress(done, total) is called after every batch.
+        Returns FetchResult with a price (or None) for every upper-cased ticker.
+        """
+        symbols = StockPriceService.normalize_tickers(tickers)
+        batches = [symbols[i:i + self.batch_size] for i in range(0, len(symbols), self.batch_size)]
+        result = FetchResult(batches=len(batches))
+        started = time.monotonic()
+        done = 0
+
+        with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix='price-fetch') as executor:
+            futures = [executor.submit(self._fetch_batch, batch, result) for batch in batches]
+            for future in as_completed(futures):
+                prices = future.result()
+                result.prices.update(prices)
+                done += len(prices)
+                if progress:
+                    progress(done, len(symbols))
+
+        result.elapsed = time.monotonic() - started
+        return result
+
+    def _fetch_batch(self, batch: List[str], result: FetchResult) -> Dict[str, Optional[Decimal]]:
+        """Fetch one batch, retrying tickers without a price."""
+        with rate_limit.priority(rate_limit.BATCH):
+            return self._fetch_with_retries(batch, result)
+
+    def _fetch_with_retries(self, batch: List[str], result: FetchResult) -> Dict[str, Optional[Decimal]]:
+        prices = {}
+        pending = batch
+        for attempt in range(self.retries + 1):
+            if attempt:
+                delay = self.retry_backoff * 2 ** (attempt - 1)
+                time.sleep(delay + random.uniform(0, delay))
+                with self._lock:
+                    result.retries += len(pending)
+            try:
+                fetched = StockPriceService.get_stock_prices(pending)
+            except Exception as e:
+                logger.warning(f"Price batch error for {len(pending)} tickers: {e}")
+                fetched = {}
+            prices.update(fetched)
+            pending = [symbol for symbol in pending if prices.get(symbol) is None]
+            if pending:
+                # Unknown tickers are in negative cache backoff, retrying them would not call the provider
+                backed_off = StockPriceService.backed_off(pending)
+                pending = [symbol for symbol in pending if symbol not in backed_off]
+            if not pending:
+                break
+        for symbol in batch:
+            prices.setdefault(symbol, None)
+        return prices
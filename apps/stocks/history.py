@@ -0,0 +1,251 @@
+"""
+Incremental store of daily OHLCV bars (DailyBar) for charts and analytics.
+HistoryBackfill works out which trading days of a range each ticker is missing,
+asks the provider only for those runs of days, with tickers missing the same
+run batched into one request, and upserts the bars. Every batch is committed on
+its own, so an interrupted backfill resumes where it stopped when run again.
+"""
+import logging
+import time
+from collections import defaultdict
+from dataclasses import dataclass, field
+from datetime import date, timedelta
+from decimal import Decimal
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+
+from . import metrics, rate_limit
+from .market_calendar import get_market_calendar
+from .models import DailyBar, HistoryCoverage
+from .providers import get_provider
+from .services import StockPriceService
+
+logger = logging.getLogger(__name__)
+
+# Tickers per query when reading what is stored
+READ_CHUNK_SIZE = 500
+
+Run = Tuple[date, date]
+
+
+@dataclass
+class BackfillResult:
+    """Outcome of a HistoryBackfill run"""
+    tickers: int = 0
+    requests: int = 0
+    bars: int = 0
+    failed: List[str] = field(default_factory=list)
+    elapsed: float = 0.0
+
+
+class HistoryBackfill:
+    """Fill DailyBar with the bars of a date range that are not stored yet"""
+
+    def __init__(self, batch_size: Optional[int] = None):
+        self.batch_size = batch_size or settings.STOCK_HISTORY_BACKFILL['BATCH_SIZE']
+
+    def backfill(self, tickers: Iterable[str], start: date, end: Optional[date] = None,
+                 progress: Optional[Callable[[int, int], None]] = None) -> BackfillResult:
+        """
+        Store bars of tickers from start to end (default and latest: last completed
+        session). progress(done, total) is called after every provider request.
+        """
+        started = time.monotonic()
+        symbols = StockPriceService.normalize_tickers(tickers)
+        last_session = HistoryBackfill.last_session()
+        end = min(end or last_session, last_session)
+        result = BackfillResult(tickers=len(symbols))
+        if start > end:
+            return result
+
+        gaps = self.gaps(symbols, start, end)
+        days = get_market_calendar().trading_days(start, end)
+        pending = defaultdict(int)
+        # Last day of the range each ticker has a bar (or earlier coverage) for
+        known = dict.fromkeys(symbols, end)
+        for (first, last), run_symbols in gaps.items():
+            for symbol in run_symbols:
+                pending[symbol] += 1
+                if last == days[-1]:
+                    # Runs are maximal, so only the final one can reach the end of the range
+                    before = days.index(first) - 1
+                    known[symbol] = days[before] if before >= 0 else None
+        coverage = {row.ticker: row for row in HistoryCoverage.objects.filter(ticker__in=symbols)}
+        # Tickers already complete still get their coverage widened to the range
+        for symbol in symbols:
+            if not pending[symbol]:
+                HistoryBackfill._cover(coverage, symbol, start, end)
+
+        batches = [
+            (run, run_symbols[i:i + self.batch_size])
+            for run, run_symbols in sorted(gaps.items())
+            for i in range(0, len(run_symbols), self.batch_size)
+        ]
+        failed = set()
+        for done, ((first, last), batch) in enumerate(batches, 1):
+            bars = self._fetch(batch, first, last)
+            result.requests += 1
+            if bars is None:
+                failed.update(batch)
+            else:
+                with transaction.atomic():
+                    result.bars += HistoryBackfill.store(bars)
+                    for symbol in batch:
+                        dates = [bar['date'] for bar in bars.get(symbol, ()) if bar.get('close') is not None]
+                        if dates and (known[symbol] is None or max(dates) > known[symbol].isoformat()):
+                            known[symbol] = date.fromisoformat(max(dates))
+                        pending[symbol] -= 1
+                        # Days after the last bar may still get one (a late close), so they stay uncovered
+                        if not pending[symbol] and symbol not in failed and known[symbol]:
+                            HistoryBackfill._cover(coverage, symbol, start, known[symbol])
+            if progress:
+                progress(done, len(batches))
+
+        result.failed = sorted(failed)
+        result.elapsed = time.monotonic() - started
+        return result
+
+    def gaps(self, symbols: List[str], start: date, end: date) -> Dict[Run, List[str]]:
+        """
+        Runs of consecutive trading days from start to end that tickers have neither
+        bars nor coverage for. Returns dict mapping (first day, last day) to tickers.
+        """
+        days = get_market_calendar().trading_days(start, end)
+        if not days:
+            return {}
+        position = {day: index for index, day in enumerate(days)}
+        gaps = defaultdict(list)
+        for i in range(0, len(symbols), READ_CHUNK_SIZE):
+            chunk = symbols[i:i + READ_CHUNK_SIZE]
+            coverage = dict(
+                (ticker, (first, last))
+                for ticker, first, last in HistoryCoverage.objects.filter(ticker__in=chunk).values_list(
+                    'ticker', 'start', 'end'
+                )
+            )
+            candidates = {
+                symbol: [
+                    day for day in days
+                    if symbol not in coverage or not coverage[symbol][0] <= day <= coverage[symbol][1]
+                ]
+                for symbol in chunk
+            }
+            # Only stored dates inside the candidate runs are read, not the whole history
+            query = Q()
+            for symbol, symbol_days in candidates.items():
+                for first, last in HistoryBackfill._runs(symbol_days, position):
+                    query |= Q(ticker=symbol, date__range=(first, last))
+            stored = defaultdict(set)
+            if query:
+                for ticker, day in DailyBar.objects.filter(query).values_list('ticker', 'date'):
+                    stored[ticker].add(day)
+            for symbol, symbol_days in candidates.items():
+                missing = [day for day in symbol_days if day not in stored[symbol]]
+                for run in HistoryBackfill._runs(missing, position):
+                    gaps[run].append(symbol)
+        return dict(gaps)
+
+    @staticmethod
+    def _runs(missing: List[date], position: Dict[date, int]) -> List[Run]:
+        """Group sorted missing days into runs of consecutive trading days (position: index of each day)"""
+        runs = []
+        for day in missing:
+            if runs and position[day] == position[runs[-1][1]] + 1:
+                runs[-1] = (runs[-1][0], day)
+            else:
+                runs.append((day, day))
+        return runs
+
+    def _fetch(self, symbols: List[str], start: date, end: date) -> Optional[Dict[str, List[dict]]]:
+        """One provider history request in the batch priority class, None if it failed"""
+        with rate_limit.priority(rate_limit.BATCH):
+            if not StockPriceService.provider_call_allowed():
+                return None
+            try:
+                metrics.incr('upstream.history')
+                bars = get_provider().get_history(symbols, start, end)
+            except Exception as e:
+                logger.warning(f"History request error for {len(symbols)} tickers {start}..{end}: {e}")
+                StockPriceService.breaker.record_failure()
+                return None
+        StockPriceService.breaker.record_success()
+        first, last = start.isoformat(), end.isoformat()
+        return {
+            symbol.upper(): [bar for bar in symbol_bars if first <= bar['date'] <= last]
+            for symbol, symbol_bars in bars.items()
+        }
+
+    @staticmethod
+    def store(bars: Dict[str, List[dict]]) -> int:
+        """Upsert bars keyed by ticker. Returns number of bars written"""
+        rows = [
+            DailyBar(
+                ticker=symbol.upper(),
+                date=date.fromisoformat(bar['date']),
+                open=_decimal(bar.get('open')),
+                high=_decimal(bar.get('high')),
+                low=_decimal(bar.get('low')),
+                close=_decimal(bar['close']),
+                volume=int(bar['volume']) if bar.get('volume') is not None else None,
+            )
+            for symbol, symbol_bars in bars.items()
+            for bar in symbol_bars
+            if bar.get('close') is not None
+        ]
+        DailyBar.objects.bulk_create(
+            rows,
+            batch_size=1000,
+            update_conflicts=True,
+            unique_fields=['ticker', 'date'],
+            update_fields=['open', 'high', 'low', 'close', 'volume'],
+        )
+        return len(rows)
+
+    @staticmethod
+    def _cover(coverage: Dict[str, HistoryCoverage], symbol: str, start: date, end: date) -> None:
+        """
+        Record that every trading day from start to end is stored or unavailable.
+        A range apart from the recorded one replaces it only if it is longer, so
+        coverage stays one range without holes.
+        """
+        row = coverage.get(symbol)
+        if row is None:
+            coverage[symbol] = HistoryCoverage.objects.create(ticker=symbol, start=start, end=end)
+            return
+        calendar = get_market_calendar()
+        one_day = timedelta(days=1)
+        # Trading days between the two ranges; none means they join up
+        between = (
+            calendar.trading_days(end + one_day, row.start - one_day) if end < row.start
+            else calendar.trading_days(row.end + one_day, start - one_day) if start > row.end
+            else []
+        )
+        if not between:
+            covered = min(row.start, start), max(row.end, end)
+        elif end - start > row.end - row.start:
+            covered = start, end
+        else:
+            return
+        if covered != (row.start, row.end):
+            row.start, row.end = covered
+            row.save(update_fields=['start', 'end'])
+
+    @staticmethod
+    def last_session() -> date:
+        """Date of the last completed trading session"""
+        return get_market_calendar().last_close().date()
+
+    @staticmethod
+    def bars(ticker: str, start: date, end: date) -> List[DailyBar]:
+        """Stored bars of a ticker from start to end, oldest first"""
+        return list(DailyBar.objects.filter(ticker=ticker.upper(), date__range=(start, end)).order_by('date'))
+
+
+def _decimal(value) -> Optional[Decimal]:
+    """Provider number as a four decimal places Decimal, None if missing"""
+    if value is None:
+        return None
+    return Decimal(str(value)).quantize(Decimal('0.0001'))
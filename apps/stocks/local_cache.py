@@ -0,0 +1,82 @@
+"""
+Bounded in-process LRU cache that sits in front of the shared Django cache.
+Entries expire after their own timeout; when the cache is full the least
+recently used entry is evicted. Hits, misses and evictions are counted in
+apps.stocks.metrics under the cache name.
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Iterable, Optional
+
+from . import metrics
+
+
+class LocalCache:
+    """Thread-safe LRU cache with per-entry expiry"""
+
+    def __init__(self, max_entries: int, name: str = 'local_cache'):
+        self.max_entries = max_entries
+        self.name = name
+        self._entries = OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+    def get(self, key: str, default=None):
+        """Return cached value or default if the key is missing or expired."""
+        return self.get_many([key]).get(key, default)
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, object]:
+        """Return dict of found keys; missing and expired keys are left out."""
+        now = time.monotonic()
+        found = {}
+        misses = 0
+        with self._lock:
+            for key in keys:
+                entry = self._entries.get(key)
+                if entry is None or entry[0] <= now:
+                    if entry is not None:
+                        del self._entries[key]
+                    misses += 1
+                    continue
+                self._entries.move_to_end(key)
+                found[key] = entry[1]
+        if found:
+            metrics.incr(f'{self.name}.hit', len(found))
+        if misses:
+            metrics.incr(f'{self.name}.miss', misses)
+        return found
+
+    def set(self, key: str, value, timeout: Optional[float]) -> None:
+        """Store value for timeout seconds, evicting least recently used entries if full."""
+        self.set_many({key: value}, timeout)
+
+    def set_many(self, entries: Dict[str, object], timeout: Optional[float]) -> None:
+        """Store all entries with the same timeout; a timeout of 0 or None stores nothing."""
+        if not timeout or self.max_entries <= 0:
+            return
+        expires_at = time.monotonic() + timeout
+        evicted = 0
+        with self._lock:
+            for key, value in entries.items():
+                self._entries[key] = (expires_at, value)
+                self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                evicted += 1
+        if evicted:
+            metrics.incr(f'{self.name}.eviction', evicted)
+
+    def delete_many(self, keys: Iterable[str]) -> None:
+        """Remove keys if present."""
+        with self._lock:
+            for key in keys:
+                self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        """Remove all entries."""
+        with self._lock:
+            self._entries.clear()
@@ -0,0 +1,63 @@
+from datetime import date, timedelta
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from apps.portfolios.models import Stock
+from apps.stocks.history import HistoryBackfill
+
+
+class Command(BaseCommand):
+    help = 'Store daily bars of held tickers that are missing from the history store'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--ticker',
+            type=str,
+            action='append',
+            help='Backfill this ticker instead of all held tickers (can be repeated)',
+        )
+        parser.add_argument(
+            '--start',
+            type=date.fromisoformat,
+            help='First date, YYYY-MM-DD (default: --days before the end)',
+        )
+        parser.add_argument(
+            '--end',
+            type=date.fromisoformat,
+            help='Last date, YYYY-MM-DD (default and latest: last completed session)',
+        )
+        parser.add_argument(
+            '--days',
+            type=int,
+            default=settings.STOCK_HISTORY_BACKFILL['DEFAULT_DAYS'],
+            help='Calendar days to cover when --start is not given',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            help='Tickers per provider request (default: STOCK_HISTORY_BACKFILL)',
+        )
+
+    def handle(self, *args, **options):
+        last_session = HistoryBackfill.last_session()
+        end = min(options['end'] or last_session, last_session)
+        start = options['start'] or end - timedelta(days=options['days'])
+        if start > end:
+            raise CommandError(f'Start {start} is after end {end}')
+        tickers = options['ticker'] or list(Stock.objects.values_list('ticker', flat=True).distinct())
+
+        backfill = HistoryBackfill(batch_size=options['batch_size'])
+        self.stdout.write(f'Backfilling {len(tickers)} tickers from {start} to {end}...')
+        result = backfill.backfill(tickers, start, end, progress=self.report_progress)
+
+        for ticker in result.failed:
+            self.stdout.write(self.style.WARNING(f'Could not fetch history for {ticker}, run again to retry'))
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'History backfill completed: {result.bars} bars in {result.requests} requests '
+                f'({result.elapsed:.1f}s), Errors: {len(result.failed)}'
+            )
+        )
+
+    def report_progress(self, done, total):
+        """Print progress after every provider request"""
+        self.stdout.write(f'  {done}/{total} requests')
@@ -0,0 +1,58 @@
+from pathlib import Path
+from django.core.management.base import BaseCommand, CommandError
+from apps.stocks.eod_loader import EodFileError, EodLoader
+
+
+class Command(BaseCommand):
+    help = 'Load vendor end-of-day price files (CSV, optionally .gz) into price history and quotes'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'paths',
+            nargs='+',
+            type=Path,
+            help='CSV files with ticker, date and close columns (open, high, low, volume optional)',
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=10000,
+            help='Rows validated and written per chunk',
+        )
+        parser.add_argument(
+            '--delimiter',
+            default=',',
+            help='Field delimiter of the files',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Validate the files without writing anything',
+        )
+
+    def handle(self, *args, **options):
+        for path in options['paths']:
+            if not path.is_file():
+                raise CommandError(f'File not found: {path}')
+
+        loader = EodLoader(chunk_size=options['chunk_size'], delimiter=options['delimiter'])
+        try:
+            result = loader.load(options['paths'], dry_run=options['dry_run'])
+        except EodFileError as e:
+            raise CommandError(str(e))
+
+        for error in result.errors:
+            self.stdout.write(self.style.WARNING(error))
+        if result.invalid > len(result.errors):
+            self.stdout.write(self.style.WARNING(f'... {result.invalid - len(result.errors)} more invalid rows'))
+        self.stdout.write(
+            ', '.join(f'{phase} {elapsed * 1000:.1f} ms' for phase, elapsed in result.timings.items())
+        )
+        verb = 'Validated' if options['dry_run'] else 'Loaded'
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'{verb} {result.rows - result.invalid} of {result.rows} rows for {len(result.tickers)} tickers '
+                f'({result.rows_per_second:,.0f} rows/s), {result.quotes} quotes updated, '
+                f'Invalid: {result.invalid}'
+            )
+        )
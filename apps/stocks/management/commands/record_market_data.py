@@ -0,0 +1,45 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from apps.portfolios.models import Stock
+from apps.stocks.providers import RecordingProvider, YahooProvider
+
+
+class Command(BaseCommand):
+    help = 'Record live market data responses to a fixture for the replay provider'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'tickers',
+            nargs='*',
+            help='Tickers to record (default: all tickers in portfolios)',
+        )
+        parser.add_argument(
+            '--fixture',
+            default=settings.MARKET_DATA_FIXTURE,
+            help='Fixture file to write (default: MARKET_DATA_FIXTURE)',
+        )
+
+    def handle(self, *args, **options):
+        tickers = options['tickers'] or Stock.objects.values_list('ticker', flat=True).distinct()
+        tickers = list(dict.fromkeys(ticker.upper() for ticker in tickers))
+        provider = RecordingProvider(YahooProvider(), options['fixture'])
+        
+        self.stdout.write(f'Recording daily bars for {len(tickers)} tickers...')
+        bars = provider.get_daily_bars(tickers)
+        
+        error_count = 0
+        for ticker in tickers:
+            try:
+                provider.get_info(ticker)
+            except Exception as e:
+                self.stdout.write(self.style.ERROR(f'{ticker}: Error - {e}'))
+                error_count += 1
+                continue
+            if ticker not in bars:
+                self.stdout.write(self.style.WARNING(f'{ticker}: no daily bars'))
+        
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'Recorded {len(tickers) - error_count} tickers to {options["fixture"]}, {error_count} errors'
+            )
+        )
@@ -1,8 +1,6 @@
 from django.core.management.base import BaseCommand
-from django.db import transaction
-from apps.portfolios.models import Stock
-from apps.stocks.services import StockPriceService
-import time
+from apps.stocks.fetcher import BatchFetcher
+from apps.stocks.refresh import PriceRefresher
 
 
 class Command(BaseCommand):
@@ -14,62 +12,84 @@ class Command(BaseCommand):
             action='store_true',
             help='Force update all prices, ignoring cache',
         )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            help='Tickers per provider request (default: STOCK_PRICE_UPDATE)',
+        )
+        parser.add_argument(
+            '--concurrency',
+            type=int,
+            help='Provider requests in parallel (default: STOCK_PRICE_UPDATE)',
+        )
+        parser.add_argument(
+            '--retries',
+            type=int,
+            help='Retries for tickers without a price (default: STOCK_PRICE_UPDATE)',
+        )
         parser.add_argument(
             '--ticker',
             type=str,
-            help='Update prices for specific ticker only',
+            action='append',
+            help='Update prices for specific ticker only (can be repeated)',
+        )
+        parser.add_argument(
+            '--stale-only',
+            action='store_true',
+            help='Skip tickers whose cached prices are still current',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Report tickers that would be fetched and changes of cached prices, without fetching or writing',
         )
 
     def handle(self, *args, **options):
         self.stdout.write('Starting stock price update...')
-        
-        # Get all unique tickers from portfolios
         if options['ticker']:
-            tickers = [options['ticker'].upper()]
-            self.stdout.write(f'Updating prices for ticker: {options["ticker"]}')
+            self.stdout.write(f'Updating prices for ticker: {", ".join(options["ticker"])}')
+
+        fetcher = BatchFetcher(
+            batch_size=options['batch_size'],
+            concurrency=options['concurrency'],
+            retries=options['retries'],
+        )
+        result = PriceRefresher(fetcher).refresh(
+            tickers=options['ticker'],
+            force=options['force'],
+            stale_only=options['stale_only'],
+            dry_run=options['dry_run'],
+            progress=self.report_progress,
+        )
+
+        self.stdout.write(f'Found {result.tickers} unique tickers to update')
+        if result.fetch:
+            fetch = result.fetch
+            self.stdout.write(
+                f'Fetched {fetch.fetched}/{len(fetch.prices)} in {fetch.elapsed:.1f}s '
+                f'({fetch.throughput:.1f} tickers/s, {fetch.batches} batches, {fetch.retries} retries; '
+                f'{fetcher.batch_size} per request, {fetcher.concurrency} in parallel)'
+            )
+        elif result.due:
+            self.stdout.write(f'Would fetch {len(result.due)} tickers with missing or stale prices')
         else:
-            tickers = Stock.objects.values_list('ticker', flat=True).distinct()
-            self.stdout.write(f'Found {len(tickers)} unique tickers to update')
-        
-        updated_count = 0
-        error_count = 0
-        
-        for ticker in tickers:
-            try:
-                self.stdout.write(f'Fetching price for {ticker}...')
-                
-                # Get current price
-                current_price = StockPriceService.get_stock_price(ticker)
-                
-                if current_price is not None:
-                    # Update all stocks with this ticker
-                    stocks_to_update = Stock.objects.filter(ticker=ticker)
-                    updated_stocks = stocks_to_update.update(current_price=current_price)
-                    
-                    updated_count += updated_stocks
-                    self.stdout.write(
-                        self.style.SUCCESS(
-                            f'Updated {updated_stocks} stocks for {ticker} at ${current_price}'
-                        )
-                    )
-                else:
-                    self.stdout.write(
-                        self.style.WARNING(f'Could not fetch price for {ticker}')
-                    )
-                    error_count += 1
-                
-                # Rate limiting for free API (5 requests per minute)
-                if not options['ticker']:
-                    time.sleep(12)  # Wait 12 seconds between requests
-                    
-            except Exception as e:
-                self.stdout.write(
-                    self.style.ERROR(f'Error updating {ticker}: {e}')
-                )
-                error_count += 1
-        
+            self.stdout.write('Cached prices are current, nothing to fetch')
+        for ticker in result.failed:
+            self.stdout.write(self.style.WARNING(f'Could not fetch price for {ticker}'))
+        for ticker in result.changed_tickers:
+            self.stdout.write(f'{ticker}: ${result.prices[ticker.upper()]}')
+
+        self.stdout.write(
+            ', '.join(f'{phase} {elapsed * 1000:.1f} ms' for phase, elapsed in result.timings.items())
+        )
+        verb = 'Would update' if options['dry_run'] else 'Updated'
         self.stdout.write(
             self.style.SUCCESS(
-                f'Price update completed. Updated: {updated_count}, Errors: {error_count}'
+                f'Price update completed. {verb}: {len(result.changed_tickers)} tickers '
+                f'held in {len(result.portfolios)} portfolios, Errors: {len(result.failed)}'
             )
-        ) 
\ No newline at end of file
+        )
+
+    def report_progress(self, done, total):
+        """Print fetch progress after every batch"""
+        self.stdout.write(f'  {done}/{total} tickers fetched')
@@ -0,0 +1,133 @@
+"""
+Exchange trading calendar used to decide how long market data stays fresh.
+Hours and holidays come from settings.MARKET_CALENDAR; no network lookups.
+"""
+from datetime import date, datetime, time, timedelta
+from typing import Iterable, List, Optional, Tuple
+from zoneinfo import ZoneInfo
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.utils import timezone
+
+
+class MarketCalendar:
+    """Regular trading sessions of one exchange"""
+
+    MAX_DAYS_AHEAD = 370  # give up looking for a session after about a year
+
+    def __init__(self, tz: str, open_time: time, close_time: time,
+                 holidays: Iterable[date] = (), weekdays: Iterable[int] = (0, 1, 2, 3, 4)):
+        self.tz = ZoneInfo(tz)
+        self.open_time = open_time
+        self.close_time = close_time
+        self.holidays = frozenset(holidays)
+        self.weekdays = frozenset(weekdays)
+
+    @classmethod
+    def from_config(cls, config: dict) -> 'MarketCalendar':
+        """Build calendar from a MARKET_CALENDAR style dict with ISO formatted times and dates."""
+        return cls(
+            config['TIMEZONE'],
+            time.fromisoformat(config['OPEN']),
+            time.fromisoformat(config['CLOSE']),
+            holidays=[date.fromisoformat(day) for day in config.get('HOLIDAYS', ())],
+            weekdays=config.get('WEEKDAYS', (0, 1, 2, 3, 4)),
+        )
+
+    def is_trading_day(self, day: date) -> bool:
+        """Check if the exchange has a session on this local date."""
+        return day.weekday() in self.weekdays and day not in self.holidays
+
+    def trading_days(self, start: date, end: date) -> List[date]:
+        """Return local dates with a session from start to end, both included."""
+        days = []
+        day = start
+        while day <= end:
+            if self.is_trading_day(day):
+                days.append(day)
+            day += timedelta(days=1)
+        return days
+
+    def session(self, day: date) -> Tuple[datetime, datetime]:
+        """Return aware open and close datetimes of the session on this local date."""
+        return (
+            datetime.combine(day, self.open_time, tzinfo=self.tz),
+            datetime.combine(day, self.close_time, tzinfo=self.tz),
+        )
+
+    def is_open(self, at: Optional[datetime] = None) -> bool:
+        """Check if the market is in a regular session at the given moment (default now)."""
+        at = self._local(at)
+        if not self.is_trading_day(at.date()):
+            return False
+        opens, closes = self.session(at.date())
+        return opens <= at < closes
+
+    def next_open(self, at: Optional[datetime] = None) -> Optional[datetime]:
+        """Return start of the first session after the given moment, None if there is none."""
+        at = self._local(at)
+        for offset in range(self.MAX_DAYS_AHEAD):
+            day = at.date() + timedelta(days=offset)
+            if self.is_trading_day(day):
+                opens, _ = self.session(day)
+                if opens > at:
+                    return opens
+        return None
+
+    def last_close(self, at: Optional[datetime] = None) -> Optional[datetime]:
+        """Return end of the latest session closed at the given moment, None if there is none."""
+        at = self._local(at)
+        for offset in range(self.MAX_DAYS_AHEAD):
+            day = at.date() - timedelta(days=offset)
+            if self.is_trading_day(day):
+                _, closes = self.session(day)
+                if closes <= at:
+                    return closes
+        return None
+
+    def is_fresh(self, fetched_at: datetime, max_age: float, at: Optional[datetime] = None) -> bool:
+        """
+        Check if market data fetched at fetched_at is still current.
+        During a session data fetched since the open is fresh for max_age seconds.
+        While the market is closed anything fetched after the last close is fresh
+        until the next open.
+        """
+        at = self._local(at)
+        if self.is_open(at):
+            opens, _ = self.session(at.date())
+            return fetched_at >= opens and (at - fetched_at).total_seconds() <= max_age
+        last_close = self.last_close(at)
+        return last_close is None or fetched_at >= last_close
+
+    def seconds_until_open(self, at: Optional[datetime] = None) -> float:
+        """Seconds until the next session starts, 0 while the market is open."""
+        at = self._local(at)
+        if self.is_open(at):
+            return 0
+        next_open = self.next_open(at)
+        return (next_open - at).total_seconds() if next_open else 0
+
+    def _local(self, at: Optional[datetime]) -> datetime:
+        """Convert moment (default now) to exchange local time."""
+        return (at or timezone.now()).astimezone(self.tz)
+
+
+_calendar = None
+
+
+def get_market_calendar() -> MarketCalendar:
+    """Return calendar configured in settings.MARKET_CALENDAR."""
+    global _calendar
+    if _calendar is None:
+        _calendar = MarketCalendar.from_config(settings.MARKET_CALENDAR)
+    return _calendar
+
+
+@receiver(setting_changed)
+def _reset_market_calendar(setting, **kwargs):
+    """Rebuild calendar when tests override settings.MARKET_CALENDAR."""
+    global _calendar
+    if setting == 'MARKET_CALENDAR':
+        _calendar = None
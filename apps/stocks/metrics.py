@@ -0,0 +1,50 @@
+"""
+Lightweight in-process counters for market data activity.
+Totals accumulate for the life of the process; per-request counts are
+collected between start_request() and end_request() on the current thread.
+"""
+import threading
+from collections import Counter
+from typing import Dict
+
+_totals = Counter()
+_lock = threading.Lock()
+_local = threading.local()
+
+
+def incr(name: str, value: int = 1) -> None:
+    """Increase counter by value in process totals and the current request scope."""
+    with _lock:
+        _totals[name] += value
+    counts = getattr(_local, 'counts', None)
+    if counts is not None:
+        counts[name] += value
+
+
+def snapshot() -> Dict[str, int]:
+    """Return a copy of process-wide counter totals."""
+    with _lock:
+        return dict(_totals)
+
+
+def reset() -> None:
+    """Reset process-wide counter totals."""
+    with _lock:
+        _totals.clear()
+
+
+def start_request() -> None:
+    """Start collecting counters for the current request."""
+    _local.counts = Counter()
+
+
+def end_request() -> Dict[str, int]:
+    """Stop collecting counters for the current request and return them."""
+    counts = getattr(_local, 'counts', None)
+    _local.counts = None
+    return dict(counts or {})
+
+
+def request_counts() -> Dict[str, int]:
+    """Return counters collected so far in the current request."""
+    return dict(getattr(_local, 'counts', None) or {})
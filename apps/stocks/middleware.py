@@ -0,0 +1,24 @@
+import logging
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class UpstreamFetchMiddleware:
+    """Count market data provider fetches per request and report them in X-Upstream-Fetches header"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        metrics.start_request()
+        try:
+            response = self.get_response(request)
+        finally:
+            counts = metrics.end_request()
+
+        fetches = sum(value for name, value in counts.items() if name.startswith('upstream.'))
+        response['X-Upstream-Fetches'] = str(fetches)
+        if fetches:
+            logger.info(f"{request.method} {request.path}: {fetches} upstream fetches {counts}")
+        return response
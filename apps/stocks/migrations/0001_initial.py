@@ -0,0 +1,24 @@
+# Generated by Django 5.2.3 on 2026-10-17 17:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PriceQuote',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('ticker', models.CharField(max_length=10, unique=True)),
+                ('price', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('previous_close', models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True)),
+                ('as_of', models.DateTimeField()),
+            ],
+        ),
+    ]
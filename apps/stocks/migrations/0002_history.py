@@ -0,0 +1,38 @@
+# Generated by Django 5.2.3 on 2026-10-17 17:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stocks', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='HistoryCoverage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('ticker', models.CharField(max_length=10, unique=True)),
+                ('start', models.DateField()),
+                ('end', models.DateField()),
+            ],
+        ),
+        migrations.CreateModel(
+            name='DailyBar',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('ticker', models.CharField(max_length=10)),
+                ('date', models.DateField()),
+                ('open', models.DecimalField(blank=True, decimal_places=4, max_digits=14, null=True)),
+                ('high', models.DecimalField(blank=True, decimal_places=4, max_digits=14, null=True)),
+                ('low', models.DecimalField(blank=True, decimal_places=4, max_digits=14, null=True)),
+                ('close', models.DecimalField(decimal_places=4, max_digits=14)),
+                ('volume', models.BigIntegerField(blank=True, null=True)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('ticker', 'date'), name='unique_daily_bar')],
+            },
+        ),
+    ]
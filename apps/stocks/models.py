@@ -1,3 +1,46 @@
 from django.db import models
 
-# Create your models here.
+
+class PriceQuote(models.Model):
+    """Latest stored market price of a ticker, shared by every lot holding it"""
+    ticker = models.CharField(max_length=10, unique=True)  # upper-cased, as Stock.ticker
+    price = models.DecimalField(max_digits=10, decimal_places=2)
+    previous_close = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+    as_of = models.DateTimeField()  # when the quote that set this price was fetched
+
+    def __str__(self):
+        return f"{self.ticker} ${self.price} as of {self.as_of:%Y-%m-%d %H:%M}"
+
+
+class DailyBar(models.Model):
+    """Daily OHLCV bar of a ticker, filled by HistoryBackfill"""
+    ticker = models.CharField(max_length=10)
+    date = models.DateField()
+    open = models.DecimalField(max_digits=14, decimal_places=4, null=True, blank=True)
+    high = models.DecimalField(max_digits=14, decimal_places=4, null=True, blank=True)
+    low = models.DecimalField(max_digits=14, decimal_places=4, null=True, blank=True)
+    close = models.DecimalField(max_digits=14, decimal_places=4)
+    volume = models.BigIntegerField(null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            # Also the index for bars of a ticker in a date range
+            models.UniqueConstraint(fields=['ticker', 'date'], name='unique_daily_bar'),
+        ]
+
+    def __str__(self):
+        return f"{self.ticker} {self.date} close {self.close}"
+
+
+class HistoryCoverage(models.Model):
+    """
+    Date range the provider has been asked for bars of a ticker.
+    Days in it without a bar (before listing, unlisted holidays) are not asked for again.
+    It ends at the last day with a bar, so a close that is not published yet is asked for later.
+    """
+    ticker = models.CharField(max_length=10, unique=True)
+    start = models.DateField()
+    end = models.DateField()
+
+    def __str__(self):
+        return f"{self.ticker} {self.start}..{self.end}"
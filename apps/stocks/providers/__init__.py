@@ -0,0 +1,52 @@
+"""
+Market data providers used by StockPriceService.
+The backend is chosen with settings.MARKET_DATA_BACKEND.
+"""
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+from .base import MarketDataProvider, ProviderError
+from .replay import RecordingProvider, ReplayProvider
+from .simulator import SimulatorProvider
+from .yahoo import YahooProvider
+
+__all__ = [
+    'MarketDataProvider',
+    'ProviderError',
+    'RecordingProvider',
+    'ReplayProvider',
+    'SimulatorProvider',
+    'YahooProvider',
+    'get_provider',
+]
+
+BACKENDS = {
+    'yahoo': lambda: YahooProvider(),
+    'record': lambda: RecordingProvider(YahooProvider(), settings.MARKET_DATA_FIXTURE),
+    'replay': lambda: ReplayProvider(settings.MARKET_DATA_FIXTURE, latency=settings.MARKET_DATA_REPLAY_LATENCY),
+    'simulator': lambda: SimulatorProvider(**{
+        option.lower(): value for option, value in settings.MARKET_DATA_SIMULATOR.items()
+    }),
+}
+
+_provider = None
+
+
+def get_provider() -> MarketDataProvider:
+    """Return provider configured in settings.MARKET_DATA_BACKEND."""
+    global _provider
+    if _provider is None:
+        backend = settings.MARKET_DATA_BACKEND
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown MARKET_DATA_BACKEND {backend!r}, expected one of {', '.join(BACKENDS)}")
+        _provider = BACKENDS[backend]()
+    return _provider
+
+
+@receiver(setting_changed)
+def _reset_provider(setting, **kwargs):
+    """Rebuild provider when tests override market data settings."""
+    global _provider
+    if setting.startswith('MARKET_DATA_'):
+        _provider = None
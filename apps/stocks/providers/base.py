@@ -0,0 +1,45 @@
+from datetime import date
+from typing import Dict, List
+
+
+class ProviderError(Exception):
+    """Market data provider request failed"""
+
+
+class MarketDataProvider:
+    """
+    Source of raw market data.
+    Providers raise an exception when a request fails; a symbol the provider
+    does not know is not an error (info without price, no bars).
+    """
+
+    name = 'base'
+
+    def get_info(self, symbol: str) -> dict:
+        """
+        Return Yahoo Finance style info dict for a symbol
+        (regularMarketPrice, regularMarketPreviousClose, longName, sector, ...).
+        """
+        raise NotImplementedError
+
+    def get_daily_bars(self, symbols: List[str]) -> Dict[str, List[dict]]:
+        """
+        Return recent daily bars for many symbols in one request, oldest first.
+        Each bar has 'date' (ISO string), 'open', 'high', 'low', 'close' and 'volume'.
+        Symbols without data are left out of the result.
+        """
+        raise NotImplementedError
+
+    def get_history(self, symbols: List[str], start: date, end: date) -> Dict[str, List[dict]]:
+        """
+        Return daily bars from start to end (both included) for many symbols in one
+        request, shaped like get_daily_bars. Providers that can only serve recent bars
+        return the part of them in the range.
+        """
+        first, last = start.isoformat(), end.isoformat()
+        bars = {}
+        for symbol, symbol_bars in self.get_daily_bars(symbols).items():
+            in_range = [bar for bar in symbol_bars if first <= bar['date'] <= last]
+            if in_range:
+                bars[symbol] = in_range
+        return bars
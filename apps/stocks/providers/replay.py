@@ -0,0 +1,109 @@
+"""
+Record/replay providers for repeatable benchmarks without network access.
+RecordingProvider passes requests to a real provider and saves every response
+to a JSON fixture; ReplayProvider serves the saved responses.
+
+Fixture format: {"info": {symbol: info}, "bars": {symbol: [bar, ...]}}
+"""
+import json
+import os
+import threading
+import time
+from datetime import date
+from pathlib import Path
+from typing import Dict, List
+
+from django.core.exceptions import ImproperlyConfigured
+
+from .base import MarketDataProvider
+
+
+def load_fixture(path) -> dict:
+    """Read fixture file, empty fixture if it does not exist yet."""
+    path = Path(path)
+    if not path.exists():
+        return {'info': {}, 'bars': {}}
+    with path.open(encoding='utf-8') as fixture_file:
+        fixture = json.load(fixture_file)
+    fixture.setdefault('info', {})
+    fixture.setdefault('bars', {})
+    return fixture
+
+
+class RecordingProvider(MarketDataProvider):
+    """Pass requests to upstream provider and save its responses to a fixture file"""
+
+    name = 'record'
+
+    def __init__(self, upstream: MarketDataProvider, path):
+        self.upstream = upstream
+        self.path = Path(path)
+        self._fixture = load_fixture(self.path)
+        self._lock = threading.Lock()
+
+    def get_info(self, symbol: str) -> dict:
+        info = self.upstream.get_info(symbol)
+        with self._lock:
+            self._fixture['info'][symbol] = info
+            self._save()
+        return info
+
+    def get_daily_bars(self, symbols: List[str]) -> Dict[str, List[dict]]:
+        bars = self.upstream.get_daily_bars(symbols)
+        with self._lock:
+            self._fixture['bars'].update(bars)
+            self._save()
+        return bars
+
+    def get_history(self, symbols: List[str], start: date, end: date) -> Dict[str, List[dict]]:
+        bars = self.upstream.get_history(symbols, start, end)
+        with self._lock:
+            for symbol, symbol_bars in bars.items():
+                # Merge by date, so replaying recent bars still sees the latest ones last
+                merged = {bar['date']: bar for bar in self._fixture['bars'].get(symbol, [])}
+                merged.update((bar['date'], bar) for bar in symbol_bars)
+                self._fixture['bars'][symbol] = [merged[day] for day in sorted(merged)]
+            self._save()
+        return bars
+
+    def _save(self) -> None:
+        """Write fixture atomically so a replay never reads a half written file."""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_name(f'{self.path.name}.tmp')
+        with tmp_path.open('w', encoding='utf-8') as fixture_file:
+            json.dump(self._fixture, fixture_file, indent=1, sort_keys=True, default=str)
+        os.replace(tmp_path, self.path)
+
+
+class ReplayProvider(MarketDataProvider):
+    """
+    Serve responses saved by RecordingProvider, sleeping latency seconds per request.
+    Symbols missing from the fixture look unknown: info without price and no bars.
+    """
+
+    name = 'replay'
+
+    def __init__(self, path, latency: float = 0):
+        if not Path(path).exists():
+            raise ImproperlyConfigured(
+                f"Market data fixture {path} not found, record it first with MARKET_DATA_BACKEND=record"
+            )
+        self._fixture = load_fixture(path)
+        self.latency = latency
+
+    def get_info(self, symbol: str) -> dict:
+        self._wait()
+        return dict(self._fixture['info'].get(symbol, {}))
+
+    def get_daily_bars(self, symbols: List[str]) -> Dict[str, List[dict]]:
+        self._wait()
+        return {
+            symbol: [dict(bar) for bar in self._fixture['bars'][symbol]]
+            for symbol in symbols
+            if symbol in self._fixture['bars']
+        }
+
+    def _wait(self) -> None:
+        """Simulate provider round trip time."""
+        if self.latency:
+            time.sleep(self.latency)
@@ -0,0 +1,260 @@
+"""
+Synthetic market for load testing without any outside dependencies.
+Every symbol follows its own geometric Brownian motion seeded by (seed, symbol),
+advancing one step per tick_seconds of wall time. Daily history on the sessions
+of the market calendar, the OHLCV of the anchor session and a company profile
+are generated for any symbol, so portfolios with real tickers work too;
+symbols() lists a ready-made universe of synthetic tickers.
+"""
+import math
+import random
+import threading
+import time
+from datetime import date, timedelta
+from typing import Callable, Dict, List, Optional
+
+from django.utils import timezone
+
+from ..market_calendar import MarketCalendar, get_market_calendar
+from .base import MarketDataProvider
+
+# Starting prices for well-known tickers, others start at a random price
+START_PRICES = {
+    'AAPL': 175.50,
+    'GOOGL': 142.80,
+    'MSFT': 380.20,
+    'TSLA': 245.30,
+    'NVDA': 485.90,
+    'AMZN': 145.60,
+    'META': 330.40,
+    'NFLX': 485.70,
+    'AMD': 125.30,
+    'INTC': 45.80,
+    'JPM': 195.40,
+    'V': 275.60,
+    'WMT': 65.20,
+    'JNJ': 155.80,
+    'PG': 165.30,
+}
+
+SECTORS = [
+    ('Technology', 'Software—Infrastructure'),
+    ('Technology', 'Semiconductors'),
+    ('Healthcare', 'Drug Manufacturers'),
+    ('Financial Services', 'Banks—Diversified'),
+    ('Consumer Cyclical', 'Internet Retail'),
+    ('Energy', 'Oil & Gas Integrated'),
+    ('Industrials', 'Aerospace & Defense'),
+    ('Utilities', 'Utilities—Regulated Electric'),
+]
+
+SECONDS_PER_YEAR = 365 * 24 * 3600
+
+
+class _SymbolState:
+    """Simulated price path of one symbol"""
+
+    def __init__(self, rng: random.Random, start_price: float, volatility: float, drift: float):
+        self.rng = rng
+        self.volatility = volatility
+        self.drift = drift
+        self.price = start_price
+        self.open = start_price
+        self.high = start_price
+        self.low = start_price
+        self.volume = 0
+        self.tick = 0
+        self.history = []
+        self.profile = {}
+        self.older = []  # bars before history, newest first, extended by get_history
+        self.history_rng = None
+
+
+class SimulatorProvider(MarketDataProvider):
+    """
+    Generate quotes, daily bars and company profiles as seeded geometric Brownian motion.
+    Paths are reproducible for the same seed, anchor and sequence of request times.
+    The current bar is dated anchor (default: the latest session up to today in the
+    calendar's time zone) and history bars fall on the calendar's earlier sessions.
+    """
+
+    name = 'simulator'
+    MAX_STEPS_PER_REQUEST = 1000  # longer gaps are covered by one aggregated step
+
+    def __init__(self, seed: int = 0, tickers: int = 1000, tick_seconds: float = 1.0,
+                 volatility: float = 0.3, drift: float = 0.05, history_days: int = 5,
+                 latency: float = 0, clock: Callable[[], float] = time.monotonic,
+                 anchor: Optional[date] = None, calendar: Optional[MarketCalendar] = None):
+        self.seed = seed
+        self.tickers = tickers
+        self.tick_seconds = tick_seconds
+        self.volatility = volatility
+        self.drift = drift
+        self.history_days = history_days
+        self.latency = latency
+        self.clock = clock
+        self.started_at = clock()
+        self.calendar = calendar or get_market_calendar()
+        anchor = anchor or timezone.localdate(timezone=self.calendar.tz)
+        self.anchor = anchor if self.calendar.is_trading_day(anchor) else self._previous_session(anchor)
+        self._states = {}
+        self._lock = threading.Lock()
+
+    def symbols(self) -> List[str]:
+        """Return simulated universe: well-known tickers first, then synthetic SIMnnnn tickers."""
+        synthetic = [f'SIM{index:04d}' for index in range(max(self.tickers - len(START_PRICES), 0))]
+        return (list(START_PRICES) + synthetic)[:self.tickers]
+
+    def get_info(self, symbol: str) -> dict:
+        self._wait()
+        with self._lock:
+            state = self._advance(symbol)
+            previous_close = state.history[-1]['close']
+            return dict(
+                state.profile,
+                regularMarketPrice=round(state.price, 4),
+                regularMarketPreviousClose=previous_close,
+                regularMarketOpen=round(state.open, 4),
+                regularMarketDayHigh=round(state.high, 4),
+                regularMarketDayLow=round(state.low, 4),
+                volume=state.volume,
+                regularMarketTime=int(time.time()),
+                marketCap=int(state.price * state.profile['sharesOutstanding']),
+            )
+
+    def get_daily_bars(self, symbols: List[str]) -> Dict[str, List[dict]]:
+        self._wait()
+        bars = {}
+        with self._lock:
+            for symbol in symbols:
+                state = self._advance(symbol)
+                bars[symbol] = [dict(bar) for bar in state.history] + [{
+                    'date': self.anchor.isoformat(),
+                    'open': round(state.open, 4),
+                    'high': round(state.high, 4),
+                    'low': round(state.low, 4),
+                    'close': round(state.price, 4),
+                    'volume': float(state.volume),
+                }]
+        return bars
+
+    def get_history(self, symbols: List[str], start: date, end: date) -> Dict[str, List[dict]]:
+        first, last = start.isoformat(), end.isoformat()
+        recent = self.get_daily_bars(symbols)
+        bars = {}
+        with self._lock:
+            for symbol in symbols:
+                state = self._states[symbol]
+                self._extend_back(symbol, state, start)
+                path = [dict(bar) for bar in reversed(state.older)] + recent[symbol]
+                bars[symbol] = [bar for bar in path if first <= bar['date'] <= last]
+        return bars
+
+    def _extend_back(self, symbol: str, state: _SymbolState, start: date) -> None:
+        """
+        Walk the daily path back from the first history bar until start (caller holds the lock).
+        Uses its own seeded generator, so older bars do not depend on when they are asked for.
+        """
+        if state.history_rng is None:
+            state.history_rng = random.Random(f'{self.seed}:{symbol}:history')
+        oldest = state.older[-1] if state.older else state.history[0]
+        day = date.fromisoformat(oldest['date'])
+        day_volatility = state.volatility / math.sqrt(252)
+        rng = state.history_rng
+        while day > start:
+            close = oldest['open'] / math.exp(rng.gauss(0, day_volatility))
+            day = self._previous_session(day)
+            oldest = self._bar(rng, day, close, day_volatility)
+            state.older.append(oldest)
+
+    def _previous_session(self, day: date) -> date:
+        """Latest trading day of the calendar before day"""
+        day -= timedelta(days=1)
+        while not self.calendar.is_trading_day(day):
+            day -= timedelta(days=1)
+        return day
+
+    @staticmethod
+    def _bar(rng: random.Random, day: date, close: float, day_volatility: float) -> dict:
+        """Daily bar closing at close with a random open, range and volume."""
+        open_price = close / math.exp(rng.gauss(0, day_volatility))
+        return {
+            'date': day.isoformat(),
+            'open': round(open_price, 4),
+            'high': round(max(open_price, close) * (1 + abs(rng.gauss(0, day_volatility / 2))), 4),
+            'low': round(min(open_price, close) * (1 - abs(rng.gauss(0, day_volatility / 2))), 4),
+            'close': round(close, 4),
+            'volume': float(rng.randint(1_000_000, 50_000_000)),
+        }
+
+    def _advance(self, symbol: str) -> _SymbolState:
+        """Return state of symbol moved forward to the current tick (caller holds the lock)."""
+        state = self._states.get(symbol)
+        if state is None:
+            state = self._states[symbol] = self._new_state(symbol)
+
+        tick = int((self.clock() - self.started_at) / self.tick_seconds)
+        steps = tick - state.tick
+        if steps <= 0:
+            return state
+        if steps > self.MAX_STEPS_PER_REQUEST:
+            # Sum of normal increments is normal, so the price distribution stays exact
+            self._step(state, (steps - self.MAX_STEPS_PER_REQUEST) * self.tick_seconds)
+            steps = self.MAX_STEPS_PER_REQUEST
+        for _ in range(steps):
+            self._step(state, self.tick_seconds)
+        state.tick = tick
+        return state
+
+    def _step(self, state: _SymbolState, seconds: float) -> None:
+        """Move price one GBM step of the given length and update day range and volume."""
+        dt = seconds / SECONDS_PER_YEAR
+        shock = state.rng.gauss(0, 1)
+        state.price *= math.exp(
+            (state.drift - state.volatility ** 2 / 2) * dt + state.volatility * math.sqrt(dt) * shock
+        )
+        state.high = max(state.high, state.price)
+        state.low = min(state.low, state.price)
+        state.volume += state.rng.randint(100, 10000)
+
+    def _new_state(self, symbol: str) -> _SymbolState:
+        """Create seeded path, daily history and profile for a symbol."""
+        rng = random.Random(f'{self.seed}:{symbol}')
+        start_price = START_PRICES.get(symbol) or round(rng.uniform(5, 500), 2)
+        state = _SymbolState(
+            rng,
+            start_price,
+            volatility=self.volatility * rng.uniform(0.5, 1.5),
+            drift=self.drift,
+        )
+
+        # Walk back from the starting price so the last daily close is the anchor session's open
+        day_volatility = state.volatility / math.sqrt(252)
+        close = start_price
+        day = self.anchor
+        for _ in range(self.history_days):
+            day = self._previous_session(day)
+            bar = self._bar(rng, day, close, day_volatility)
+            state.history.append(bar)
+            close = bar['open'] / math.exp(rng.gauss(0, day_volatility))
+        state.history.reverse()
+
+        sector, industry = rng.choice(SECTORS)
+        state.profile = {
+            'longName': f'{symbol} Simulated Inc.',
+            'longBusinessSummary': f'Synthetic company generated by the market simulator for {symbol}.',
+            'exchange': 'SIM',
+            'currency': 'USD',
+            'country': 'United States',
+            'sector': sector,
+            'industry': industry,
+            'sharesOutstanding': rng.randint(10_000_000, 5_000_000_000),
+            'fullTimeEmployees': rng.randint(50, 200_000),
+            'website': f'https://{symbol.lower()}.example.com',
+        }
+        return state
+
+    def _wait(self) -> None:
+        """Simulate provider round trip time."""
+        if self.latency:
+            time.sleep(self.latency)
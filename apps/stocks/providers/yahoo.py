@@ -0,0 +1,68 @@
+import math
+from datetime import date, timedelta
+from typing import Dict, List
+
+import yfinance as yf
+
+from .base import MarketDataProvider, ProviderError
+
+
+class YahooProvider(MarketDataProvider):
+    """Market data from Yahoo Finance via yfinance"""
+
+    name = 'yahoo'
+
+    def get_info(self, symbol: str) -> dict:
+        return yf.Ticker(symbol).info
+
+    def get_daily_bars(self, symbols: List[str]) -> Dict[str, List[dict]]:
+        return self._download(symbols, period='5d')
+
+    def get_history(self, symbols: List[str], start: date, end: date) -> Dict[str, List[dict]]:
+        # yfinance treats end as exclusive
+        return self._download(symbols, start=start.isoformat(), end=(end + timedelta(days=1)).isoformat())
+
+    def _download(self, symbols: List[str], **period) -> Dict[str, List[dict]]:
+        """Download daily bars of symbols for a period or a start/end range."""
+        data = yf.download(
+            symbols,
+            interval='1d',
+            group_by='ticker',
+            auto_adjust=False,
+            progress=False,
+            threads=True,
+            **period,
+        )
+        if data is None or data.empty:
+            # yfinance reports outages as an empty frame rather than an exception
+            raise ProviderError(f"no data returned for {', '.join(symbols)}")
+
+        bars = {}
+        for symbol in symbols:
+            try:
+                frame = data[symbol] if data.columns.nlevels > 1 else data
+                frame = frame.dropna(subset=['Close'])
+            except KeyError:
+                continue
+            if frame.empty:
+                continue
+            bars[symbol] = [
+                {
+                    'date': day.date().isoformat(),
+                    'open': _number(row.get('Open')),
+                    'high': _number(row.get('High')),
+                    'low': _number(row.get('Low')),
+                    'close': _number(row.get('Close')),
+                    'volume': _number(row.get('Volume')),
+                }
+                for day, row in frame.iterrows()
+            ]
+        return bars
+
+
+def _number(value):
+    """Convert frame value to float, None for missing or NaN."""
+    if value is None:
+        return None
+    value = float(value)
+    return None if math.isnan(value) else value
@@ -0,0 +1,155 @@
+"""
+Token bucket rate limiter for market data provider calls, shared by all
+processes through the Django cache.
+
+Calls have a priority class. Interactive calls (page loads, the default) may
+take any token. Batch calls (refresh commands, background refreshes) leave
+INTERACTIVE_RESERVE tokens in the bucket, so page loads go first when the
+bucket runs low. Each class waits at most its MAX_WAIT for a token before
+RateLimited is raised. Waits are counted in apps.stocks.metrics.
+"""
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+from . import metrics
+
+INTERACTIVE = 'interactive'
+BATCH = 'batch'
+
+_local = threading.local()
+
+
+class RateLimited(Exception):
+    """No token became available within the priority's maximum wait"""
+
+
+@contextmanager
+def priority(name: str):
+    """Run provider calls made by the current thread in the given priority class."""
+    previous = getattr(_local, 'priority', INTERACTIVE)
+    _local.priority = name
+    try:
+        yield
+    finally:
+        _local.priority = previous
+
+
+def current_priority() -> str:
+    """Priority class of the current thread."""
+    return getattr(_local, 'priority', INTERACTIVE)
+
+
+class TokenBucket:
+    """Cache-backed token bucket refilled at rate tokens per second up to burst tokens"""
+
+    LOCK_TIMEOUT = 2  # bucket lock expires even if its holder dies
+    LOCK_POLL_INTERVAL = 0.002
+
+    def __init__(self, name: str, rate: float, burst: int, reserve: int = 0,
+                 max_wait: Optional[Dict[str, float]] = None):
+        self.name = name
+        self.rate = rate
+        self.burst = burst
+        self.reserve = reserve
+        self.max_wait = max_wait or {}
+
+    def acquire(self, priority_class: Optional[str] = None) -> float:
+        """
+        Take one token, waiting for it if needed.
+        Returns seconds waited; raises RateLimited if the wait would exceed MAX_WAIT.
+        """
+        priority_class = priority_class or current_priority()
+        max_wait = self.max_wait.get(priority_class, 0)
+        floor = self.reserve if priority_class == BATCH else 0
+        started = time.monotonic()
+        waited = 0
+        while True:
+            wait = self._take(floor)
+            if wait == 0:
+                metrics.incr(f'ratelimit.{priority_class}.acquired')
+                if waited:
+                    metrics.incr(f'ratelimit.{priority_class}.waited')
+                    metrics.incr(f'ratelimit.{priority_class}.wait_ms', int(waited * 1000))
+                return waited
+            if time.monotonic() - started + wait > max_wait:
+                metrics.incr(f'ratelimit.{priority_class}.rejected')
+                raise RateLimited(
+                    f"{self.name}: no {priority_class} token within {max_wait}s"
+                )
+            time.sleep(wait)
+            waited = time.monotonic() - started
+
+    def _take(self, floor: int) -> float:
+        """Take a token if more than floor are left. Returns 0 on success, else seconds until one is."""
+        key = f"ratelimit_{self.name}"
+        with self._locked():
+            now = time.time()
+            state = cache.get(key) or {'tokens': self.burst, 'updated': now}
+            tokens = min(self.burst, state['tokens'] + max(now - state['updated'], 0) * self.rate)
+            if tokens >= floor + 1:
+                tokens -= 1
+                wait = 0
+            else:
+                wait = (floor + 1 - tokens) / self.rate
+            # Bucket is full again after burst / rate seconds, so the state may expire then
+            cache.set(key, {'tokens': tokens, 'updated': now}, int(self.burst / self.rate) + 60)
+        return wait
+
+    @contextmanager
+    def _locked(self):
+        """
+        Hold the bucket lock across processes. cache.add is atomic on shared backends.
+        If the lock cannot be taken within LOCK_TIMEOUT the update goes ahead without it.
+        """
+        lock_key = f"ratelimit_lock_{self.name}"
+        token = uuid.uuid4().hex
+        deadline = time.monotonic() + self.LOCK_TIMEOUT
+        locked = False
+        while time.monotonic() < deadline:
+            if cache.add(lock_key, token, self.LOCK_TIMEOUT):
+                locked = True
+                break
+            time.sleep(self.LOCK_POLL_INTERVAL)
+        try:
+            yield
+        finally:
+            if locked and cache.get(lock_key) == token:
+                cache.delete(lock_key)
+
+
+_limiter = None
+
+
+def get_rate_limiter() -> Optional[TokenBucket]:
+    """Return token bucket for the configured market data backend, None if it has no limit."""
+    global _limiter
+    config = settings.MARKET_DATA_RATE_LIMIT
+    backend = settings.MARKET_DATA_BACKEND
+    rate = config['RATES'].get(backend)
+    if not rate:
+        return None
+    if _limiter is None:
+        _limiter = TokenBucket(
+            backend,
+            rate,
+            burst=config['BURST'],
+            reserve=config['INTERACTIVE_RESERVE'],
+            max_wait=config['MAX_WAIT'],
+        )
+    return _limiter
+
+
+@receiver(setting_changed)
+def _reset_rate_limiter(setting, **kwargs):
+    """Rebuild limiter when tests override market data settings."""
+    global _limiter
+    if setting.startswith('MARKET_DATA_'):
+        _limiter = None
@@ -0,0 +1,200 @@
+"""
+Refresh of stored prices (PriceQuote rows) of held tickers.
+Distinct tickers are streamed from the database, prices come from cached
+quotes or BatchFetcher, and quotes whose price changed are upserted in bulk,
+one row per ticker however many lots hold it. Unchanged quotes are not written.
+"""
+import time
+from dataclasses import dataclass, field
+from decimal import Decimal
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+from django.db import transaction
+from django.utils import timezone
+
+from apps.portfolios.models import Stock
+from apps.portfolios.services.summary_cache import SummaryCache
+from .fetcher import BatchFetcher, FetchResult
+from .models import PriceQuote
+from .services import StockPriceService
+
+# Tickers per statement, keeps query parameters bounded
+WRITE_CHUNK_SIZE = 500
+
+CENT = Decimal('0.01')
+
+
+@dataclass
+class RefreshResult:
+    """Outcome of a PriceRefresher run with per-phase timings in seconds"""
+    tickers: int = 0
+    due: List[str] = field(default_factory=list)  # Tickers fetched, or with dry_run that would be
+    fetch: Optional[FetchResult] = None  # None when every price came from cache or with dry_run
+    prices: Dict[str, Optional[Decimal]] = field(default_factory=dict)
+    changed_tickers: List[str] = field(default_factory=list)
+    portfolios: Set[int] = field(default_factory=set)
+    timings: Dict[str, float] = field(default_factory=dict)
+
+    @property
+    def fetched(self) -> int:
+        return self.fetch.fetched if self.fetch else 0
+
+    @property
+    def failed(self) -> List[str]:
+        return sorted(ticker for ticker, price in self.prices.items() if price is None)
+
+
+class PriceRefresher:
+    """Update stored PriceQuote rows of all held tickers (or some tickers) from market quotes"""
+
+    def __init__(self, fetcher: Optional[BatchFetcher] = None):
+        self.fetcher = fetcher or BatchFetcher()
+
+    def refresh(self, tickers: Optional[List[str]] = None, force: bool = False, stale_only: bool = False,
+                dry_run: bool = False, progress: Optional[Callable[[int, int], None]] = None) -> RefreshResult:
+        """
+        Refresh prices of tickers, all held tickers by default.
+        force refetches every ticker; stale_only leaves out tickers whose cached
+        prices are still current. With dry_run neither the provider nor the cache
+        is touched and nothing is written: RefreshResult.due lists the tickers that
+        would be fetched and changed_tickers the stored quotes current cached
+        prices would change.
+        """
+        result = RefreshResult()
+
+        started = time.monotonic()
+        held = self.held_tickers(tickers)
+        result.tickers = len(held)
+        due = list(held) if force else StockPriceService.stale_tickers(held)
+        result.due = StockPriceService.normalize_tickers(due)
+        due_symbols = set(result.due)
+        if stale_only:
+            held = [ticker for ticker in held if ticker.upper() in due_symbols]
+        result.timings['collect'] = time.monotonic() - started
+
+        started = time.monotonic()
+        prices = StockPriceService.get_stock_prices(
+            [ticker for ticker in held if ticker.upper() not in due_symbols]
+        )
+        if due and not dry_run:
+            StockPriceService.invalidate(due)
+            result.fetch = self.fetcher.fetch(due, progress=progress)
+            prices.update(result.fetch.prices)
+        result.prices = prices
+        # Every priced ticker now has a cached quote, so this does not go to the provider
+        quotes = StockPriceService.get_stock_quotes(
+            [symbol for symbol, price in prices.items() if price is not None]
+        )
+        result.timings['fetch'] = time.monotonic() - started
+
+        started = time.monotonic()
+        write = PriceRefresher.preview if dry_run else PriceRefresher.write
+        result.changed_tickers, result.portfolios = write(quotes)
+        result.timings['write'] = time.monotonic() - started
+        return result
+
+    @staticmethod
+    def held_tickers(tickers: Optional[List[str]] = None) -> List[str]:
+        """
+        Distinct tickers of stored lots, streamed from the database.
+        Requested tickers no lot holds are kept, so their prices are still fetched.
+        """
+        queryset = Stock.objects.order_by('ticker').values_list('ticker', flat=True).distinct()
+        if not tickers:
+            return list(queryset.iterator())
+        symbols = StockPriceService.normalize_tickers(tickers)
+        held = list(queryset.filter(ticker__in={*tickers, *symbols}).iterator())
+        stored = {ticker.upper() for ticker in held}
+        return held + [symbol for symbol in symbols if symbol not in stored]
+
+    @staticmethod
+    def store_missing(tickers: List[str]) -> List[str]:
+        """
+        Store quotes of tickers without a PriceQuote row, such as the ticker of a
+        lot just added, so every page prices it before the next refresh.
+        Returns tickers written
+        """
+        symbols = StockPriceService.normalize_tickers(tickers)
+        stored = set(PriceQuote.objects.filter(ticker__in=symbols).values_list('ticker', flat=True))
+        missing = [symbol for symbol in symbols if symbol not in stored]
+        if not missing:
+            return []
+        written, _ = PriceRefresher.write(StockPriceService.get_stock_quotes(missing))
+        return written
+
+    @staticmethod
+    def _chunks(items: list):
+        for start in range(0, len(items), WRITE_CHUNK_SIZE):
+            yield items[start:start + WRITE_CHUNK_SIZE]
+
+    @staticmethod
+    def changed_quotes(quotes: Dict[str, Optional[dict]]) -> List[PriceQuote]:
+        """
+        Unsaved PriceQuote rows for quotes (as returned by StockPriceService.get_stock_quotes)
+        whose price or previous close differs from the stored row, one query per chunk
+        """
+        rows = []
+        for symbol, quote in quotes.items():
+            if not quote or quote.get('price') is None:
+                continue
+            previous_close = quote.get('previous_close')
+            rows.append(PriceQuote(
+                ticker=symbol.upper(),
+                price=quote['price'].quantize(CENT),
+                previous_close=previous_close.quantize(CENT) if previous_close is not None else None,
+                as_of=quote.get('fetched_at') or timezone.now(),
+            ))
+
+        changed = []
+        for chunk in PriceRefresher._chunks(rows):
+            stored = {
+                ticker: (price, previous_close)
+                for ticker, price, previous_close in PriceQuote.objects.filter(
+                    ticker__in=[row.ticker for row in chunk]
+                ).values_list('ticker', 'price', 'previous_close')
+            }
+            changed.extend(row for row in chunk if stored.get(row.ticker) != (row.price, row.previous_close))
+        return changed
+
+    @staticmethod
+    def _holders(tickers: List[str]) -> Set[int]:
+        """Ids of portfolios with lots of tickers"""
+        portfolios = set()
+        for chunk in PriceRefresher._chunks(tickers):
+            portfolios.update(
+                Stock.objects.filter(ticker__in=chunk).values_list('portfolio_id', flat=True).distinct()
+            )
+        return portfolios
+
+    @staticmethod
+    def preview(quotes: Dict[str, Optional[dict]]) -> Tuple[List[str], Set[int]]:
+        """
+        Tickers whose stored quotes write() would change, and portfolios holding them.
+        Returns (tickers, portfolio ids)
+        """
+        tickers = sorted(row.ticker for row in PriceRefresher.changed_quotes(quotes))
+        return tickers, PriceRefresher._holders(tickers)
+
+    @staticmethod
+    def write(quotes: Dict[str, Optional[dict]]) -> Tuple[List[str], Set[int]]:
+        """
+        Store quotes whose price changed, one upsert per chunk of tickers.
+        Cached summaries of portfolios holding changed tickers are invalidated.
+        Returns (changed tickers, portfolio ids)
+        """
+        changed = PriceRefresher.changed_quotes(quotes)
+        if not changed:
+            return [], set()
+        tickers = sorted(row.ticker for row in changed)
+        with transaction.atomic():
+            PriceQuote.objects.bulk_create(
+                changed,
+                batch_size=WRITE_CHUNK_SIZE,
+                update_conflicts=True,
+                unique_fields=['ticker'],
+                update_fields=['price', 'previous_close', 'as_of'],
+            )
+            portfolios = PriceRefresher._holders(tickers)
+            for portfolio_id in portfolios:
+                SummaryCache.bump(portfolio_id)
+        return tickers, portfolios
@@ -1,201 +1,651 @@
+import logging
+import math
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
 from django.core.cache import cache
-import yfinance as yf
+from django.utils import timezone
 from decimal import Decimal
-from typing import Optional
+from typing import Dict, Iterable, List, Optional
+from . import metrics, rate_limit
+from .circuit_breaker import CircuitBreaker
+from .local_cache import LocalCache
+from .market_calendar import get_market_calendar
+from .providers import get_provider
+
+logger = logging.getLogger(__name__)
+
 
 class StockPriceService:
-    CACHE_TIMEOUT = 1800  # 30 минут
+    # During a session prices and quotes older than settings.STOCK_PRICE_CACHE_TIMEOUT
+    # are served stale and refreshed in background until they leave the shared cache.
+    # While the market is closed they stay fresh until the next open (see MarketCalendar)
+    CACHE_TIMEOUT = 1800  # hard TTL for prices and quotes during a session, 30 минут
+    LAST_VALUE_TIMEOUT = 86400  # last known values are kept for a day as a fallback
+    LOCK_TIMEOUT = 30  # refresh lock expires even if its holder dies
+    LOCK_WAIT = 3.0  # how long other callers wait for the lock holder
+    LOCK_POLL_INTERVAL = 0.1
+    REFRESH_WORKERS = 4
+    NEGATIVE_TIMEOUT = 60  # first backoff for a ticker the provider has no data for
+    NEGATIVE_MAX_TIMEOUT = 3600  # backoff doubles on every failed retry up to an hour
+    BREAKER_FAILURES = 5  # consecutive provider failures that open the circuit breaker
+    BREAKER_COOLDOWN = 60  # seconds all provider calls are skipped once it is open
+
+    _refresh_executor = ThreadPoolExecutor(max_workers=REFRESH_WORKERS, thread_name_prefix='quote-refresh')
+    _refreshing = set()  # tickers with a background refresh in flight in this process
+    _refreshing_lock = threading.Lock()
+
+    # Shared cache key prefixes by data class
+    CACHE_PREFIXES = {
+        'price': 'stock_price_',
+        'quote': 'stock_quote_',
+        'overview': 'company_overview_',
+    }
+    _local_cache = LocalCache(settings.STOCK_LOCAL_CACHE_MAX_ENTRIES, name='l1')
+    breaker = CircuitBreaker('breaker.yahoo', BREAKER_FAILURES, BREAKER_COOLDOWN)
 
     @staticmethod
     def get_stock_price(ticker: str) -> Optional[Decimal]:
-        """Get current stock price from Yahoo Finance with caching and fallback."""
-        cache_key = f"stock_price_{ticker.upper()}"
-        cached = cache.get(cache_key)
+        """Get current stock price from the market data provider with caching and fallback."""
+        symbol = ticker.upper()
+        cached = StockPriceService._cache_get('price', [symbol]).get(symbol)
         if cached is not None:
-            return Decimal(str(cached))
-        
-        try:
-            stock = yf.Ticker(ticker.upper())
-            info = stock.info
-            price = info.get('regularMarketPrice') or info.get('currentPrice')
-            if price is not None:
-                cache.set(cache_key, str(price), StockPriceService.CACHE_TIMEOUT)
-                return Decimal(str(price))
-        except Exception as e:
-            print(f"YF error for {ticker}: {e}")
+            if StockPriceService._is_stale(cached):
+                StockPriceService._schedule_refresh([symbol])
+            return cached['price']
         
-        return None
+        data = StockPriceService._hydrate(symbol)
+        return data['price'] if data else None
 
     @staticmethod
     def get_company_overview(ticker: str):
-        """Get company info from Yahoo Finance with caching and fallback."""
-        cache_key = f"company_overview_{ticker.upper()}"
-        cached = cache.get(cache_key)
+        """Get company info from the market data provider with caching and fallback."""
+        symbol = ticker.upper()
+        cached = StockPriceService._cache_get('overview', [symbol]).get(symbol)
         if cached is not None:
             return cached
         
-        try:
-            stock = yf.Ticker(ticker.upper())
-            info = stock.info
-            result = {
-                'symbol': ticker.upper(),
-                'name': info.get('longName') or info.get('shortName') or ticker.upper(),
-                'description': info.get('longBusinessSummary', ''),
-                'exchange': info.get('exchange', ''),
-                'currency': info.get('currency', ''),
-                'country': info.get('country', ''),
-                'sector': info.get('sector', ''),
-                'industry': info.get('industry', ''),
-                'market_cap': info.get('marketCap', 0),
-                'employees': info.get('fullTimeEmployees', 0),
-                'website': info.get('website', ''),
-            }
-            cache.set(cache_key, result, StockPriceService.CACHE_TIMEOUT)
-            return result
-        except Exception as e:
-            print(f"YF company info error for {ticker}: {e}")
-        
-        return None
+        data = StockPriceService._hydrate(symbol)
+        return data['overview'] if data else None
+
+    @staticmethod
+    def get_company_overviews(tickers: Iterable[str]) -> Dict[str, Optional[dict]]:
+        """
+        Get company info for many tickers at once.
+        Cached overviews are read in one lookup; the provider has no bulk info
+        request, so only the misses are fetched, one info call per ticker.
+        Returns dict mapping upper-cased ticker to overview (None if unavailable).
+        """
+        symbols = StockPriceService.normalize_tickers(tickers)
+        overviews = StockPriceService._cache_get('overview', symbols)
+        for symbol in symbols:
+            if symbol not in overviews:
+                data = StockPriceService._hydrate(symbol)
+                overviews[symbol] = data['overview'] if data else None
+        return {symbol: overviews[symbol] for symbol in symbols}
 
     @staticmethod
     def get_stock_quote(ticker: str):
-        """Get detailed stock quote from Yahoo Finance with caching and fallback."""
-        cache_key = f"stock_quote_{ticker.upper()}"
-        cached = cache.get(cache_key)
+        """
+        Get detailed stock quote from the market data provider with caching and fallback.
+        Quote has 'fetched_at' and 'is_stale'; stale quotes are refreshed in background.
+        """
+        symbol = ticker.upper()
+        cached = StockPriceService._cache_get('quote', [symbol]).get(symbol)
         if cached is not None:
-            return cached
+            quote = StockPriceService._with_freshness(cached)
+            if quote['is_stale']:
+                StockPriceService._schedule_refresh([symbol])
+            return quote
         
+        data = StockPriceService._hydrate(symbol)
+        return data['quote'] if data else None
+
+    @staticmethod
+    def _hydrate(ticker: str, wait: bool = True) -> Optional[dict]:
+        """
+        Fetch provider info for a ticker once and fill price, quote and overview caches.
+        Only one process refreshes a ticker at a time; others wait for its result
+        or get the last known value (unless wait is False, then they return None).
+        Tickers in negative cache backoff and calls refused by the circuit breaker
+        also get the last known value without a provider request.
+        Returns dict with 'price', 'quote' and 'overview', or None if nothing is available.
+        """
+        symbol = ticker.upper()
+        keys = [f"stock_quote_{symbol}", f"company_overview_{symbol}"]
+
+        if StockPriceService.backed_off([symbol]):
+            return StockPriceService._last_known(symbol)
+
+        token = StockPriceService._acquire_refresh_lock(symbol)
+        if token is None:
+            if not wait:
+                return None
+            found = StockPriceService._wait_for_refresh([symbol], keys)
+            if len(found) == len(keys):
+                return StockPriceService._hydrated(found[keys[0]], found[keys[1]])
+            metrics.incr('singleflight.fallback')
+            return StockPriceService._last_known(symbol)
+
+        try:
+            # Another process may have refreshed the ticker while we were taking the lock
+            found = cache.get_many(keys)
+            if len(found) == len(keys) and not StockPriceService._is_stale(found[keys[0]]):
+                StockPriceService._local_set_many(found)
+                return StockPriceService._hydrated(found[keys[0]], found[keys[1]])
+
+            if not StockPriceService.provider_call_allowed():
+                return StockPriceService._last_known(symbol)
+            try:
+                metrics.incr('upstream.info')
+                info = get_provider().get_info(symbol)
+                quote = StockPriceService._quote_from_info(symbol, info)
+                overview = StockPriceService._overview_from_info(symbol, info)
+            except Exception as e:
+                logger.warning(f"Provider info error for {symbol}: {e}")
+                StockPriceService.breaker.record_failure()
+                StockPriceService._back_off([symbol])
+                return StockPriceService._last_known(symbol)
+            StockPriceService.breaker.record_success()
+
+            if quote['price'] is None:
+                # Provider answered but has no price: most likely an unknown ticker
+                StockPriceService._back_off([symbol])
+                return StockPriceService._last_known(symbol)
+
+            StockPriceService._store_quotes({symbol: quote}, overviews={symbol: overview})
+            return StockPriceService._hydrated(quote, overview)
+        finally:
+            StockPriceService._release_refresh_lock(symbol, token)
+
+    @staticmethod
+    def _hydrated(quote: dict, overview: Optional[dict]) -> dict:
+        """Build _hydrate result from quote and overview."""
+        quote = StockPriceService._with_freshness(quote)
+        return {'price': quote['price'], 'quote': quote, 'overview': overview}
+
+    @staticmethod
+    def provider_call_allowed() -> bool:
+        """
+        Check the circuit breaker and take a token from the shared rate limiter
+        before a provider call. Returns False if the call must be skipped.
+        """
+        if not StockPriceService.breaker.allow():
+            return False
+        limiter = rate_limit.get_rate_limiter()
+        if limiter is None:
+            return True
         try:
-            stock = yf.Ticker(ticker.upper())
-            info = stock.info
-            current_price = info.get('regularMarketPrice') or info.get('currentPrice')
-            previous_close = info.get('regularMarketPreviousClose', current_price)
-            change = None
-            change_percent = None
-            if current_price is not None and previous_close is not None:
-                change = Decimal(str(current_price)) - Decimal(str(previous_close))
-                if Decimal(str(previous_close)) != 0:
-                    change_percent = (change / Decimal(str(previous_close))) * 100
-            result = {
-                'symbol': ticker.upper(),
-                'price': Decimal(str(current_price)) if current_price is not None else None,
-                'change': change,
-                'change_percent': f"{change_percent:.2f}%" if change_percent is not None else None,
-                'volume': info.get('volume'),
-                'previous_close': Decimal(str(previous_close)) if previous_close is not None else None,
-                'open': info.get('regularMarketOpen'),
-                'high': info.get('regularMarketDayHigh'),
-                'low': info.get('regularMarketDayLow'),
-                'latest_trading_day': info.get('regularMarketTime'),
-            }
-            cache.set(cache_key, result, StockPriceService.CACHE_TIMEOUT)
-            return result
+            limiter.acquire()
+        except rate_limit.RateLimited as e:
+            logger.warning(f"Provider call skipped: {e}")
+            StockPriceService.breaker.cancel()
+            return False
+        return True
+
+    @staticmethod
+    def _last_known(symbol: str) -> Optional[dict]:
+        """Build _hydrate result from last known quote and overview, None if there is none."""
+        last = cache.get_many([f"stock_quote_last_{symbol}", f"company_overview_last_{symbol}"])
+        if f"stock_quote_last_{symbol}" not in last:
+            return None
+        return StockPriceService._hydrated(
+            last[f"stock_quote_last_{symbol}"], last.get(f"company_overview_last_{symbol}")
+        )
+
+    @staticmethod
+    def backed_off(symbols: List[str]) -> set:
+        """Return tickers that recently failed and must not be requested from the provider yet."""
+        found = cache.get_many([f"negative_{symbol}" for symbol in symbols])
+        now = time.time()
+        backed_off = {
+            symbol for symbol in symbols
+            if found.get(f"negative_{symbol}", {}).get('retry_at', 0) > now
+        }
+        if backed_off:
+            metrics.incr('negative.hit', len(backed_off))
+        return backed_off
+
+    @staticmethod
+    def _back_off(symbols: List[str]) -> None:
+        """
+        Remember tickers the provider returned nothing for.
+        The retry delay starts at NEGATIVE_TIMEOUT and doubles with every failure
+        in a row, up to NEGATIVE_MAX_TIMEOUT.
+        """
+        found = cache.get_many([f"negative_{symbol}" for symbol in symbols])
+        now = time.time()
+        entries = {}
+        for symbol in symbols:
+            failures = found.get(f"negative_{symbol}", {}).get('failures', 0) + 1
+            delay = min(
+                StockPriceService.NEGATIVE_TIMEOUT * 2 ** (failures - 1),
+                StockPriceService.NEGATIVE_MAX_TIMEOUT,
+            )
+            entries[f"negative_{symbol}"] = {'failures': failures, 'retry_at': now + delay}
+            logger.info(f"No data for {symbol}, not retrying for {delay}s")
+        metrics.incr('negative.stored', len(symbols))
+        # Failure count outlives the backoff so that the next failure backs off longer
+        cache.set_many(entries, StockPriceService.NEGATIVE_MAX_TIMEOUT * 2)
+
+    @staticmethod
+    def _store_quotes(quotes: Dict[str, dict], overviews: Optional[Dict[str, dict]] = None) -> None:
+        """Write fetched quotes (and overviews) to per-ticker cache entries and last known values."""
+        entries = {}
+        overview_entries = {}
+        last_values = {}
+        for symbol, quote in quotes.items():
+            entries[f"stock_quote_{symbol}"] = quote
+            last_values[f"stock_quote_last_{symbol}"] = quote
+            if quote['price'] is not None:
+                entries[f"stock_price_{symbol}"] = {
+                    'price': quote['price'],
+                    'fetched_at': quote['fetched_at'],
+                }
+        for symbol, overview in (overviews or {}).items():
+            overview_entries[f"company_overview_{symbol}"] = overview
+            last_values[f"company_overview_last_{symbol}"] = overview
+        if entries:
+            cache.set_many(entries, StockPriceService._quote_timeout())
+        if overview_entries:
+            cache.set_many(overview_entries, settings.COMPANY_INFO_CACHE_TIMEOUT)
+        if last_values:
+            cache.set_many(last_values, StockPriceService.LAST_VALUE_TIMEOUT)
+        if quotes:
+            cache.delete_many([f"negative_{symbol}" for symbol in quotes])
+        StockPriceService._local_set_many({**entries, **overview_entries})
+
+    @staticmethod
+    def _cache_get(kind: str, symbols: List[str]) -> dict:
+        """
+        Look up cached entries of one data class ('price', 'quote' or 'overview'),
+        in-process cache first. Tickers missing there are loaded from the shared cache
+        with all their data classes at once, so later lookups for them stay in process.
+        Returns dict mapping ticker to cached entry, missing tickers are left out.
+        """
+        prefix = StockPriceService.CACHE_PREFIXES[kind]
+        found = StockPriceService._local_cache.get_many([f"{prefix}{symbol}" for symbol in symbols])
+        missing = [symbol for symbol in symbols if f"{prefix}{symbol}" not in found]
+        if missing:
+            shared = cache.get_many([
+                f"{other_prefix}{symbol}"
+                for symbol in missing
+                for other_prefix in StockPriceService.CACHE_PREFIXES.values()
+            ])
+            StockPriceService._local_set_many(shared)
+            found.update(shared)
+        return {symbol: found[f"{prefix}{symbol}"] for symbol in symbols if f"{prefix}{symbol}" in found}
+
+    @staticmethod
+    def _local_set_many(entries: dict) -> None:
+        """Put shared cache entries into the in-process cache with their data class timeout."""
+        timeouts = settings.STOCK_LOCAL_CACHE_TIMEOUTS
+        for kind, prefix in StockPriceService.CACHE_PREFIXES.items():
+            part = {key: value for key, value in entries.items() if key.startswith(prefix)}
+            if part:
+                StockPriceService._local_cache.set_many(part, timeouts.get(kind))
+
+    @staticmethod
+    def invalidate(tickers: Iterable[str]) -> None:
+        """
+        Drop cached prices and quotes for tickers so the next lookup fetches them again.
+        Other processes may serve their in-process copy until it expires.
+        """
+        keys = [
+            f"{StockPriceService.CACHE_PREFIXES[kind]}{symbol}"
+            for symbol in StockPriceService.normalize_tickers(tickers)
+            for kind in ('price', 'quote')
+        ]
+        cache.delete_many(keys)
+        StockPriceService._local_cache.delete_many(keys)
+
+    @staticmethod
+    def _quote_timeout() -> int:
+        """
+        Shared cache timeout for prices and quotes.
+        While the market is closed they are kept until CACHE_TIMEOUT after the next open,
+        so the first requests of the session are still served from cache.
+        """
+        until_open = get_market_calendar().seconds_until_open()
+        return int(until_open) + StockPriceService.CACHE_TIMEOUT
+
+    @staticmethod
+    def _is_stale(entry: dict) -> bool:
+        """Check if cached entry needs a refresh according to market hours."""
+        fetched_at = entry.get('fetched_at')
+        if fetched_at is None:
+            return True
+        return not get_market_calendar().is_fresh(fetched_at, settings.STOCK_PRICE_CACHE_TIMEOUT)
+
+    @staticmethod
+    def stale_tickers(tickers: Iterable[str]) -> List[str]:
+        """
+        Return upper-cased tickers whose cached quote is missing or needs a refresh.
+        While the market is closed this is empty once quotes were fetched after the last close.
+        """
+        symbols = StockPriceService.normalize_tickers(tickers)
+        cached = StockPriceService._cache_get('quote', symbols)
+        return [
+            symbol for symbol in symbols
+            if symbol not in cached or StockPriceService._is_stale(cached[symbol])
+        ]
+
+    @staticmethod
+    def _with_freshness(quote: dict) -> dict:
+        """Return copy of quote marked with 'is_stale'."""
+        quote = dict(quote)
+        quote['is_stale'] = StockPriceService._is_stale(quote)
+        return quote
+
+    @staticmethod
+    def _schedule_refresh(symbols: List[str], bulk: bool = False) -> None:
+        """
+        Queue a background refresh for stale tickers.
+        Tickers that already have a refresh in flight in this process are skipped.
+        """
+        with StockPriceService._refreshing_lock:
+            symbols = [symbol for symbol in symbols if symbol not in StockPriceService._refreshing]
+            StockPriceService._refreshing.update(symbols)
+        if not symbols:
+            return
+
+        metrics.incr('swr.refresh_scheduled', len(symbols))
+        StockPriceService._refresh_executor.submit(StockPriceService._background_refresh, symbols, bulk)
+
+    @staticmethod
+    def _background_refresh(symbols: List[str], bulk: bool) -> None:
+        """
+        Refresh stale tickers on the background pool without waiting for other lock holders.
+        Provider calls go in the batch rate limit priority class.
+        """
+        try:
+            with rate_limit.priority(rate_limit.BATCH):
+                if bulk:
+                    StockPriceService._refresh_quotes(symbols, wait=False)
+                else:
+                    for symbol in symbols:
+                        StockPriceService._hydrate(symbol, wait=False)
         except Exception as e:
-            print(f"YF quote error for {ticker}: {e}")
-        
+            logger.warning(f"Background refresh error for {', '.join(symbols)}: {e}")
+        finally:
+            with StockPriceService._refreshing_lock:
+                StockPriceService._refreshing.difference_update(symbols)
+
+    @staticmethod
+    def _acquire_refresh_lock(symbol: str) -> Optional[str]:
+        """
+        Try to take the refresh lock for a ticker.
+        cache.add is atomic on shared backends, so at most one process gets the lock.
+        Returns lock token, or None if another caller holds it.
+        """
+        token = uuid.uuid4().hex
+        if cache.add(f"refresh_lock_{symbol}", token, StockPriceService.LOCK_TIMEOUT):
+            return token
         return None
 
     @staticmethod
-    def _get_demo_price(ticker: str) -> Optional[Decimal]:
-        """Get demo price for fallback."""
-        demo_prices = {
-            'AAPL': Decimal('175.50'),
-            'GOOGL': Decimal('142.80'),
-            'MSFT': Decimal('380.20'),
-            'TSLA': Decimal('245.30'),
-            'NVDA': Decimal('485.90'),
-            'AMZN': Decimal('145.60'),
-            'META': Decimal('330.40'),
-            'NFLX': Decimal('485.70'),
-            'AMD': Decimal('125.30'),
-            'INTC': Decimal('45.80'),
-            'JPM': Decimal('195.40'),
-            'V': Decimal('275.60'),
-            'WMT': Decimal('65.20'),
-            'JNJ': Decimal('155.80'),
-            'PG': Decimal('165.30'),
-        }
-        return demo_prices.get(ticker.upper())
-
-    @staticmethod
-    def _get_demo_company_info(ticker: str):
-        """Get demo company info for fallback."""
-        demo_companies = {
-            'AAPL': {
-                'symbol': 'AAPL',
-                'name': 'Apple Inc.',
-                'description': 'Apple Inc. designs, manufactures, and markets smartphones, personal computers, tablets, wearables and accessories, and sells a variety of related services.',
-                'exchange': 'NASDAQ',
-                'currency': 'USD',
-                'country': 'United States',
-                'sector': 'Technology',
-                'industry': 'Consumer Electronics',
-                'market_cap': 2800000000000,
-                'employees': 164000,
-                'website': 'https://www.apple.com',
-            },
-            'GOOGL': {
-                'symbol': 'GOOGL',
-                'name': 'Alphabet Inc.',
-                'description': 'Alphabet Inc. is an American multinational technology conglomerate holding company.',
-                'exchange': 'NASDAQ',
-                'currency': 'USD',
-                'country': 'United States',
-                'sector': 'Technology',
-                'industry': 'Internet Content & Information',
-                'market_cap': 1800000000000,
-                'employees': 156500,
-                'website': 'https://www.google.com',
-            },
-            'MSFT': {
-                'symbol': 'MSFT',
-                'name': 'Microsoft Corporation',
-                'description': 'Microsoft Corporation develops, licenses, and supports software, services, devices, and solutions worldwide.',
-                'exchange': 'NASDAQ',
-                'currency': 'USD',
-                'country': 'United States',
-                'sector': 'Technology',
-                'industry': 'Software—Infrastructure',
-                'market_cap': 3000000000000,
-                'employees': 221000,
-                'website': 'https://www.microsoft.com',
-            },
-        }
-        return demo_companies.get(ticker.upper(), {
+    def _release_refresh_lock(symbol: str, token: str) -> None:
+        """Release the refresh lock for a ticker if it is still ours."""
+        lock_key = f"refresh_lock_{symbol}"
+        if cache.get(lock_key) == token:
+            cache.delete(lock_key)
+
+    @staticmethod
+    def _wait_for_refresh(symbols: List[str], keys: List[str]) -> dict:
+        """
+        Wait for other lock holders to fill the given cache keys.
+        Stops early once all locks for the symbols are released. Returns whatever keys were found.
+        """
+        metrics.incr('singleflight.wait', len(symbols))
+        lock_keys = [f"refresh_lock_{symbol}" for symbol in symbols]
+        deadline = time.monotonic() + StockPriceService.LOCK_WAIT
+        found = {}
+        while time.monotonic() < deadline:
+            time.sleep(StockPriceService.LOCK_POLL_INTERVAL)
+            found = cache.get_many(keys + lock_keys)
+            if all(key in found for key in keys) or not any(key in found for key in lock_keys):
+                break
+        return {key: value for key, value in found.items() if key in keys}
+
+    @staticmethod
+    def _quote_from_info(ticker: str, info: dict) -> dict:
+        """Build quote dict from Yahoo Finance info payload."""
+        current_price = info.get('regularMarketPrice') or info.get('currentPrice')
+        previous_close = info.get('regularMarketPreviousClose', current_price)
+        return StockPriceService._build_quote(
+            ticker,
+            current_price,
+            previous_close,
+            volume=info.get('volume'),
+            open=info.get('regularMarketOpen'),
+            high=info.get('regularMarketDayHigh'),
+            low=info.get('regularMarketDayLow'),
+            latest_trading_day=info.get('regularMarketTime'),
+        )
+
+    @staticmethod
+    def _overview_from_info(ticker: str, info: dict) -> dict:
+        """Build company overview dict from Yahoo Finance info payload."""
+        return {
             'symbol': ticker.upper(),
-            'name': ticker.upper(),
-            'description': 'Demo company information',
-            'exchange': '',
-            'currency': 'USD',
-            'country': '',
-            'sector': '',
-            'industry': '',
-            'market_cap': 0,
-            'employees': 0,
-            'website': '',
-        })
-
-    @staticmethod
-    def _get_demo_quote(ticker: str):
-        """Get demo quote for fallback."""
-        demo_price = StockPriceService._get_demo_price(ticker)
-        if demo_price is None:
+            'name': info.get('longName') or info.get('shortName') or ticker.upper(),
+            'description': info.get('longBusinessSummary', ''),
+            'exchange': info.get('exchange', ''),
+            'currency': info.get('currency', ''),
+            'country': info.get('country', ''),
+            'sector': info.get('sector', ''),
+            'industry': info.get('industry', ''),
+            'market_cap': info.get('marketCap', 0),
+            'employees': info.get('fullTimeEmployees', 0),
+            'website': info.get('website', ''),
+        }
+
+    @staticmethod
+    def get_stock_quotes(tickers: Iterable[str]) -> Dict[str, Optional[dict]]:
+        """
+        Get quotes for many tickers at once.
+        Cache hits are served per ticker (stale ones are refreshed in background); all
+        misses are fetched in a single bulk provider request and written back to the
+        per-ticker quote and price caches.
+        Returns dict mapping upper-cased ticker to quote (None if unavailable).
+        """
+        symbols = StockPriceService.normalize_tickers(tickers)
+        if not symbols:
+            return {}
+
+        cached = StockPriceService._cache_get('quote', symbols)
+        quotes = {}
+        stale = []
+        for symbol in symbols:
+            quote = cached.get(symbol)
+            if quote is not None:
+                quote = StockPriceService._with_freshness(quote)
+                if quote['is_stale']:
+                    stale.append(symbol)
+            quotes[symbol] = quote
+
+        if stale:
+            StockPriceService._schedule_refresh(stale, bulk=True)
+
+        missing = [symbol for symbol, quote in quotes.items() if quote is None]
+        if missing:
+            quotes.update(StockPriceService._refresh_quotes(missing))
+
+        return quotes
+
+    @staticmethod
+    def get_stock_prices(tickers: Iterable[str]) -> Dict[str, Optional[Decimal]]:
+        """
+        Get current prices for many tickers at once.
+        Returns dict mapping upper-cased ticker to price (None if unavailable).
+        """
+        symbols = StockPriceService.normalize_tickers(tickers)
+        cached = StockPriceService._cache_get('price', symbols)
+        prices = {}
+        missing = []
+        stale = []
+        for symbol in symbols:
+            entry = cached.get(symbol)
+            if entry is not None:
+                prices[symbol] = entry['price']
+                if StockPriceService._is_stale(entry):
+                    stale.append(symbol)
+            else:
+                missing.append(symbol)
+
+        if stale:
+            StockPriceService._schedule_refresh(stale, bulk=True)
+
+        if missing:
+            for symbol, quote in StockPriceService.get_stock_quotes(missing).items():
+                prices[symbol] = quote['price'] if quote else None
+
+        return prices
+
+    @staticmethod
+    def _refresh_quotes(symbols: List[str], wait: bool = True) -> Dict[str, Optional[dict]]:
+        """
+        Fetch quotes in one bulk request for tickers whose refresh lock we get.
+        Tickers locked by another caller are waited for (or skipped if wait is False)
+        and fall back to their last known value, as do tickers in negative cache
+        backoff and tickers the request failed for.
+        """
+        quotes = {}
+        tokens = {}
+        waiting = []
+        backed_off = StockPriceService.backed_off(symbols)
+        for symbol in symbols:
+            if symbol in backed_off:
+                quotes[symbol] = StockPriceService._last_known_quote(symbol)
+                continue
+            token = StockPriceService._acquire_refresh_lock(symbol)
+            if token is None:
+                waiting.append(symbol)
+            else:
+                tokens[symbol] = token
+
+        try:
+            if tokens:
+                fetched = StockPriceService._fetch_bulk_quotes(list(tokens))
+                if fetched is not None:
+                    StockPriceService._store_quotes(fetched)
+                    unknown = [symbol for symbol in tokens if symbol not in fetched]
+                    if unknown:
+                        StockPriceService._back_off(unknown)
+                for symbol in tokens:
+                    quote = (fetched or {}).get(symbol)
+                    if quote is not None:
+                        quotes[symbol] = StockPriceService._with_freshness(quote)
+                    else:
+                        quotes[symbol] = StockPriceService._last_known_quote(symbol)
+        finally:
+            for symbol, token in tokens.items():
+                StockPriceService._release_refresh_lock(symbol, token)
+
+        if waiting and wait:
+            found = StockPriceService._wait_for_refresh(waiting, [f"stock_quote_{symbol}" for symbol in waiting])
+            for symbol in waiting:
+                quote = found.get(f"stock_quote_{symbol}")
+                if quote is not None:
+                    quotes[symbol] = StockPriceService._with_freshness(quote)
+                else:
+                    metrics.incr('singleflight.fallback')
+                    quotes[symbol] = StockPriceService._last_known_quote(symbol)
+
+        return quotes
+
+    @staticmethod
+    def _last_known_quote(symbol: str) -> Optional[dict]:
+        """Return last known quote for a ticker, None if there is none."""
+        quote = cache.get(f"stock_quote_last_{symbol}")
+        return StockPriceService._with_freshness(quote) if quote else None
+
+    @staticmethod
+    def normalize_tickers(tickers: Iterable[str]) -> List[str]:
+        """Upper-case tickers, drop empty values and duplicates, keep order."""
+        return list(dict.fromkeys(ticker.upper().strip() for ticker in tickers if ticker and ticker.strip()))
+
+    @staticmethod
+    def _fetch_bulk_quotes(symbols: List[str]) -> Optional[Dict[str, dict]]:
+        """
+        Fetch quotes for all symbols with one provider daily bars request.
+        Uses the last two daily bars: last close is the price, the one before is previous close.
+        Symbols without data are left out of the result.
+        Returns None if the request failed or the circuit breaker refused it.
+        """
+        if not StockPriceService.provider_call_allowed():
             return None
-        
-        # Simulate some price movement
-        import random
-        change = Decimal(str(random.uniform(-5, 5)))
-        change_percent = (change / demo_price) * 100
-        
-        return {
+        try:
+            metrics.incr('upstream.bulk')
+            bars = get_provider().get_daily_bars(symbols)
+        except Exception as e:
+            logger.warning(f"Bulk quote error for {', '.join(symbols)}: {e}")
+            StockPriceService.breaker.record_failure()
+            return None
+        StockPriceService.breaker.record_success()
+
+        quotes = {}
+        for symbol, symbol_bars in bars.items():
+            if not symbol_bars:
+                continue
+            last = symbol_bars[-1]
+            previous_close = symbol_bars[-2]['close'] if len(symbol_bars) > 1 else last['close']
+            quotes[symbol] = StockPriceService._build_quote(
+                symbol,
+                last['close'],
+                previous_close,
+                volume=StockPriceService._to_int(last.get('volume')),
+                open=StockPriceService._to_float(last.get('open')),
+                high=StockPriceService._to_float(last.get('high')),
+                low=StockPriceService._to_float(last.get('low')),
+                latest_trading_day=last['date'],
+            )
+        return quotes
+
+    @staticmethod
+    def _build_quote(ticker: str, current_price, previous_close, **fields) -> dict:
+        """Build quote dict with change and change percent from raw price values."""
+        current_price = StockPriceService._to_decimal(current_price)
+        previous_close = StockPriceService._to_decimal(previous_close)
+        change = None
+        change_percent = None
+        if current_price is not None and previous_close is not None:
+            change = current_price - previous_close
+            if previous_close != 0:
+                change_percent = (change / previous_close) * 100
+        result = {
             'symbol': ticker.upper(),
-            'price': demo_price,
+            'price': current_price,
             'change': change,
-            'change_percent': f"{change_percent:.2f}%",
-            'volume': random.randint(1000000, 50000000),
-            'previous_close': demo_price - change,
-            'open': demo_price + Decimal(str(random.uniform(-2, 2))),
-            'high': demo_price + Decimal(str(random.uniform(0, 3))),
-            'low': demo_price - Decimal(str(random.uniform(0, 3))),
-            'latest_trading_day': '2025-06-20',
-        } 
\ No newline at end of file
+            'change_percent': f"{change_percent:.2f}%" if change_percent is not None else None,
+            'volume': fields.get('volume'),
+            'previous_close': previous_close,
+            'open': fields.get('open'),
+            'high': fields.get('high'),
+            'low': fields.get('low'),
+            'latest_trading_day': fields.get('latest_trading_day'),
+            'fetched_at': timezone.now(),
+        }
+        return result
+
+    @staticmethod
+    def _to_float(value) -> Optional[float]:
+        """Convert provider number to float, None for missing or NaN."""
+        if value is None:
+            return None
+        value = float(value)
+        return None if math.isnan(value) else value
+
+    @staticmethod
+    def _to_int(value) -> Optional[int]:
+        """Convert provider number to int, None for missing or NaN."""
+        value = StockPriceService._to_float(value)
+        return int(value) if value is not None else None
+
+    @staticmethod
+    def _to_decimal(value) -> Optional[Decimal]:
+        """Convert provider number to Decimal rounded to 4 places, None for missing or NaN."""
+        value = StockPriceService._to_float(value)
+        return Decimal(str(round(value, 4))) if value is not None else None
@@ -1,3 +1,1119 @@
-from django.test import TestCase
+import gzip
+import tempfile
+import threading
+import time
+from io import StringIO
+from pathlib import Path
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from unittest import mock, skipUnless
 
-# Create your tests here.
+import pandas as pd
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management import CommandError, call_command
+from django.core.cache import cache
+from django.core.cache.backends.redis import RedisCache
+from django.db import DataError, connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+try:
+    import fakeredis
+except ImportError:
+    fakeredis = None
+
+from .circuit_breaker import CircuitBreaker
+from apps.portfolios.models import Portfolio, Stock
+from apps.portfolios.services.ledger import PositionLedger
+from apps.portfolios.services.summary_cache import SummaryCache
+from .fetcher import BatchFetcher
+from .eod_loader import EodLoader
+from .history import HistoryBackfill
+from .local_cache import LocalCache
+from .models import DailyBar, HistoryCoverage, PriceQuote
+from .market_calendar import MarketCalendar, get_market_calendar
+from .providers import SimulatorProvider
+from .rate_limit import RateLimited, TokenBucket
+from .refresh import PriceRefresher
+from .services import StockPriceService
+from . import metrics, rate_limit
+
+
+def make_download_frame(closes):
+    """Build a frame shaped like yf.download(group_by='ticker') output"""
+    index = pd.to_datetime(['2025-06-18', '2025-06-19'])
+    frames = {}
+    for symbol, (previous, last) in closes.items():
+        frames[symbol] = pd.DataFrame({
+            'Open': [previous, last],
+            'High': [previous + 1, last + 1],
+            'Low': [previous - 1, last - 1],
+            'Close': [previous, last],
+            'Volume': [1000, 2000],
+        }, index=index)
+    return pd.concat(frames.values(), axis=1, keys=frames.keys())
+
+
+class BatchQuoteTest(TestCase):
+    """Тесты пакетного получения котировок"""
+
+    def setUp(self):
+        cache.clear()
+        StockPriceService._local_cache.clear()
+
+    @mock.patch('apps.stocks.providers.yahoo.yf.download')
+    def test_fetches_all_misses_in_one_request(self, download):
+        """Все промахи кэша загружаются одним запросом"""
+        download.return_value = make_download_frame({'AAPL': (100.0, 110.0), 'MSFT': (200.0, 190.0)})
+
+        quotes = StockPriceService.get_stock_quotes(['aapl', 'MSFT', 'AAPL'])
+
+        download.assert_called_once()
+        self.assertEqual(download.call_args[0][0], ['AAPL', 'MSFT'])
+        self.assertEqual(quotes['AAPL']['price'], Decimal('110.0'))
+        self.assertEqual(quotes['AAPL']['change'], Decimal('10.0'))
+        self.assertEqual(quotes['MSFT']['change_percent'], '-5.00%')
+
+    @mock.patch('apps.stocks.providers.yahoo.yf.download')
+    def test_fills_per_ticker_caches(self, download):
+        """Результаты пакетного запроса попадают в кэш по каждому тикеру"""
+        download.return_value = make_download_frame({'AAPL': (100.0, 110.0), 'MSFT': (200.0, 190.0)})
+        StockPriceService.get_stock_quotes(['AAPL', 'MSFT'])
+
+        with mock.patch('apps.stocks.providers.yahoo.yf.Ticker') as ticker:
+            self.assertEqual(StockPriceService.get_stock_price('MSFT'), Decimal('190.0'))
+            self.assertEqual(StockPriceService.get_stock_quote('AAPL')['price'], Decimal('110.0'))
+            ticker.assert_not_called()
+
+    @mock.patch('apps.stocks.providers.yahoo.yf.download')
+    def test_only_misses_are_requested(self, download):
+        """Тикеры из кэша не запрашиваются повторно"""
+        download.return_value = make_download_frame({'AAPL': (100.0, 110.0), 'MSFT': (200.0, 190.0)})
+        StockPriceService.get_stock_quotes(['AAPL', 'MSFT'])
+        download.reset_mock()
+
+        download.return_value = make_download_frame({'TSLA': (300.0, 310.0), 'NVDA': (400.0, 410.0)})
+        prices = StockPriceService.get_stock_prices(['AAPL', 'TSLA', 'NVDA'])
+
+        self.assertEqual(download.call_args[0][0], ['TSLA', 'NVDA'])
+        self.assertEqual(prices, {
+            'AAPL': Decimal('110.0'),
+            'TSLA': Decimal('310.0'),
+            'NVDA': Decimal('410.0'),
+        })
+
+    @mock.patch('apps.stocks.providers.yahoo.yf.download', side_effect=Exception('network down'))
+    def test_provider_error_returns_none(self, download):
+        """При ошибке провайдера возвращается None для каждого тикера"""
+        self.assertEqual(StockPriceService.get_stock_prices(['AAPL']), {'AAPL': None})
+
+
+INFO = {
+    'regularMarketPrice': 110.0,
+    'regularMarketPreviousClose': 100.0,
+    'longName': 'Apple Inc.',
+    'sector': 'Technology',
+}
+
+
+class HydrationTest(TestCase):
+    """Тесты единой загрузки котировки и информации о компании"""
+
+    def setUp(self):
+        cache.clear()
+        StockPriceService._local_cache.clear()
+
+    @mock.patch('apps.stocks.providers.yahoo.yf.Ticker')
+    def test_one_info_fetch_fills_all_caches(self, ticker):
+        """Один запрос info заполняет кэш цены, котировки и описания компании"""
+        ticker.return_value.info = INFO
+
+        self.assertEqual(StockPriceService.get_company_overview('AAPL')['name'], 'Apple Inc.')
+        self.assertEqual(StockPriceService.get_stock_quote('AAPL')['change'], Decimal('10.0'))
+        self.assertEqual(StockPriceService.get_stock_price('AAPL'), Decimal('110.0'))
+        ticker.assert_called_once_with('AAPL')
+
+    @mock.patch('apps.stocks.providers.yahoo.yf.Ticker')
+    def test_overviews_read_in_bulk_and_fetch_misses(self, ticker):
+        """Описания компаний читаются из кэша одним запросом, провайдер вызывается только для промахов"""
+        ticker.return_value.info = INFO
+        StockPriceService.get_company_overview('AAPL')
+        StockPriceService._local_cache.clear()
+        ticker.reset_mock()
+
+        with mock.patch.object(cache, 'get_many', wraps=cache.get_many) as get_many:
+            overviews = StockPriceService.get_company_overviews(['aapl', 'MSFT', 'AAPL'])
+        self.assertEqual(list(overviews), ['AAPL', 'MSFT'])
+        self.assertEqual(overviews['AAPL']['name'], 'Apple Inc.')
+        self.assertEqual(get_many.call_args_list[0].args[0][:3],
+                         ['stock_price_AAPL', 'stock_quote_AAPL', 'company_overview_AAPL'])
+        ticker.assert_called_once_with('MSFT')
+
+    @mock.patch('apps.stocks.providers.yahoo.yf.Ticker')
+    def test_middleware_reports_upstream_fetches(self, ticker):
+        """Middleware возвращает количество запросов к провайдеру в заголовке"""
+        ticker.return_value.info = INFO
+        user = get_user_model().objects.create_user(email='test@example.com', password='testpass123')
+        self.client.force_login(user)
+
+        response = self.client.get(reverse('stocks:stock_info', args=['AAPL']))
+        self.assertEqual(response['X-Upstream-Fetches'], '1')
+
+        response = self.client.get(reverse('stocks:stock_info', args=['AAPL']))
+        self.assertEqual(response['X-Upstream-Fetches'], '0')
+
+
+FAKE_REDIS_CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': 'redis://fake-redis:6379/0',
+        'OPTIONS': {'connection_class': getattr(fakeredis, 'FakeConnection', None)},
+    }
+}
+
+
+@skipUnless(fakeredis, 'fakeredis is not installed')
+@override_settings(CACHES=FAKE_REDIS_CACHES)
+class SingleFlightTest(TestCase):
+    """Тесты защиты от одновременного обновления котировок через общий Redis"""
+
+    def setUp(self):
+        cache.clear()
+        StockPriceService._local_cache.clear()
+
+    def other_process_cache(self):
+        """Отдельное подключение к тому же Redis, как у другого воркера"""
+        return RedisCache(FAKE_REDIS_CACHES['default']['LOCATION'], FAKE_REDIS_CACHES['default'])
+
+    @mock.patch('apps.stocks.providers.yahoo.yf.Ticker')
+    def test_concurrent_misses_fetch_once(self, ticker):
+        """Одновременные запросы одного тикера обращаются к провайдеру один раз"""
+        def slow_info():
+            time.sleep(0.3)
+            return INFO
+        type(ticker.return_value).info = mock.PropertyMock(side_effect=slow_info)
+
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(StockPriceService.get_stock_price('AAPL')))
+            for _ in range(4)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(ticker.call_count, 1)
+        self.assertEqual(results, [Decimal('110.0')] * 4)
+
+    @mock.patch.object(StockPriceService, 'LOCK_WAIT', 0.2)
+    @mock.patch('apps.stocks.providers.yahoo.yf.Ticker')
+    def test_waiter_gets_last_value_while_locked(self, ticker):
+        """Пока другой процесс держит блокировку, возвращается последнее известное значение"""
+        ticker.return_value.info = INFO
+        StockPriceService.get_stock_quote('AAPL')
+        cache.delete_many(['stock_quote_AAPL', 'stock_price_AAPL', 'company_overview_AAPL'])
+        StockPriceService._local_cache.clear()
+        ticker.reset_mock()
+
+        other = self.other_process_cache()
+        self.assertTrue(other.add('refresh_lock_AAPL', 'other-worker', 30))
+
+        self.assertEqual(StockPriceService.get_stock_price('AAPL'), Decimal('110.0'))
+        ticker.assert_not_called()
+
+
+# Календарь без закрытия рынка, чтобы устаревание зависело только от возраста котировки
+ALWAYS_OPEN_CALENDAR = {
+    'TIMEZONE': 'UTC',
+    'OPEN': '00:00',
+    'CLOSE': '23:59:59.999999',
+    'WEEKDAYS': range(7),
+}
+
+
+@override_settings(MARKET_CALENDAR=ALWAYS_OPEN_CALENDAR)
+class StaleWhileRevalidateTest(TestCase):
+    """Тесты выдачи устаревших котировок с фоновым обновлением"""
+
+    def setUp(self):
+        cache.clear()
+        StockPriceService._local_cache.clear()
+
+    def make_stale(self, symbol):
+        """Сдвигает время загрузки котировки за пределы мягкого TTL"""
+        fetched_at = timezone.now() - timedelta(seconds=settings.STOCK_PRICE_CACHE_TIMEOUT + 60)
+        for key in (f'stock_quote_{symbol}', f'stock_price_{symbol}'):
+            entry = cache.get(key)
+            entry['fetched_at'] = fetched_at
+            cache.set(key, entry)
+        StockPriceService._local_cache.clear()
+
+    def wait_for_refreshes(self):
+        """Ждёт завершения фоновых обновлений"""
+        deadline = time.monotonic() + 5
+        while StockPriceService._refreshing and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+    @mock.patch('apps.stocks.providers.yahoo.yf.Ticker')
+    def test_fresh_quote_is_not_stale(self, ticker):
+        """Только что загруженная котировка помечена как свежая"""
+        ticker.return_value.info = INFO
+        quote = StockPriceService.get_stock_quote('AAPL')
+        self.assertFalse(quote['is_stale'])
+        self.assertIsNotNone(quote['fetched_at'])
+
+    @mock.patch('apps.stocks.providers.yahoo.yf.Ticker')
+    def test_stale_quote_served_and_refreshed_in_background(self, ticker):
+        """Устаревшая котировка отдаётся сразу, обновление идёт в фоне"""
+        ticker.return_value.info = INFO
+        StockPriceService.get_stock_quote('AAPL')
+        self.make_stale('AAPL')
+        ticker.return_value.info = dict(INFO, regularMarketPrice=120.0)
+
+        with mock.patch.object(StockPriceService, '_schedule_refresh') as schedule:
+            quote = StockPriceService.get_stock_quote('AAPL')
+        self.assertTrue(quote['is_stale'])
+        self.assertEqual(quote['price'], Decimal('110.0'))
+        schedule.assert_called_once_with(['AAPL'])
+
+        StockPriceService.get_stock_quote('AAPL')
+        self.wait_for_refreshes()
+        quote = StockPriceService.get_stock_quote('AAPL')
+        self.assertFalse(quote['is_stale'])
+        self.assertEqual(quote['price'], Decimal('120.0'))
+
+    @mock.patch('apps.stocks.providers.yahoo.yf.Ticker')
+    def test_one_refresh_in_flight_per_ticker(self, ticker):
+        """Для одного тикера одновременно выполняется не больше одного обновления"""
+        ticker.return_value.info = INFO
+        StockPriceService.get_stock_quote('AAPL')
+        self.make_stale('AAPL')
+        ticker.reset_mock()
+
+        def slow_info():
+            time.sleep(0.2)
+            return INFO
+        type(ticker.return_value).info = mock.PropertyMock(side_effect=slow_info)
+
+        for _ in range(5):
+            StockPriceService.get_stock_price('AAPL')
+        self.wait_for_refreshes()
+        self.assertEqual(ticker.call_count, 1)
+
+
+class LocalCacheTest(TestCase):
+    """Тесты локального LRU-кэша процесса"""
+
+    def setUp(self):
+        metrics.reset()
+
+    def test_evicts_least_recently_used(self):
+        """При переполнении вытесняется давно не использованная запись"""
+        local = LocalCache(2, name='test_l1')
+        local.set('a', 1, 60)
+        local.set('b', 2, 60)
+        local.get('a')
+        local.set('c', 3, 60)
+
+        self.assertEqual(local.get_many(['a', 'b', 'c']), {'a': 1, 'c': 3})
+        counters = metrics.snapshot()
+        self.assertEqual(counters['test_l1.eviction'], 1)
+        self.assertEqual(counters['test_l1.hit'], 3)
+        self.assertEqual(counters['test_l1.miss'], 1)
+
+    def test_entries_expire(self):
+        """Запись недоступна после истечения своего таймаута"""
+        local = LocalCache(10)
+        local.set('a', 1, 60)
+        with mock.patch('apps.stocks.local_cache.time.monotonic', return_value=time.monotonic() + 61):
+            self.assertIsNone(local.get('a'))
+        self.assertEqual(len(local), 0)
+
+
+class TwoTierCacheTest(TestCase):
+    """Тесты двухуровневого кэша котировок"""
+
+    def setUp(self):
+        cache.clear()
+        StockPriceService._local_cache.clear()
+
+    @mock.patch('apps.stocks.providers.yahoo.yf.Ticker')
+    def test_shared_cache_read_once_per_ticker(self, ticker):
+        """Цена, котировка и описание компании читаются из общего кэша одним запросом"""
+        ticker.return_value.info = INFO
+        StockPriceService.get_stock_quote('AAPL')
+        StockPriceService._local_cache.clear()
+
+        with mock.patch.object(cache, 'get_many', wraps=cache.get_many) as get_many:
+            self.assertEqual(StockPriceService.get_stock_prices(['AAPL']), {'AAPL': Decimal('110.0')})
+            self.assertEqual(StockPriceService.get_stock_quotes(['AAPL'])['AAPL']['price'], Decimal('110.0'))
+            self.assertEqual(StockPriceService.get_company_overview('AAPL')['name'], 'Apple Inc.')
+        get_many.assert_called_once()
+        ticker.assert_called_once()
+
+    @override_settings(COMPANY_INFO_CACHE_TIMEOUT=1234)
+    @mock.patch('apps.stocks.providers.yahoo.yf.Ticker')
+    def test_overview_uses_configured_timeout(self, ticker):
+        """Описание компании хранится в общем кэше с таймаутом из настроек"""
+        ticker.return_value.info = INFO
+        with mock.patch.object(cache, 'set_many', wraps=cache.set_many) as set_many:
+            StockPriceService.get_company_overview('AAPL')
+        timeouts = {key: call.args[1] for call in set_many.call_args_list for key in call.args[0]}
+        self.assertEqual(timeouts['company_overview_AAPL'], 1234)
+        self.assertAlmostEqual(timeouts['stock_quote_AAPL'], StockPriceService._quote_timeout(), delta=1)
+
+    @mock.patch('apps.stocks.providers.yahoo.yf.Ticker')
+    def test_invalidate_clears_both_tiers(self, ticker):
+        """invalidate удаляет котировку из локального и общего кэша"""
+        ticker.return_value.info = INFO
+        StockPriceService.get_stock_price('AAPL')
+        StockPriceService.invalidate(['aapl'])
+
+        self.assertIsNone(cache.get('stock_price_AAPL'))
+        self.assertEqual(StockPriceService._local_cache.get_many(['stock_price_AAPL', 'stock_quote_AAPL']), {})
+
+
+def new_york(*args):
+    """Момент времени по часам нью-йоркской биржи"""
+    return datetime(*args, tzinfo=MarketCalendar.from_config(settings.MARKET_CALENDAR).tz)
+
+
+class MarketCalendarTest(TestCase):
+    """Тесты календаря торговых сессий"""
+
+    def setUp(self):
+        self.calendar = MarketCalendar.from_config(settings.MARKET_CALENDAR)
+
+    def test_session_hours(self):
+        """Рынок открыт только в часы сессии по рабочим дням"""
+        self.assertTrue(self.calendar.is_open(new_york(2026, 10, 16, 10, 0)))
+        self.assertFalse(self.calendar.is_open(new_york(2026, 10, 16, 16, 0)))
+        self.assertFalse(self.calendar.is_open(new_york(2026, 10, 17, 12, 0)))
+
+    def test_holidays_are_closed(self):
+        """В праздники сессии нет"""
+        self.assertFalse(self.calendar.is_open(new_york(2026, 11, 26, 12, 0)))
+        self.assertEqual(self.calendar.next_open(new_york(2026, 11, 25, 17, 0)), new_york(2026, 11, 27, 9, 30))
+
+    def test_next_open_and_last_close_over_weekend(self):
+        """В выходные следующая сессия в понедельник, последняя закрылась в пятницу"""
+        saturday = new_york(2026, 10, 17, 12, 0)
+        self.assertEqual(self.calendar.next_open(saturday), new_york(2026, 10, 19, 9, 30))
+        self.assertEqual(self.calendar.last_close(saturday), new_york(2026, 10, 16, 16, 0))
+
+    def test_freshness(self):
+        """В сессию котировка свежа недолго, после закрытия до следующего открытия"""
+        self.assertTrue(self.calendar.is_fresh(new_york(2026, 10, 16, 10, 0), 300, at=new_york(2026, 10, 16, 10, 4)))
+        self.assertFalse(self.calendar.is_fresh(new_york(2026, 10, 16, 10, 0), 300, at=new_york(2026, 10, 16, 10, 6)))
+        self.assertTrue(self.calendar.is_fresh(new_york(2026, 10, 16, 16, 5), 300, at=new_york(2026, 10, 18, 20, 0)))
+        self.assertFalse(self.calendar.is_fresh(new_york(2026, 10, 16, 15, 55), 300, at=new_york(2026, 10, 18, 20, 0)))
+
+
+class MarketHoursCacheTest(TestCase):
+    """Тесты времени жизни котировок в зависимости от работы биржи"""
+
+    def setUp(self):
+        cache.clear()
+        StockPriceService._local_cache.clear()
+
+    @mock.patch('apps.stocks.providers.yahoo.yf.Ticker')
+    def test_quotes_fetched_after_close_are_fresh_until_open(self, ticker):
+        """Котировки, полученные после закрытия, не обновляются до открытия рынка"""
+        ticker.return_value.info = INFO
+        with mock.patch('django.utils.timezone.now', return_value=new_york(2026, 10, 16, 17, 0)):
+            StockPriceService.get_stock_quote('AAPL')
+        with mock.patch('django.utils.timezone.now', return_value=new_york(2026, 10, 18, 20, 0)):
+            self.assertFalse(StockPriceService.get_stock_quote('AAPL')['is_stale'])
+            self.assertEqual(StockPriceService.stale_tickers(['AAPL']), [])
+        with mock.patch('django.utils.timezone.now', return_value=new_york(2026, 10, 19, 9, 45)):
+            self.assertEqual(StockPriceService.stale_tickers(['AAPL']), ['AAPL'])
+
+    def test_quote_timeout_lasts_until_open(self):
+        """Пока рынок закрыт, котировки хранятся до открытия"""
+        with mock.patch('django.utils.timezone.now', return_value=new_york(2026, 10, 16, 10, 0)):
+            self.assertEqual(StockPriceService._quote_timeout(), StockPriceService.CACHE_TIMEOUT)
+        with mock.patch('django.utils.timezone.now', return_value=new_york(2026, 10, 19, 8, 30)):
+            self.assertEqual(StockPriceService._quote_timeout(), 3600 + StockPriceService.CACHE_TIMEOUT)
+
+    @mock.patch('apps.stocks.providers.yahoo.yf.download')
+    def test_update_command_skips_current_prices(self, download):
+        """Команда обновления цен не обращается к провайдеру, если цены не могли измениться"""
+        download.return_value = make_download_frame({'AAPL': (100.0, 110.0)})
+        with mock.patch('django.utils.timezone.now', return_value=new_york(2026, 10, 17, 12, 0)):
+            call_command('update_stock_prices', ticker=['AAPL'], stdout=mock.Mock())
+            call_command('update_stock_prices', ticker=['AAPL'], stdout=mock.Mock())
+        download.assert_called_once()
+
+
+class FailureHandlingTest(TestCase):
+    """Тесты негативного кэша и автоматического выключателя провайдера"""
+
+    def setUp(self):
+        cache.clear()
+        StockPriceService._local_cache.clear()
+        StockPriceService.breaker.reset()
+        metrics.reset()
+
+    def tearDown(self):
+        StockPriceService.breaker.reset()
+
+    @mock.patch('apps.stocks.providers.yahoo.yf.Ticker')
+    def test_unknown_ticker_is_backed_off(self, ticker):
+        """Неизвестный тикер не запрашивается повторно до конца паузы, пауза растёт"""
+        ticker.return_value.info = {'longName': 'Nothing'}
+
+        self.assertIsNone(StockPriceService.get_stock_price('BAD'))
+        self.assertIsNone(StockPriceService.get_stock_price('BAD'))
+        ticker.assert_called_once()
+
+        later = time.time() + StockPriceService.NEGATIVE_TIMEOUT + 1
+        with mock.patch('apps.stocks.services.time.time', return_value=later):
+            self.assertIsNone(StockPriceService.get_stock_price('BAD'))
+        self.assertEqual(ticker.call_count, 2)
+        entry = cache.get('negative_BAD')
+        self.assertEqual(entry['failures'], 2)
+        self.assertAlmostEqual(entry['retry_at'], later + 2 * StockPriceService.NEGATIVE_TIMEOUT, delta=1)
+
+    @mock.patch('apps.stocks.providers.yahoo.yf.download')
+    def test_bulk_unknown_ticker_is_backed_off(self, download):
+        """Тикер без данных в пакетном ответе не запрашивается повторно"""
+        download.return_value = make_download_frame({'AAPL': (100.0, 110.0)})
+        prices = StockPriceService.get_stock_prices(['AAPL', 'BAD'])
+        self.assertEqual(prices, {'AAPL': Decimal('110.0'), 'BAD': None})
+
+        self.assertEqual(StockPriceService.get_stock_prices(['BAD']), {'BAD': None})
+        download.assert_called_once()
+
+    @mock.patch('apps.stocks.providers.yahoo.yf.Ticker')
+    def test_breaker_opens_after_repeated_failures(self, ticker):
+        """После серии ошибок провайдер не вызывается, отдаются последние известные значения"""
+        ticker.return_value.info = INFO
+        StockPriceService.get_stock_quote('AAPL')
+        StockPriceService.invalidate(['AAPL'])
+        ticker.reset_mock()
+
+        type(ticker.return_value).info = mock.PropertyMock(side_effect=Exception('timeout'))
+        for index in range(StockPriceService.BREAKER_FAILURES):
+            StockPriceService.get_stock_price(f'T{index}')
+        self.assertEqual(StockPriceService.breaker.state, 'open')
+        ticker.reset_mock()
+
+        self.assertEqual(StockPriceService.get_stock_price('AAPL'), Decimal('110.0'))
+        ticker.assert_not_called()
+        counters = metrics.snapshot()
+        self.assertEqual(counters['breaker.yahoo.opened'], 1)
+        self.assertEqual(counters['breaker.yahoo.short_circuit'], 1)
+
+    def test_breaker_half_open_trial(self):
+        """После паузы выключатель пропускает пробный вызов и закрывается при успехе"""
+        breaker = CircuitBreaker('test_breaker', failure_threshold=1, cooldown=60)
+        breaker.record_failure()
+        self.assertFalse(breaker.allow())
+
+        with mock.patch('apps.stocks.circuit_breaker.time.monotonic', return_value=time.monotonic() + 61):
+            self.assertEqual(breaker.state, 'half_open')
+            self.assertTrue(breaker.allow())
+            self.assertFalse(breaker.allow())
+            breaker.record_success()
+        self.assertEqual(breaker.state, 'closed')
+
+
+class ReplayProviderTest(TestCase):
+    """Тесты записи и воспроизведения ответов провайдера"""
+
+    def setUp(self):
+        cache.clear()
+        StockPriceService._local_cache.clear()
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self.fixture = str(Path(tmp_dir.name) / 'market_data.json')
+
+    @mock.patch('apps.stocks.providers.yahoo.yf.download')
+    @mock.patch('apps.stocks.providers.yahoo.yf.Ticker')
+    def test_recorded_responses_are_replayed(self, ticker, download):
+        """Записанные ответы воспроизводятся без обращения к сети"""
+        ticker.return_value.info = INFO
+        download.return_value = make_download_frame({'AAPL': (100.0, 110.0), 'MSFT': (200.0, 190.0)})
+        call_command('record_market_data', 'aapl', 'MSFT', fixture=self.fixture, stdout=mock.Mock())
+        ticker.reset_mock()
+        download.reset_mock()
+
+        with self.settings(MARKET_DATA_BACKEND='replay', MARKET_DATA_FIXTURE=self.fixture):
+            quotes = StockPriceService.get_stock_quotes(['AAPL', 'MSFT'])
+            overview = StockPriceService.get_company_overview('AAPL')
+
+        self.assertEqual(quotes['AAPL']['price'], Decimal('110.0'))
+        self.assertEqual(quotes['MSFT']['change'], Decimal('-10.0'))
+        self.assertEqual(quotes['MSFT']['latest_trading_day'], '2025-06-19')
+        self.assertEqual(overview['name'], 'Apple Inc.')
+        ticker.assert_not_called()
+        download.assert_not_called()
+
+    def test_replay_latency_and_unknown_symbols(self):
+        """Воспроизведение ждёт заданную задержку, незаписанные тикеры неизвестны"""
+        Path(self.fixture).write_text('{"info": {"AAPL": {"regularMarketPrice": 110.0}}}')
+        with self.settings(MARKET_DATA_BACKEND='replay', MARKET_DATA_FIXTURE=self.fixture,
+                           MARKET_DATA_REPLAY_LATENCY=0.25):
+            with mock.patch('apps.stocks.providers.replay.time.sleep') as sleep:
+                self.assertEqual(StockPriceService.get_stock_price('AAPL'), Decimal('110.0'))
+                self.assertIsNone(StockPriceService.get_stock_price('NOPE'))
+        sleep.assert_called_with(0.25)
+        self.assertEqual(sleep.call_count, 2)
+
+
+SIMULATOR = {'SEED': 7, 'TICKERS': 50, 'TICK_SECONDS': 1.0, 'VOLATILITY': 0.3}
+
+
+class SimulatorProviderTest(TestCase):
+    """Тесты синтетического рынка"""
+
+    def setUp(self):
+        cache.clear()
+        StockPriceService._local_cache.clear()
+
+    def make_simulator(self, seed=7, **options):
+        clock = mock.Mock(return_value=0.0)
+        return SimulatorProvider(seed=seed, clock=clock, **options), clock
+
+    def test_same_seed_same_prices(self):
+        """Одинаковое зерно и время дают одинаковые цены, разное зерно - разные"""
+        first, first_clock = self.make_simulator()
+        second, second_clock = self.make_simulator()
+        other, _ = self.make_simulator(seed=8)
+
+        first_clock.return_value = second_clock.return_value = 120.0
+        self.assertEqual(first.get_info('SIM0001'), dict(second.get_info('SIM0001'), regularMarketTime=mock.ANY))
+        self.assertEqual(first.get_daily_bars(['AAPL']), second.get_daily_bars(['AAPL']))
+        self.assertNotEqual(first.get_info('SIM0001')['regularMarketPrice'], other.get_info('SIM0001')['regularMarketPrice'])
+
+    def test_prices_move_with_ticks(self):
+        """Цена меняется с каждым тиком, дневной диапазон её включает"""
+        simulator, clock = self.make_simulator(tick_seconds=0.5)
+        start = simulator.get_info('AAPL')['regularMarketPrice']
+        clock.return_value = 10.0
+        info = simulator.get_info('AAPL')
+
+        self.assertEqual(start, 175.5)
+        self.assertNotEqual(info['regularMarketPrice'], start)
+        self.assertLessEqual(info['regularMarketDayLow'], info['regularMarketPrice'])
+        self.assertGreaterEqual(info['regularMarketDayHigh'], info['regularMarketPrice'])
+        self.assertEqual(info['regularMarketPreviousClose'], start)
+
+    def test_universe_size(self):
+        """Вселенная тикеров имеет заданный размер"""
+        simulator, _ = self.make_simulator(tickers=1000)
+        symbols = simulator.symbols()
+        self.assertEqual(len(symbols), 1000)
+        self.assertEqual(len(set(symbols)), 1000)
+
+    @override_settings(MARKET_DATA_BACKEND='simulator', MARKET_DATA_SIMULATOR=SIMULATOR)
+    def test_service_uses_simulator(self):
+        """Сервис котировок работает поверх симулятора"""
+        quotes = StockPriceService.get_stock_quotes(['SIM0001', 'SIM0002', 'AAPL'])
+        overview = StockPriceService.get_company_overview('SIM0003')
+
+        self.assertTrue(all(quote['price'] > 0 for quote in quotes.values()))
+        self.assertEqual(overview['name'], 'SIM0003 Simulated Inc.')
+
+
+class BatchFetcherTest(TestCase):
+    """Тесты параллельной пакетной загрузки цен"""
+
+    def setUp(self):
+        cache.clear()
+        StockPriceService._local_cache.clear()
+        StockPriceService.breaker.reset()
+
+    @override_settings(MARKET_DATA_BACKEND='simulator', MARKET_DATA_SIMULATOR=SIMULATOR)
+    def test_fetches_all_tickers_in_batches(self):
+        """Все тикеры загружаются пакетами заданного размера"""
+        symbols = [f'SIM{index:04d}' for index in range(25)]
+        progress = []
+        with mock.patch('apps.stocks.services.StockPriceService._fetch_bulk_quotes',
+                        wraps=StockPriceService._fetch_bulk_quotes) as fetch:
+            result = BatchFetcher(batch_size=10, concurrency=3).fetch(symbols, progress=lambda *args: progress.append(args))
+
+        self.assertEqual(result.fetched, 25)
+        self.assertEqual(result.batches, 3)
+        self.assertEqual(sorted(len(call.args[0]) for call in fetch.call_args_list), [5, 10, 10])
+        self.assertEqual(progress[-1], (25, 25))
+        self.assertGreater(result.throughput, 0)
+
+    @mock.patch('apps.stocks.fetcher.time.sleep')
+    @mock.patch('apps.stocks.providers.yahoo.yf.download')
+    def test_retries_failed_batch_with_backoff(self, download, sleep):
+        """Неудачный запрос повторяется после паузы с джиттером"""
+        download.side_effect = [Exception('timeout'), make_download_frame({'AAPL': (100.0, 110.0)})]
+
+        result = BatchFetcher(retries=2, retry_backoff=1.0).fetch(['AAPL'])
+
+        self.assertEqual(result.prices, {'AAPL': Decimal('110.0')})
+        self.assertEqual(result.retries, 1)
+        self.assertEqual(download.call_count, 2)
+        delay = sleep.call_args[0][0]
+        self.assertTrue(1.0 <= delay <= 2.0)
+
+    @mock.patch('apps.stocks.fetcher.time.sleep')
+    @mock.patch('apps.stocks.providers.yahoo.yf.download')
+    def test_unknown_tickers_are_not_retried(self, download, sleep):
+        """Тикеры без данных не повторяются"""
+        download.return_value = make_download_frame({'AAPL': (100.0, 110.0)})
+
+        result = BatchFetcher(retries=2).fetch(['AAPL', 'BAD'])
+
+        self.assertEqual(result.failed, ['BAD'])
+        download.assert_called_once()
+        sleep.assert_not_called()
+
+
+class RateLimitTest(TestCase):
+    """Тесты общего ограничителя частоты запросов к провайдеру"""
+
+    def setUp(self):
+        cache.clear()
+        StockPriceService._local_cache.clear()
+        metrics.reset()
+
+    def test_burst_then_refill(self):
+        """После исчерпания запаса токенов вызов ждёт пополнения"""
+        bucket = TokenBucket('test', rate=10, burst=2, max_wait={'interactive': 1.0})
+        self.assertEqual(bucket.acquire(), 0)
+        self.assertEqual(bucket.acquire(), 0)
+
+        with mock.patch('apps.stocks.rate_limit.time.sleep') as sleep:
+            sleep.side_effect = lambda seconds: cache.set('ratelimit_test', dict(
+                cache.get('ratelimit_test'), updated=time.time() - seconds,
+            ))
+            bucket.acquire()
+        self.assertAlmostEqual(sleep.call_args[0][0], 0.1, delta=0.01)
+        self.assertEqual(metrics.snapshot()['ratelimit.interactive.acquired'], 3)
+
+    def test_batch_leaves_reserve_for_interactive(self):
+        """Пакетные задачи не забирают токены, зарезервированные для страниц"""
+        bucket = TokenBucket('test', rate=1, burst=3, reserve=2, max_wait={'interactive': 0, 'batch': 0})
+        with rate_limit.priority(rate_limit.BATCH):
+            bucket.acquire()
+            with self.assertRaises(RateLimited):
+                bucket.acquire()
+        bucket.acquire()
+        bucket.acquire()
+        self.assertEqual(metrics.snapshot()['ratelimit.batch.rejected'], 1)
+
+    @override_settings(MARKET_DATA_RATE_LIMIT=dict(
+        settings.MARKET_DATA_RATE_LIMIT, BURST=1, MAX_WAIT={'interactive': 0, 'batch': 0},
+    ))
+    @mock.patch('apps.stocks.providers.yahoo.yf.Ticker')
+    def test_rate_limited_call_falls_back(self, ticker):
+        """Без токена запрос к провайдеру не выполняется, выключатель не срабатывает"""
+        StockPriceService.breaker.reset()
+        ticker.return_value.info = INFO
+        self.assertEqual(StockPriceService.get_stock_price('AAPL'), Decimal('110.0'))
+
+        self.assertIsNone(StockPriceService.get_stock_price('MSFT'))
+        ticker.assert_called_once_with('AAPL')
+        self.assertEqual(StockPriceService.breaker.state, 'closed')
+
+
+class PriceRefresherTest(TestCase):
+    """Тесты обновления сохраненных цен тикеров"""
+
+    def setUp(self):
+        cache.clear()
+        StockPriceService._local_cache.clear()
+        StockPriceService.breaker.reset()
+        user = get_user_model().objects.create_user(email='test@example.com', password='testpass123')
+        self.portfolio = Portfolio.objects.create(user=user, name='Test')
+        self.other = Portfolio.objects.create(user=user, name='Other')
+        for portfolio, ticker in [(self.portfolio, 'AAPL'), (self.portfolio, 'AAPL'), (self.portfolio, 'MSFT'),
+                                  (self.other, 'MSFT')]:
+            Stock.objects.create(portfolio=portfolio, ticker=ticker, company_name=ticker, quantity=1,
+                                 purchase_price=Decimal('50.00'))
+        PriceQuote.objects.create(ticker='MSFT', price=Decimal('300.00'), previous_close=Decimal('290.00'),
+                                  as_of=timezone.now())
+        self.now = mock.patch('django.utils.timezone.now', return_value=new_york(2026, 10, 16, 12, 0))
+        self.now.start()
+        self.addCleanup(self.now.stop)
+
+    def prices(self):
+        return dict(PriceQuote.objects.values_list('ticker', 'price'))
+
+    @mock.patch('apps.stocks.providers.yahoo.yf.download')
+    def test_writes_one_row_per_changed_ticker(self, download):
+        """Записывается одна строка на тикер и только при изменении цены"""
+        download.return_value = make_download_frame({'AAPL': (100.0, 110.0), 'MSFT': (290.0, 300.0)})
+        version = SummaryCache.version(self.other.id)
+
+        with CaptureQueriesContext(connection) as queries:
+            result = PriceRefresher().refresh()
+
+        self.assertEqual(result.tickers, 2)
+        self.assertEqual(result.changed_tickers, ['AAPL'])
+        self.assertEqual(result.portfolios, {self.portfolio.id})
+        self.assertEqual(set(result.timings), {'collect', 'fetch', 'write'})
+        self.assertEqual(SummaryCache.version(self.other.id), version)
+        self.assertEqual(self.prices(), {'AAPL': Decimal('110.00'), 'MSFT': Decimal('300.00')})
+        quote = PriceQuote.objects.get(ticker='AAPL')
+        self.assertEqual(quote.previous_close, Decimal('100.00'))
+        writes = [q['sql'] for q in queries if q['sql'].split()[0].upper() in ('INSERT', 'UPDATE')]
+        self.assertEqual(len(writes), 1)
+        self.assertEqual([stock.current_price for stock in Stock.objects.filter(ticker='AAPL')],
+                         [Decimal('110.00')] * 2)
+
+    @mock.patch.object(StockPriceService, 'get_company_overviews', return_value={})
+    @mock.patch('apps.stocks.providers.yahoo.yf.download')
+    def test_portfolio_refresh_stores_prices(self, download, overviews):
+        """Кнопка обновления цен портфеля сохраняет новые цены, и стоимость считается по ним"""
+        PositionLedger.rebuild(self.portfolio)
+        self.client.force_login(self.portfolio.user)
+        url = reverse('portfolios:portfolio_detail', args=[self.portfolio.id])
+        self.client.get(url)
+        download.return_value = make_download_frame({'AAPL': (100.0, 110.0), 'MSFT': (300.0, 320.0)})
+
+        response = self.client.get(url, {'refresh': 'true'})
+
+        self.assertEqual(self.prices(), {'AAPL': Decimal('110.00'), 'MSFT': Decimal('320.00')})
+        self.assertEqual(response.context['current_value'], Decimal('540.00'))
+        aapl = next(item for item in response.context['summary'] if item['ticker'] == 'AAPL')
+        self.assertEqual(aapl['quote_info']['price'], Decimal('110.0'))
+
+    @mock.patch('apps.stocks.providers.yahoo.yf.download')
+    def test_dry_run_changes_nothing(self, download):
+        """Пробный запуск не обращается к провайдеру и не меняет кэш, цены и версии сводок"""
+        download.return_value = make_download_frame({'AAPL': (100.0, 120.0)})
+        StockPriceService.get_stock_quotes(['AAPL'])
+        download.reset_mock()
+        version = SummaryCache.version(self.portfolio.id)
+
+        result = PriceRefresher().refresh(dry_run=True)
+        self.assertEqual(result.due, ['MSFT'])
+        self.assertIsNone(result.fetch)
+        self.assertEqual(result.changed_tickers, ['AAPL'])
+        self.assertEqual(result.portfolios, {self.portfolio.id})
+
+        result = PriceRefresher().refresh(dry_run=True, force=True)
+        self.assertEqual(result.due, ['AAPL', 'MSFT'])
+        download.assert_not_called()
+        self.assertEqual(cache.get('stock_quote_AAPL')['price'], Decimal('120.0'))
+        self.assertEqual(self.prices(), {'MSFT': Decimal('300.00')})
+        self.assertEqual(SummaryCache.version(self.portfolio.id), version)
+
+    @mock.patch('apps.stocks.providers.yahoo.yf.download')
+    def test_stale_only_skips_current_tickers(self, download):
+        """С stale_only тикеры с актуальной ценой в кеше не обрабатываются"""
+        download.return_value = make_download_frame({'AAPL': (100.0, 120.0)})
+        StockPriceService.get_stock_prices(['AAPL'])
+        download.return_value = make_download_frame({'MSFT': (290.0, 310.0)})
+
+        result = PriceRefresher().refresh(stale_only=True)
+
+        self.assertEqual(result.tickers, 2)
+        self.assertEqual(list(result.prices), ['MSFT'])
+        self.assertEqual(self.prices(), {'MSFT': Decimal('310.00')})
+
+    @mock.patch('apps.stocks.providers.yahoo.yf.download')
+    def test_commands_share_refresh(self, download):
+        """Обе команды обновления цен выполняют одно и то же обновление"""
+        download.return_value = make_download_frame({'AAPL': (100.0, 120.0)})
+        stdout = StringIO()
+
+        call_command('update_prices', ticker=['aapl'], dry_run=True, stdout=stdout)
+        self.assertNotIn('AAPL', self.prices())
+        self.assertIn('Would fetch 1 tickers', stdout.getvalue())
+        download.assert_not_called()
+
+        call_command('update_stock_prices', ticker=['AAPL'], stdout=stdout)
+        self.assertEqual(self.prices()['AAPL'], Decimal('120.00'))
+        self.assertRegex(stdout.getvalue(), r'Fetched 1/1 in [\d.]+s \([\d.]+ tickers/s, 1 batches, 0 retries')
+        download.assert_called_once()
+
+
+class FakeHistoryProvider:
+    """Провайдер истории, запоминающий запросы; бары по будням с first_dates[символ] по last_dates[символ]"""
+
+    def __init__(self, first_dates=None, fail=()):
+        self.first_dates = first_dates or {}
+        self.last_dates = {}
+        self.fail = set(fail)
+        self.calls = []
+
+    def get_history(self, symbols, start, end):
+        self.calls.append((sorted(symbols), start, end))
+        if self.fail & set(symbols):
+            raise Exception('timeout')
+        bars = {}
+        for symbol in symbols:
+            day = max(start, self.first_dates.get(symbol, start))
+            while day <= min(end, self.last_dates.get(symbol, end)):
+                if day.weekday() < 5:
+                    bars.setdefault(symbol, []).append({
+                        'date': day.isoformat(), 'open': 10.0, 'high': 11.0, 'low': 9.0,
+                        'close': 10.5, 'volume': 1000.0,
+                    })
+                day += timedelta(days=1)
+        return bars
+
+
+class HistoryBackfillTest(TestCase):
+    """Тесты пополнения истории дневных баров"""
+
+    START = date(2026, 10, 5)
+    END = date(2026, 10, 16)
+    LAST_SESSION = date(2026, 10, 20)
+
+    def setUp(self):
+        cache.clear()
+        StockPriceService.breaker.reset()
+        self.provider = FakeHistoryProvider()
+        for patcher in (
+            mock.patch('apps.stocks.history.get_provider', return_value=self.provider),
+            mock.patch.object(HistoryBackfill, 'last_session', return_value=self.LAST_SESSION),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_requests_only_missing_runs(self):
+        """Запрашиваются только недостающие отрезки, тикеры с одинаковым отрезком — одним запросом"""
+        HistoryBackfill.store({'AAPL': [
+            {'date': '2026-10-08', 'close': 1.0}, {'date': '2026-10-09', 'close': 1.0},
+        ]})
+
+        gaps = HistoryBackfill().gaps(['AAPL', 'MSFT', 'TSLA'], self.START, self.END)
+
+        self.assertEqual(gaps, {
+            (date(2026, 10, 5), date(2026, 10, 7)): ['AAPL'],
+            (date(2026, 10, 12), date(2026, 10, 16)): ['AAPL'],
+            (self.START, self.END): ['MSFT', 'TSLA'],
+        })
+        result = HistoryBackfill().backfill(['AAPL', 'MSFT', 'TSLA'], self.START, self.END)
+        self.assertEqual(result.requests, 3)
+        self.assertEqual(DailyBar.objects.count(), 30)
+        self.assertIn((['MSFT', 'TSLA'], self.START, self.END), self.provider.calls)
+
+    def test_backfill_is_incremental_and_idempotent(self):
+        """Повторный запуск ничего не запрашивает, продление диапазона запрашивает только новые дни"""
+        HistoryBackfill().backfill(['aapl', 'MSFT'], self.START, self.END)
+        result = HistoryBackfill().backfill(['AAPL', 'MSFT'], self.START, self.END)
+        self.assertEqual(result.requests, 0)
+
+        result = HistoryBackfill().backfill(['AAPL', 'MSFT'], self.START, date(2026, 10, 20))
+        self.assertEqual(self.provider.calls[-1], (['AAPL', 'MSFT'], date(2026, 10, 19), date(2026, 10, 20)))
+        self.assertEqual(result.bars, 4)
+        self.assertEqual(DailyBar.objects.filter(ticker='AAPL').count(), 12)
+        self.assertEqual(
+            HistoryCoverage.objects.values_list('start', 'end').get(ticker='AAPL'),
+            (self.START, date(2026, 10, 20)),
+        )
+
+    def test_days_without_data_are_not_requested_again(self):
+        """Дни до начала торгов тикера не запрашиваются повторно"""
+        self.provider.first_dates = {'NEW': date(2026, 10, 14)}
+        HistoryBackfill().backfill(['NEW'], self.START, self.END)
+        self.assertEqual(DailyBar.objects.filter(ticker='NEW').count(), 3)
+
+        result = HistoryBackfill().backfill(['NEW'], self.START, self.END)
+        self.assertEqual(result.requests, 0)
+
+    def test_missing_last_close_is_requested_again(self):
+        """Дни после последнего полученного бара не считаются загруженными, будущие дни не запрашиваются"""
+        self.provider.last_dates = {'AAPL': date(2026, 10, 15)}
+        HistoryBackfill().backfill(['AAPL'], self.START, self.END)
+        self.assertEqual(
+            HistoryCoverage.objects.values_list('start', 'end').get(ticker='AAPL'),
+            (self.START, date(2026, 10, 15)),
+        )
+
+        self.provider.last_dates = {}
+        result = HistoryBackfill().backfill(['AAPL'], self.START, date(2026, 10, 30))
+        self.assertEqual(self.provider.calls[-1], (['AAPL'], self.END, self.LAST_SESSION))
+        self.assertEqual(result.bars, 3)
+        self.assertEqual(
+            HistoryCoverage.objects.values_list('start', 'end').get(ticker='AAPL'),
+            (self.START, self.LAST_SESSION),
+        )
+
+    def test_interrupted_backfill_resumes(self):
+        """После сбоя повторный запуск догружает только неудавшиеся тикеры"""
+        self.provider.fail = {'MSFT'}
+        result = HistoryBackfill(batch_size=1).backfill(['AAPL', 'MSFT'], self.START, self.END)
+        self.assertEqual(result.failed, ['MSFT'])
+        self.assertEqual(DailyBar.objects.filter(ticker='AAPL').count(), 10)
+
+        self.provider.fail = set()
+        result = HistoryBackfill(batch_size=1).backfill(['AAPL', 'MSFT'], self.START, self.END)
+        self.assertEqual(self.provider.calls[-1], (['MSFT'], self.START, self.END))
+        self.assertEqual(result.requests, 1)
+        self.assertEqual(DailyBar.objects.count(), 20)
+
+    def test_history_endpoint_reads_store(self):
+        """API истории отдает сохраненные бары без обращения к провайдеру"""
+        HistoryBackfill().backfill(['AAPL'], self.START, self.END)
+        user = get_user_model().objects.create_user(email='test@example.com', password='testpass123')
+        self.client.force_login(user)
+
+        with mock.patch.object(HistoryBackfill, 'last_session', return_value=self.END):
+            response = self.client.get(reverse('stocks:stock_history', args=['aapl']), {'days': 7})
+
+        bars = response.json()['bars']
+        self.assertEqual([bar['date'] for bar in bars][:2], ['2026-10-09', '2026-10-12'])
+        self.assertEqual(len(bars), 6)
+        self.assertEqual(bars[0]['close'], 10.5)
+        self.assertEqual(len(self.provider.calls), 1)
+
+
+@override_settings(MARKET_DATA_BACKEND='simulator', MARKET_DATA_SIMULATOR=SIMULATOR)
+class SimulatorHistoryTest(TestCase):
+    """Тесты истории симулятора"""
+
+    ANCHOR = date(2026, 9, 10)
+
+    def test_history_is_reproducible(self):
+        """История за любой период воспроизводима и не зависит от порядка запросов"""
+        start, end = self.ANCHOR - timedelta(days=60), self.ANCHOR - timedelta(days=1)
+        first = SimulatorProvider(seed=7, anchor=self.ANCHOR).get_history(['AAPL'], start, end)['AAPL']
+        provider = SimulatorProvider(seed=7, anchor=self.ANCHOR)
+        provider.get_history(['AAPL'], end - timedelta(days=10), end)
+        self.assertEqual(provider.get_history(['AAPL'], start, end)['AAPL'], first)
+        self.assertTrue(all(start.isoformat() <= bar['date'] <= end.isoformat() for bar in first))
+        self.assertEqual([bar['date'] for bar in first],
+                         [day.isoformat() for day in get_market_calendar().trading_days(start, end)])
+
+    def test_history_follows_market_calendar(self):
+        """Бары симулятора приходятся только на торговые дни календаря, текущий бар - на опорную дату"""
+        provider = SimulatorProvider(seed=7, anchor=date(2026, 9, 12), history_days=3)
+        self.assertEqual(provider.anchor, date(2026, 9, 11))
+        bars = provider.get_daily_bars(['AAPL'])['AAPL']
+        # Labor Day, 2026-09-07, is a holiday
+        self.assertEqual([bar['date'] for bar in bars], ['2026-09-08', '2026-09-09', '2026-09-10', '2026-09-11'])
+        history = provider.get_history(['AAPL'], date(2026, 8, 31), date(2026, 9, 11))['AAPL']
+        calendar = get_market_calendar()
+        self.assertEqual([bar['date'] for bar in history],
+                         [day.isoformat() for day in calendar.trading_days(date(2026, 8, 31), date(2026, 9, 11))])
+
+    def test_backfill_command(self):
+        """Команда пополнения истории сохраняет бары симулятора"""
+        call_command('backfill_history', ticker=['SIM0001'], days=30, stdout=mock.Mock())
+        self.assertGreater(DailyBar.objects.filter(ticker='SIM0001').count(), 15)
+
+
+class EodLoaderTest(TestCase):
+    """Тесты загрузки файлов цен на конец дня"""
+
+    def setUp(self):
+        cache.clear()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = Path(directory.name)
+
+    def write(self, name, text):
+        path = self.directory / name
+        if name.endswith('.gz'):
+            with gzip.open(path, 'wt', encoding='utf-8') as gz_file:
+                gz_file.write(text)
+        else:
+            path.write_text(text, encoding='utf-8')
+        return path
+
+    def test_loads_files_and_updates_quotes(self):
+        """Бары загружаются из CSV и gzip, неверные строки пропускаются, котировки берутся из последнего бара"""
+        first = self.write('day1.csv', (
+            'Symbol,Date,Open,High,Low,Close,Volume\n'
+            'aapl,2026-10-15,100,102,99,101.5,1000\n'
+            'MSFT,2026-10-15,300,305,299,304,2000\n'
+            'BAD TICKER,2026-10-15,1,1,1,1,1\n'
+            'MSFT,not-a-date,1,1,1,1,1\n'
+            'TSLA,2026-10-15,,,,,100\n'
+        ))
+        second = self.write('day2.csv.gz', (
+            'ticker,date,close,volume\n'
+            'AAPL,20261016,103.25,1500\n'
+            'AAPL,20261016,103.75,1600\n'
+        ))
+        PriceQuote.objects.create(ticker='MSFT', price=Decimal('310.00'), as_of=new_york(2026, 10, 16, 12, 0))
+
+        result = EodLoader(chunk_size=2).load([first, second])
+
+        self.assertEqual(result.rows, 7)
+        self.assertEqual(result.invalid, 3)
+        self.assertEqual(len(result.errors), 3)
+        self.assertTrue(result.errors[0].startswith('day1.csv:4:'))
+        self.assertEqual(DailyBar.objects.count(), 3)
+        bar = DailyBar.objects.get(ticker='AAPL', date=date(2026, 10, 16))
+        self.assertEqual((bar.close, bar.volume, bar.open), (Decimal('103.7500'), 1600, None))
+        quote = PriceQuote.objects.get(ticker='AAPL')
+        self.assertEqual((quote.price, quote.previous_close), (Decimal('103.75'), Decimal('101.50')))
+        self.assertEqual(quote.as_of, new_york(2026, 10, 16, 16, 0))
+        # The live MSFT quote is newer than the file
+        self.assertEqual(PriceQuote.objects.get(ticker='MSFT').price, Decimal('310.00'))
+        self.assertEqual(result.quotes, 1)
+        self.assertGreater(result.rows_per_second, 0)
+
+    def test_command_dry_run_and_missing_columns(self):
+        """Пробный запуск ничего не записывает, файл без обязательных колонок отклоняется"""
+        path = self.write('day.csv', 'ticker,date,close\nAAPL,2026-10-16,100\n')
+        out = StringIO()
+        call_command('load_eod_prices', str(path), dry_run=True, stdout=out)
+        self.assertIn('Validated 1 of 1 rows', out.getvalue())
+        self.assertFalse(DailyBar.objects.exists())
+
+        call_command('load_eod_prices', str(path), stdout=out)
+        self.assertIn('rows/s', out.getvalue())
+        self.assertEqual(DailyBar.objects.count(), 1)
+
+        with self.assertRaisesMessage(CommandError, 'missing column(s) close'):
+            call_command('load_eod_prices', str(self.write('bad.csv', 'ticker,date\nAAPL,2026-10-16\n')))
+
+    def test_bad_rows_do_not_abort_the_load(self):
+        """Цена, не помещающаяся в котировку, и строка, отвергнутая базой, отклоняются по одной"""
+        path = self.write('day.csv', (
+            'ticker,date,close\n'
+            'AAPL,2026-10-16,101\n'
+            'HUGE,2026-10-16,500000000\n'
+            'BOOM,2026-10-16,10\n'
+            'MSFT,2026-10-16,304\n'
+        ))
+        upsert = EodLoader._upsert
+
+        def refuse_boom(chunk):
+            if any(row[1] == 'BOOM' for row in chunk):
+                raise DataError('numeric field overflow')
+            upsert(chunk)
+
+        with mock.patch.object(EodLoader, '_upsert', side_effect=refuse_boom):
+            result = EodLoader().load([path])
+
+        self.assertEqual((result.rows, result.loaded, result.invalid), (4, 2, 2))
+        self.assertIn('day.csv:3: close 500000000 out of range', result.errors)
+        self.assertIn('day.csv:4: numeric field overflow', result.errors)
+        self.assertEqual(sorted(DailyBar.objects.values_list('ticker', flat=True)), ['AAPL', 'MSFT'])
+        self.assertEqual(sorted(PriceQuote.objects.values_list('ticker', flat=True)), ['AAPL', 'MSFT'])
+
+    @skipUnless(connection.vendor == 'postgresql', 'COPY and the staging table need PostgreSQL')
+    def test_postgres_copy_and_merge(self):
+        """На PostgreSQL строки копируются в промежуточную таблицу и сливаются одним запросом"""
+        DailyBar.objects.create(ticker='AAPL', date=date(2026, 10, 15), close=Decimal('99'))
+        path = self.write('day.csv', (
+            'ticker,date,open,close,volume\n'
+            'AAPL,2026-10-15,100,101.5,1000\n'
+            'AAPL,2026-10-16,102,103.25,1500\n'
+            'AAPL,2026-10-16,102,103.75,1600\n'
+            'MSFT,2026-10-16,300,304,2000\n'
+        ))
+
+        with CaptureQueriesContext(connection) as queries:
+            result = EodLoader(chunk_size=2).load([path])
+
+        self.assertEqual((result.loaded, result.invalid), (4, 0))
+        inserts = [q['sql'] for q in queries if q['sql'].startswith('INSERT INTO "stocks_dailybar"')]
+        self.assertEqual(len(inserts), 1)
+        self.assertEqual(DailyBar.objects.count(), 3)
+        self.assertEqual(DailyBar.objects.get(ticker='AAPL', date=date(2026, 10, 15)).close, Decimal('101.5000'))
+        bar = DailyBar.objects.get(ticker='AAPL', date=date(2026, 10, 16))
+        self.assertEqual((bar.open, bar.close, bar.volume), (Decimal('102.0000'), Decimal('103.7500'), 1600))
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT to_regclass('eod_staging')")
+            self.assertIsNone(cursor.fetchone()[0])
+        self.assertEqual(PriceQuote.objects.get(ticker='AAPL').price, Decimal('103.75'))
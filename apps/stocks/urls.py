@@ -7,4 +7,6 @@ urlpatterns = [
     path('search/', views.search_stocks, name='search_stocks'),
     path('info/<str:ticker>/', views.stock_info, name='stock_info'),
     path('price/<str:ticker>/', views.get_stock_price, name='get_stock_price'),
+    path('history/<str:ticker>/', views.stock_history, name='stock_history'),
+    path('metrics/', views.market_data_metrics, name='market_data_metrics'),
 ] 
\ No newline at end of file
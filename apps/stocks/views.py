@@ -1,7 +1,12 @@
+from datetime import timedelta
+from django.conf import settings
 from django.shortcuts import render
 from django.http import JsonResponse
 from django.contrib.auth.decorators import login_required
+from django.contrib.admin.views.decorators import staff_member_required
+from .history import HistoryBackfill
 from .services import StockPriceService
+from . import metrics
 
 
 @login_required
@@ -54,3 +59,40 @@ def get_stock_price(request, ticker):
             'success': False,
             'error': 'Could not fetch price'
         }, status=400)
+
+
+@login_required
+def stock_history(request, ticker):
+    """API endpoint with stored daily bars of a stock, never calls the provider"""
+    ticker = ticker.upper()
+    try:
+        days = int(request.GET.get('days', settings.STOCK_HISTORY_BACKFILL['DEFAULT_DAYS']))
+    except ValueError:
+        return JsonResponse({'ticker': ticker, 'success': False, 'error': 'days must be a number'}, status=400)
+    
+    end = HistoryBackfill.last_session()
+    bars = HistoryBackfill.bars(ticker, end - timedelta(days=days), end)
+    return JsonResponse({
+        'ticker': ticker,
+        'success': True,
+        'bars': [
+            {
+                'date': bar.date.isoformat(),
+                'open': float(bar.open) if bar.open is not None else None,
+                'high': float(bar.high) if bar.high is not None else None,
+                'low': float(bar.low) if bar.low is not None else None,
+                'close': float(bar.close),
+                'volume': bar.volume,
+            }
+            for bar in bars
+        ],
+    })
+
+
+@staff_member_required
+def market_data_metrics(request):
+    """API endpoint with process-wide market data counters"""
+    return JsonResponse({
+        'counters': metrics.snapshot(),
+        'circuit_breaker': StockPriceService.breaker.state,
+    })
@@ -60,6 +60,8 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    # Count market data provider fetches per request
+    'apps.stocks.middleware.UpstreamFetchMiddleware',
 ]
 
 ROOT_URLCONF = 'stock_market.urls'
@@ -163,16 +165,105 @@ AUTH_USER_MODEL = 'users.User'
 ALPHA_VANTAGE_API_KEY = os.getenv('ALPHA_VANTAGE_API_KEY', 'demo')
 
 # Cache configuration
-CACHES = {
-    'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
-        'LOCATION': 'unique-snowflake',
+# В production используем общий Redis, чтобы все воркеры видели один кэш котировок
+REDIS_URL = os.getenv('REDIS_URL')
+
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+            'KEY_PREFIX': 'stock_market',
+        }
+    }
+else:
+    # Локальная разработка
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'unique-snowflake',
+        }
     }
-}
 
 # Cache timeout settings (in seconds)
-STOCK_PRICE_CACHE_TIMEOUT = 300  # 5 minutes
+STOCK_PRICE_CACHE_TIMEOUT = 300  # 5 minutes, prices and quotes are refreshed after this
 COMPANY_INFO_CACHE_TIMEOUT = 3600  # 1 hour
+# Computed portfolio summaries; also dropped as soon as the portfolio or any quote changes
+PORTFOLIO_SUMMARY_CACHE_TIMEOUT = 300
+
+# Exchange hours and holidays, used for quote cache lifetimes and scheduled price updates.
+# While the market is closed quotes fetched after the last close are not refetched
+MARKET_CALENDAR = {
+    'TIMEZONE': 'America/New_York',
+    'OPEN': '09:30',
+    'CLOSE': '16:00',
+    'HOLIDAYS': [
+        # NYSE 2025
+        '2025-01-01', '2025-01-09', '2025-01-20', '2025-02-17', '2025-04-18', '2025-05-26',
+        '2025-06-19', '2025-07-04', '2025-09-01', '2025-11-27', '2025-12-25',
+        # NYSE 2026
+        '2026-01-01', '2026-01-19', '2026-02-16', '2026-04-03', '2026-05-25',
+        '2026-06-19', '2026-07-03', '2026-09-07', '2026-11-26', '2026-12-25',
+        # NYSE 2027
+        '2027-01-01', '2027-01-18', '2027-02-15', '2027-03-26', '2027-05-31',
+        '2027-06-18', '2027-07-05', '2027-09-06', '2027-11-25', '2027-12-24',
+    ],
+}
+
+# Market data source: 'yahoo' (live), 'record' (live, saving responses to MARKET_DATA_FIXTURE),
+# 'replay' (serve MARKET_DATA_FIXTURE offline with MARKET_DATA_REPLAY_LATENCY seconds per request)
+# or 'simulator' (synthetic prices for load testing, see MARKET_DATA_SIMULATOR)
+MARKET_DATA_BACKEND = os.getenv('MARKET_DATA_BACKEND', 'yahoo')
+MARKET_DATA_FIXTURE = os.getenv('MARKET_DATA_FIXTURE', str(BASE_DIR / 'fixtures' / 'market_data.json'))
+MARKET_DATA_REPLAY_LATENCY = float(os.getenv('MARKET_DATA_REPLAY_LATENCY', '0'))
+MARKET_DATA_SIMULATOR = {
+    'SEED': int(os.getenv('MARKET_SIMULATOR_SEED', '42')),
+    'TICKERS': 2000,  # size of the synthetic universe
+    'TICK_SECONDS': float(os.getenv('MARKET_SIMULATOR_TICK_SECONDS', '1')),  # one price step per tick
+    'VOLATILITY': 0.3,  # annualized
+    'DRIFT': 0.05,  # annualized
+    'HISTORY_DAYS': 5,
+    'LATENCY': float(os.getenv('MARKET_SIMULATOR_LATENCY', '0')),  # seconds per request
+}
+
+# Token bucket shared by all processes for provider requests (see apps.stocks.rate_limit)
+MARKET_DATA_RATE_LIMIT = {
+    'RATES': {  # requests per second by backend, None - no limit
+        'yahoo': 2,
+        'record': 2,
+        'replay': None,
+        'simulator': None,
+    },
+    'BURST': 10,
+    'INTERACTIVE_RESERVE': 4,  # tokens batch jobs leave for page loads
+    'MAX_WAIT': {  # seconds a call waits for a token before falling back to cached data
+        'interactive': 2.0,
+        'batch': 60.0,
+    },
+}
+
+# update_stock_prices: tickers per provider request, parallel requests and retries of failed tickers
+STOCK_PRICE_UPDATE = {
+    'BATCH_SIZE': 100,
+    'CONCURRENCY': 4,
+    'RETRIES': 2,
+    'RETRY_BACKOFF': 1.0,  # seconds before the first retry, doubles with every retry, plus jitter
+}
+
+# backfill_history: tickers per provider history request and default range in calendar days
+STOCK_HISTORY_BACKFILL = {
+    'BATCH_SIZE': 50,
+    'DEFAULT_DAYS': 365,
+}
+
+# In-process cache in front of the shared cache, per worker process.
+# Short timeouts keep workers from drifting apart after another worker refreshes a ticker
+STOCK_LOCAL_CACHE_MAX_ENTRIES = 2000
+STOCK_LOCAL_CACHE_TIMEOUTS = {
+    'price': 30,
+    'quote': 30,
+    'overview': 600,
+}
 
 # Security settings
 CSRF_TRUSTED_ORIGINS = os.getenv('CSRF_TRUSTED_ORIGINS', 'http://localhost:8000,http://127.0.0.1:8000').split(',')